@@ -0,0 +1,113 @@
+# 字节码基准测试：对比不预编译、安装时预编译、随包字节码以及 zipimport 布局的安装耗时、写入的文件数，
+# 以及安装后首次导入（冷启动）的耗时
+import os
+import sys
+import json
+import random
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_suite import run_cip
+
+MODES = {
+    "no_compile": ([], ["--no-compile"]),
+    "install_compile": ([], []),
+    "shipped_bytecode": (["--with-bytecode"], []),
+    "zipimport": ([], ["--zipimport"]),
+    "zipimport_shipped_bytecode": (["--with-bytecode"], ["--zipimport"]),
+}
+
+
+def generate_modules(root, package_name, modules, functions, seed):
+    """
+    生成一个由合法 Python 代码组成的合成包，相同参数和种子得到完全相同的内容
+    :return: 包目录，全部模块名
+    """
+    rng = random.Random(seed)
+    package_dir = Path(root) / package_name
+    package_dir.mkdir(parents=True)
+    (package_dir / "__init__.py").write_text("")
+    names = []
+    for i in range(modules):
+        lines = ["import os", "import json", ""]
+        for j in range(functions):
+            a, b = rng.randint(1, 100), rng.randint(1, 100)
+            lines += [
+                f"def func_{j}(value, items=None):",
+                f"    items = items or [{a}, {b}]",
+                f"    result = {{'name': 'func_{j}', 'total': sum(x * {a} for x in items)}}",
+                f"    if value > {b}:",
+                f"        return json.dumps(result) + os.sep",
+                f"    return [result.get(key, {a}) for key in ('name', 'total', 'missing')]",
+                "",
+            ]
+        (package_dir / f"module{i}.py").write_text("\n".join(lines))
+        names.append(f"{package_name}.module{i}")
+    return package_dir, names
+
+
+@click.command()
+@click.option("--modules", default=300, show_default=True, help="合成包中的模块数")
+@click.option("--functions", default=40, show_default=True, help="每个模块中的函数数")
+@click.option("--runs", default=10, show_default=True, help="冷启动导入的测量次数")
+@click.option("--seed", default=0, show_default=True, help="生成合成包的随机种子")
+def main(modules, functions, runs, seed):
+    """ 字节码预编译基准测试 """
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        home = workdir / "home"
+        (home / ".cip").mkdir(parents=True)
+        with open(home / ".cip" / "config.ini", "w") as f:
+            f.write("[CONFIG]\nlang = zh-CN\nweb_url = http://127.0.0.1:1\ncache_size_mb = 0\nversion = 0.0.4 beta\n")
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+        package_dir, names = generate_modules(workdir / "src", "benchpkg", modules, functions, seed)
+        import_names = ", ".join(names)
+
+        results = {}
+        for mode, (create_args, install_args) in MODES.items():
+            out = workdir / mode
+            python_dir = out / "python"
+            site_packages = python_dir / "Lib" / "site-packages"
+            site_packages.mkdir(parents=True)
+            # 目标“Python 目录”中放一个指向当前解释器的链接，cip 通过它得到目标版本
+            (python_dir / "python").symlink_to(sys.executable)
+
+            create_s, _ = run_cip(["create", "benchpkg", "1.0", str(package_dir), "--no-build-cache", *create_args], env, out)
+            install_s, _ = run_cip(["install", "-y", "-p", str(python_dir), *install_args, str(out / "benchpkg-1.0.cpack")], env, out)
+
+            # 不写回字节码，每次测量的都是安装后首次导入的情况；addsitedir 会处理 zipimport 布局的 .pth
+            import_env = dict(env, PYTHONDONTWRITEBYTECODE="1")
+            import_code = f"import site; site.addsitedir({str(site_packages)!r}); import {import_names}"
+            import_ms = []
+            for _ in range(runs):
+                stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", import_code],
+                                        env=import_env, capture_output=True, text=True, check=True).stderr
+                import_ms.append(sum(int(line.split("|")[1]) for line in stderr.splitlines()
+                                     if line.startswith("import time:") and line.rstrip().endswith(tuple(names))
+                                     and "self [us]" not in line) / 1000)
+            results[mode] = {
+                "create_ms": create_s * 1000,
+                "install_ms": install_s * 1000,
+                "cold_import_ms_p50": statistics.median(import_ms),
+                "files_written": len([path for path in site_packages.rglob("*") if path.is_file()]),
+            }
+
+    report = {
+        "python": sys.version.split()[0],
+        "modules": modules,
+        "functions_per_module": functions,
+        "results": results,
+        "cold_import_speedup": results["no_compile"]["cold_import_ms_p50"] / results["shipped_bytecode"]["cold_import_ms_p50"],
+    }
+    click.echo(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# 下载基准测试：在本地启动 server.py，对比一次性读入内存与流式下载的吞吐量和峰值内存
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def free_port():
+    """
+    获取一个空闲的本地端口
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port):
+    """
+    在 workdir 下启动 server.py（上传目录为 workdir/uploads），等待端口可用
+    """
+    code = f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r}); import server; server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("服务端启动失败")
+
+
+def peak_rss_mb():
+    """
+    当前进程的峰值常驻内存（MB）
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode, url, dest):
+    """
+    在子进程中执行一次下载，保证峰值内存互不干扰
+    """
+    import requests
+    import cip
+
+    part = Path(dest + ".part")
+    resumed_from = part.stat().st_size if part.exists() else 0
+    start = time.perf_counter()
+    if mode == "buffered":
+        # 旧实现：整个文件读入内存后再写盘
+        response = requests.get(url)
+        with open(dest, "wb") as f:
+            f.write(response.content)
+    else:
+        cip.stream_download(url, dest)
+    elapsed = time.perf_counter() - start
+    transferred = os.path.getsize(dest) - resumed_from
+    print(json.dumps({
+        "mode": mode,
+        "seconds": elapsed,
+        "transferred_mb": transferred / 1024 / 1024,
+        "throughput_mb_s": transferred / 1024 / 1024 / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+@click.command()
+@click.option("--size-mb", default=256, show_default=True, help="测试包大小（MB）")
+@click.option("--child", type=click.Choice(["buffered", "stream"]), hidden=True)
+@click.option("--url", hidden=True)
+@click.option("--dest", hidden=True)
+def main(size_mb, child, url, dest):
+    """ 下载吞吐量与峰值内存基准测试 """
+    if child:
+        run_child(child, url, dest)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        uploads = Path(workdir) / "uploads"
+        uploads.mkdir()
+        filename = "bench-1.0.cpack"
+        # 服务端启动时会把上传目录中的文件转存到块存储，原文件另外保留一份
+        source = Path(workdir) / filename
+        with open(source, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        shutil.copyfile(source, uploads / filename)
+
+        port = free_port()
+        proc = start_server(workdir, port)
+        try:
+            url = f"http://127.0.0.1:{port}/download/bench/1.0/{filename}"
+            results = []
+            for mode in ("buffered", "stream"):
+                dest = Path(workdir) / f"{mode}.cpack"
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, "--url", url, "--dest", str(dest)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                results.append(json.loads(out.strip().splitlines()[-1]))
+                dest.unlink()
+
+            # 断点续传：先写入一半的 .part 文件，再让客户端补全剩余部分
+            part = Path(workdir) / "resume.cpack.part"
+            with open(source, "rb") as src, open(part, "wb") as dst:
+                dst.write(src.read(size_mb * 1024 * 1024 // 2))
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", "stream", "--url", url,
+                 "--dest", str(Path(workdir) / "resume.cpack")],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            resumed = json.loads(out.strip().splitlines()[-1])
+            resumed["mode"] = "resume-half"
+            results.append(resumed)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    click.echo(json.dumps({"size_mb": size_mb, "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# 镜像同步基准测试：在本机启动上游服务端和一个持续同步的镜像，
+# 测量首次全量同步的耗时，以及之后每次上传到镜像可以下载之间的复制延迟和实际传输的字节数
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+import click
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_download import free_port, start_server
+from bench_suite import generate_package, run_cip
+
+
+def mirrored_versions(mirror_dir):
+    """
+    镜像索引中已有的版本
+    """
+    db_path = mirror_dir / "cip_index.db"
+    if not db_path.exists():
+        return set()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return {row[0] for row in conn.execute("SELECT version FROM packages")}
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        conn.close()
+
+
+def download_bytes(base_url):
+    """
+    上游服务端到目前为止通过下载接口发送的字节数
+    """
+    routes = requests.get(f"{base_url}/cip/metrics").json()["routes"]
+    return sum(route["bytes_sent"] for route in routes if route["route"].startswith("/download/"))
+
+
+def wait_for(mirror_dir, versions, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while not versions <= mirrored_versions(mirror_dir):
+        if time.perf_counter() > deadline:
+            raise RuntimeError("镜像同步超时")
+        time.sleep(0.01)
+
+
+@click.command()
+@click.option("--initial", default=50, show_default=True, help="镜像启动前上游已有的版本数")
+@click.option("--updates", default=10, show_default=True, help="镜像运行期间逐个上传的版本数")
+@click.option("--files", default=50, show_default=True, help="合成包中的模块数")
+@click.option("--interval", default=0.5, show_default=True, help="镜像轮询上游的间隔（秒）")
+@click.option("--seed", default=0, show_default=True, help="生成合成包的随机种子")
+def main(initial, updates, files, interval, seed):
+    """ 镜像同步基准测试 """
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        home = workdir / "home"
+        (home / ".cip").mkdir(parents=True)
+        with open(home / ".cip" / "config.ini", "w") as f:
+            f.write("[CONFIG]\nlang = zh-CN\nweb_url = http://127.0.0.1:1\ncache_size_mb = 0\nversion = 0.0.4 beta\n")
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+        package_dir, _ = generate_package(workdir / "src", "benchpkg", files, 4096, seed)
+        out = workdir / "out"
+        out.mkdir()
+        archives = []
+        for i in range(initial + updates):
+            (package_dir / f"version_{i}.py").write_text(f"VERSION = {i}\n")
+            run_cip(["create", "benchpkg", f"1.{i}", str(package_dir)], env, out)
+            archives.append((f"1.{i}", out / f"benchpkg-1.{i}.cpack"))
+
+        upstream_dir = workdir / "upstream"
+        mirror_dir = workdir / "mirror"
+        upstream_dir.mkdir()
+        mirror_dir.mkdir()
+        port = free_port()
+        upstream = start_server(upstream_dir, port)
+        base_url = f"http://127.0.0.1:{port}"
+        mirror = None
+        try:
+            def upload(version, path):
+                with open(path, "rb") as f:
+                    requests.post(f"{base_url}/cip/upload", files={"file": (path.name, f)}).raise_for_status()
+
+            for version, path in archives[:initial]:
+                upload(version, path)
+            initial_bytes = sum(path.stat().st_size for _, path in archives[:initial])
+
+            start = time.perf_counter()
+            mirror = subprocess.Popen([sys.executable, str(REPO_ROOT / "server.py"), "mirror", base_url, "--interval", str(interval)],
+                                      cwd=mirror_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            wait_for(mirror_dir, {version for version, _ in archives[:initial]})
+            initial_sync_s = time.perf_counter() - start
+            initial_transferred = download_bytes(base_url)
+
+            lags = []
+            update_bytes = 0
+            for version, path in archives[initial:]:
+                start = time.perf_counter()
+                upload(version, path)
+                wait_for(mirror_dir, {version})
+                lags.append(time.perf_counter() - start)
+                update_bytes += path.stat().st_size
+            update_transferred = download_bytes(base_url) - initial_transferred
+        finally:
+            if mirror is not None:
+                mirror.terminate()
+                mirror.wait()
+            upstream.terminate()
+            upstream.wait()
+
+    report = {
+        "initial_versions": initial,
+        "updates": updates,
+        "interval_s": interval,
+        "initial_sync_s": initial_sync_s,
+        "initial_mb": initial_bytes / 1024 / 1024,
+        "initial_transferred_mb": initial_transferred / 1024 / 1024,
+        "lag_s_p50": statistics.median(lags),
+        "lag_s_max": max(lags),
+        "update_mb": update_bytes / 1024 / 1024,
+        "update_transferred_mb": update_transferred / 1024 / 1024,
+    }
+    click.echo(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# 批量下载基准测试：通过一个模拟网络延迟的本地代理，对比逐个新建连接顺序下载与共享连接池并发下载
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+import concurrent.futures
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_download import free_port, start_server
+
+
+class LatencyProxy:
+    """
+    简单的 TCP 代理：新连接先等待 handshake_rtts 个往返（模拟 TCP/TLS 握手），
+    之后客户端发出的每个数据块再延迟一个往返（模拟请求的 RTT）
+    """
+
+    def __init__(self, upstream_port, rtt, handshake_rtts):
+        self.upstream_port = upstream_port
+        self.rtt = rtt
+        self.handshake_rtts = handshake_rtts
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _pipe(self, src, dst, delay):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if delay:
+                    time.sleep(delay)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _handle(self, client):
+        time.sleep(self.rtt * self.handshake_rtts)
+        upstream = socket.create_connection(("127.0.0.1", self.upstream_port))
+        threading.Thread(target=self._pipe, args=(client, upstream, self.rtt), daemon=True).start()
+        self._pipe(upstream, client, 0)
+
+
+def sequential_fresh(base_url, packages):
+    """
+    旧实现：逐个下载，每次调用 requests.get 都新建连接
+    """
+    import requests
+    for name, version in packages:
+        url = f"{base_url}/download/{name}/{version}/{name}-{version}.cpack"
+        with requests.get(url, stream=True) as response:
+            with open(f"{name}-{version}.cpack", "wb") as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    f.write(chunk)
+
+
+def pooled_concurrent(base_url, packages, jobs):
+    """
+    新实现：共享会话的连接池 + 线程池并发下载
+    """
+    import cip
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for status in executor.map(lambda p: cip.fetch_package(base_url, *p), packages):
+            assert status == 200, status
+
+
+@click.command()
+@click.option("--packages", "count", default=40, show_default=True, help="包数量")
+@click.option("--size-kb", default=256, show_default=True, help="每个包的大小（KB）")
+@click.option("--rtt-ms", default=50.0, show_default=True, help="模拟的往返延迟（毫秒）")
+@click.option("--handshake-rtts", default=3, show_default=True, help="建立连接消耗的往返次数（TCP + TLS）")
+@click.option("-j", "--jobs", default=8, show_default=True, help="并发下载数")
+def main(count, size_kb, rtt_ms, handshake_rtts, jobs):
+    """ 批量下载基准测试 """
+    with tempfile.TemporaryDirectory() as workdir:
+        uploads = Path(workdir) / "uploads"
+        uploads.mkdir()
+        packages = [(f"pkg{i}", "1.0") for i in range(count)]
+        for name, version in packages:
+            (uploads / f"{name}-{version}.cpack").write_bytes(os.urandom(size_kb * 1024))
+
+        port = free_port()
+        server = start_server(workdir, port)
+        proxy = LatencyProxy(port, rtt_ms / 1000, handshake_rtts)
+        base_url = f"http://127.0.0.1:{proxy.port}"
+        results = {"packages": count, "size_kb": size_kb, "rtt_ms": rtt_ms, "jobs": jobs}
+        try:
+            for mode, run in [("sequential_fresh_connections", lambda: sequential_fresh(base_url, packages)),
+                              ("pooled_concurrent", lambda: pooled_concurrent(base_url, packages, jobs))]:
+                with tempfile.TemporaryDirectory() as dest:
+                    os.chdir(dest)
+                    start = time.perf_counter()
+                    run()
+                    results[f"{mode}_s"] = time.perf_counter() - start
+                    os.chdir(workdir)
+        finally:
+            server.kill()
+    results["speedup"] = results["sequential_fresh_connections_s"] / results["pooled_concurrent_s"]
+    click.echo(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# 服务端索引基准测试：对比旧的目录扫描与 SQLite 索引的启动时间和列表接口耗时
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 旧实现：启动时扫描整个上传目录构建内存字典
+LEGACY_SCAN = """
+import os, time
+start = time.perf_counter()
+packages = {}
+for file in os.listdir('./uploads'):
+    if os.path.isfile(os.path.join('./uploads', file)):
+        package_name = file.split('-')[0]
+        packages.setdefault(package_name, [])
+        if file not in packages[package_name]:
+            packages[package_name].append(file)
+print(time.perf_counter() - start)
+"""
+
+# 新实现：导入 server 模块（含 init_db），再请求一次列表接口
+INDEXED_START = """
+import sys, time
+sys.path.insert(0, {root!r})
+import flask
+start = time.perf_counter()
+import server
+startup = time.perf_counter() - start
+client = server.app.test_client()
+start = time.perf_counter()
+response = client.get('/cip/packages')
+assert response.status_code == 200
+listing = time.perf_counter() - start
+start = time.perf_counter()
+response = client.get('/download/pkg7/1.0/pkg7-1.0.cpack')
+lookup = time.perf_counter() - start
+print(startup, listing, lookup)
+"""
+
+
+def run(code, cwd):
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    return [float(x) for x in out.split()]
+
+
+@click.command()
+@click.option("--counts", default="10000,100000", show_default=True, help="包数量，逗号分隔")
+def main(counts):
+    """ 服务端启动时间基准测试 """
+    results = []
+    for count in [int(c) for c in counts.split(",")]:
+        with tempfile.TemporaryDirectory() as workdir:
+            uploads = Path(workdir) / "uploads"
+            uploads.mkdir()
+            for i in range(count):
+                # 100 个包名，每个包若干版本
+                (uploads / f"pkg{i % 100}-{i // 100}.{i % 7}.cpack").write_bytes(b"x")
+            (uploads / "pkg7-1.0.cpack").write_bytes(b"x")
+
+            legacy = run(LEGACY_SCAN, workdir)[0]
+            first = run(INDEXED_START.format(root=str(REPO_ROOT)), workdir)
+            warm = run(INDEXED_START.format(root=str(REPO_ROOT)), workdir)
+            results.append({
+                "packages": count,
+                "legacy_scan_s": legacy,
+                "index_first_start_s": first[0],
+                "index_warm_start_s": warm[0],
+                "list_packages_s": warm[1],
+                "download_lookup_s": warm[2],
+            })
+    click.echo(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# 服务端块存储基准测试：上传同一个包的多个相近版本（每个版本只修改少量模块），
+# 对比整包保存与按块去重保存占用的磁盘空间，以及上传、完整下载和 Range 下载的耗时
+import os
+import io
+import sys
+import json
+import time
+import random
+import hashlib
+import tempfile
+import statistics
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_suite import run_cip
+from bench_bytecode import generate_modules
+
+
+def allocated_bytes(root):
+    """
+    目录中文件实际占用的磁盘空间（按块分配计算，包含小文件的浪费）
+    """
+    return sum(path.stat().st_blocks * 512 for path in Path(root).rglob("*") if path.is_file())
+
+
+@click.command()
+@click.option("--versions", default=50, show_default=True, help="上传的版本数")
+@click.option("--modules", default=300, show_default=True, help="合成包中的模块数")
+@click.option("--functions", default=10, show_default=True, help="每个模块中的函数数")
+@click.option("--changed", default=5, show_default=True, help="每个版本修改的模块数")
+@click.option("--touch-all", is_flag=True, help="每个版本都刷新全部文件的 mtime（模拟每次全新检出后构建）")
+@click.option("--seed", default=0, show_default=True, help="生成合成包的随机种子")
+def main(versions, modules, functions, changed, touch_all, seed):
+    """ 服务端块存储基准测试 """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        home = workdir / "home"
+        (home / ".cip").mkdir(parents=True)
+        with open(home / ".cip" / "config.ini", "w") as f:
+            f.write("[CONFIG]\nlang = zh-CN\nweb_url = http://127.0.0.1:1\ncache_size_mb = 0\nversion = 0.0.4 beta\n")
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+        package_dir, _ = generate_modules(workdir / "src", "benchpkg", modules, functions, seed)
+        out = workdir / "out"
+        out.mkdir()
+
+        server_dir = workdir / "server"
+        server_dir.mkdir()
+        os.chdir(server_dir)
+        import server
+        client = server.app.test_client()
+
+        archive_bytes = 0
+        upload_ms = []
+        digests = {}
+        for i in range(versions):
+            if i:
+                for index in rng.sample(range(modules), changed):
+                    with open(package_dir / f"module{index}.py", "a") as f:
+                        f.write(f"\nVERSION_{i} = {i}\n")
+                if touch_all:
+                    for path in package_dir.iterdir():
+                        os.utime(path, (time.time() + i, time.time() + i))
+            version = f"1.{i}"
+            run_cip(["create", "benchpkg", version, str(package_dir), "--no-build-cache"], env, out)
+            data = (out / f"benchpkg-{version}.cpack").read_bytes()
+            archive_bytes += len(data)
+            digests[version] = hashlib.sha256(data).hexdigest()
+            start = time.perf_counter()
+            response = client.post("/cip/upload", data={"file": (io.BytesIO(data), f"benchpkg-{version}.cpack")})
+            upload_ms.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.json
+
+        download_ms = []
+        range_ms = []
+        for version, digest in digests.items():
+            url = f"/download/benchpkg/{version}/benchpkg-{version}.cpack"
+            start = time.perf_counter()
+            response = client.get(url)
+            download_ms.append((time.perf_counter() - start) * 1000)
+            assert hashlib.sha256(response.data).hexdigest() == digest
+            start = time.perf_counter()
+            response = client.get(url, headers={"Range": f"bytes={len(response.data) // 2}-"})
+            range_ms.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 206
+
+        chunk_count = sum(1 for path in Path(server.CHUNK_FOLDER).rglob("*") if path.is_file())
+        stored_bytes = sum(path.stat().st_size for path in Path(server.CHUNK_FOLDER).rglob("*") if path.is_file())
+        allocated = allocated_bytes(server.CHUNK_FOLDER)
+        os.chdir(REPO_ROOT)
+
+    report = {
+        "versions": versions,
+        "modules": modules,
+        "changed_per_version": changed,
+        "touch_all": touch_all,
+        "archive_mb": archive_bytes / 1024 / 1024,
+        "chunk_store_mb": stored_bytes / 1024 / 1024,
+        "chunk_store_allocated_mb": allocated / 1024 / 1024,
+        "chunks": chunk_count,
+        "dedup_ratio": archive_bytes / stored_bytes,
+        "upload_ms_p50": statistics.median(upload_ms),
+        "download_ms_p50": statistics.median(download_ms),
+        "range_download_ms_p50": statistics.median(range_ms),
+    }
+    click.echo(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
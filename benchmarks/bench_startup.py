@@ -0,0 +1,89 @@
+# 启动时间基准测试：用 -X importtime 统计导入 cip 的耗时，并与预算比较，超出时以非零状态退出
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 这些模块较重，cip 导入时不应真正加载它们
+HEAVY_MODULES = ["urllib3", "charset_normalizer", "http.client", "zipfile", "bz2", "lzma"]
+
+
+def parse_importtime(stderr):
+    """
+    解析 -X importtime 的输出
+    :return: {模块名: (自身耗时 us, 累计耗时 us)}
+    """
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        result[name.strip()] = (int(self_us), int(cumulative_us))
+    return result
+
+
+@click.command()
+@click.option("--runs", default=20, show_default=True, help="运行次数")
+@click.option("--budget-ms", default=100.0, show_default=True, help="导入 cip 的累计耗时预算（毫秒，取中位数）")
+def main(runs, budget_ms):
+    """ cip 启动时间基准测试 """
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        # 预先编译字节码，模拟安装后的情况（即使设置了 PYTHONDONTWRITEBYTECODE）
+        subprocess.run([sys.executable, "-m", "py_compile", str(REPO_ROOT / "cip.py")], check=True)
+        subprocess.run([sys.executable, str(REPO_ROOT / "cip.py"), "version"], env=env, capture_output=True, check=True)
+
+        import_ms = []
+        self_times = {}
+        for _ in range(runs):
+            stderr = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r}); import cip"],
+                env=env, capture_output=True, text=True, check=True,
+            ).stderr
+            times = parse_importtime(stderr)
+            import_ms.append(times["cip"][1] / 1000)
+            for name, (self_us, _) in times.items():
+                self_times.setdefault(name, []).append(self_us)
+
+        # 解释器启动时（例如 .pth 文件）已经加载的模块不算在 cip 头上
+        check = "print(' '.join(m for m in {modules!r} if m in sys.modules))".format(modules=HEAVY_MODULES)
+        preloaded = subprocess.run(
+            [sys.executable, "-c", "import sys; " + check], env=env, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        loaded = subprocess.run(
+            [sys.executable, "-c", f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r}); import cip; " + check],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        loaded = [m for m in loaded if m not in preloaded]
+
+        version_ms = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, str(REPO_ROOT / "cip.py"), "version"], env=env, capture_output=True, check=True)
+            version_ms.append((time.perf_counter() - start) * 1000)
+
+    top = sorted(self_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:10]
+    report = {
+        "import_cip_ms_p50": statistics.median(import_ms),
+        "cip_version_wall_ms_p50": statistics.median(version_ms),
+        "budget_ms": budget_ms,
+        "heavy_modules_loaded": loaded,
+        "top_self_us": {name: statistics.median(values) for name, values in top},
+    }
+    click.echo(json.dumps(report, indent=4, ensure_ascii=False))
+
+    if report["import_cip_ms_p50"] > budget_ms or loaded:
+        click.echo(f"超出启动预算：导入耗时 {report['import_cip_ms_p50']:.1f} ms，提前加载的模块：{loaded}", err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# 包仓库基准测试：把同一个包依次安装到多个 Python 环境中，对比直接解压与从仓库硬链接的安装耗时和占用的磁盘空间
+import os
+import sys
+import json
+import tempfile
+import statistics
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_suite import run_cip
+from bench_bytecode import generate_modules
+
+
+def disk_usage(roots):
+    """
+    统计若干目录中文件实际占用的字节数，硬链接到同一 inode 的文件只算一次
+    """
+    seen = set()
+    total = 0
+    for root in roots:
+        for path in Path(root).rglob("*"):
+            stat = path.lstat()
+            if path.is_file() and (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+@click.command()
+@click.option("--modules", default=1000, show_default=True, help="合成包中的模块数")
+@click.option("--functions", default=10, show_default=True, help="每个模块中的函数数")
+@click.option("--interpreters", default=8, show_default=True, help="安装到的 Python 环境数")
+@click.option("--seed", default=0, show_default=True, help="生成合成包的随机种子")
+def main(modules, functions, interpreters, seed):
+    """ 包仓库基准测试 """
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        home = workdir / "home"
+        (home / ".cip").mkdir(parents=True)
+        with open(home / ".cip" / "config.ini", "w") as f:
+            f.write("[CONFIG]\nlang = zh-CN\nweb_url = http://127.0.0.1:1\ncache_size_mb = 0\nversion = 0.0.4 beta\n")
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+        package_dir, _ = generate_modules(workdir / "src", "benchpkg", modules, functions, seed)
+        run_cip(["create", "benchpkg", "1.0", str(package_dir)], env, workdir)
+        cpack_path = workdir / "benchpkg-1.0.cpack"
+
+        results = {}
+        for mode, args in [("extract", ["--no-store"]), ("store", [])]:
+            site_dirs = []
+            install_ms = []
+            for i in range(interpreters):
+                python_dir = workdir / mode / f"python{i}"
+                site_packages = python_dir / "Lib" / "site-packages"
+                site_packages.mkdir(parents=True)
+                # 每个环境都指向当前解释器，字节码的 cache_tag 相同
+                (python_dir / "python").symlink_to(sys.executable)
+                elapsed, _ = run_cip(["install", "-y", "-p", str(python_dir), *args, str(cpack_path)], env, workdir)
+                install_ms.append(elapsed * 1000)
+                site_dirs.append(site_packages)
+            results[mode] = {
+                "first_install_ms": install_ms[0],
+                "later_install_ms_p50": statistics.median(install_ms[1:]) if interpreters > 1 else None,
+                "disk_mb": disk_usage(site_dirs + ([home / ".cip" / "store"] if mode == "store" else [])) / 1024 / 1024,
+            }
+
+    report = {"modules": modules, "interpreters": interpreters, "results": results}
+    click.echo(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# 端到端基准测试套件：生成可复现的合成包，在本机启动服务端，逐个计时 create/install/upload/download/list 命令，
+# 输出吞吐量、p50/p99 延迟和峰值内存（JSON），便于在不同提交之间对比。全程只访问 127.0.0.1，可离线运行。
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+import click
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from bench_download import free_port, start_server
+
+# 生成源码文件用的词表，内容接近真实的 Python 代码，压缩率也接近
+WORDS = ["def", "return", "self", "import", "class", "for", "in", "if", "else", "None", "True", "value",
+         "data", "path", "name", "result", "config", "items", "append", "len", "range", "(", ")", ":", "=", "."]
+
+
+def generate_package(root, package_name, files, file_size, seed):
+    """
+    生成一个合成的 Python 包，相同参数和种子得到完全相同的内容
+    :return: 包目录，总字节数
+    """
+    rng = random.Random(seed)
+    package_dir = Path(root) / package_name
+    package_dir.mkdir(parents=True)
+    (package_dir / "__init__.py").write_text("")
+    total = 0
+    for i in range(files):
+        # 分散到若干子包中，模拟真实的目录结构
+        sub_dir = package_dir / f"sub{i % 8}"
+        if not sub_dir.exists():
+            sub_dir.mkdir()
+            (sub_dir / "__init__.py").write_text("")
+        lines = []
+        size = 0
+        while size < file_size:
+            line = "    " + " ".join(rng.choices(WORDS, k=rng.randint(4, 12))) + "\n"
+            lines.append(line)
+            size += len(line)
+        content = "".join(lines)
+        (sub_dir / f"module{i}.py").write_text(content)
+        total += len(content)
+    return package_dir, total
+
+
+def percentile(values, pct):
+    """
+    最近秩法计算百分位数
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_cip(args, env, cwd, stdin=""):
+    """
+    以子进程运行一次 cip 命令
+    :return: (耗时秒数, 子进程峰值内存 MB)
+    """
+    with tempfile.TemporaryFile() as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, str(REPO_ROOT / "cip.py"), *args], cwd=cwd, env=env,
+                                stdin=subprocess.PIPE, stdout=log, stderr=subprocess.STDOUT)
+        proc.stdin.write(stdin.encode())
+        proc.stdin.close()
+        # wait4 可以拿到这一个子进程自己的资源占用
+        _, status, rusage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            log.seek(0)
+            raise RuntimeError(f"cip {' '.join(args)} 失败:\n{log.read().decode(errors='replace')}")
+    # Linux 上 ru_maxrss 的单位是 KB
+    return elapsed, rusage.ru_maxrss / 1024
+
+
+def summarize(samples, work, unit):
+    """
+    汇总一组计时结果
+    :param samples: [(耗时, 峰值内存)]
+    :param work: 每次运行处理的工作量
+    :param unit: 工作量单位（MB 或 items）
+    """
+    times = [elapsed for elapsed, _ in samples]
+    p50 = percentile(times, 50)
+    return {
+        "iterations": len(samples),
+        "p50_ms": p50 * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "min_ms": min(times) * 1000,
+        "max_ms": max(times) * 1000,
+        f"throughput_{unit}_per_s": work / p50,
+        "peak_rss_mb": max(rss for _, rss in samples),
+    }
+
+
+def start_thread_server(workdir, port):
+    """
+    在当前进程的后台线程中运行 server.py 的 Flask 应用
+    """
+    from werkzeug.serving import make_server
+    os.chdir(workdir)
+    import server
+    httpd = make_server("127.0.0.1", port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--files", default=200, show_default=True, help="合成包中的模块数")
+@click.option("--file-size-kb", default=16, show_default=True, help="每个模块的大小（KB）")
+@click.option("--index-packages", default=1000, show_default=True, help="服务端索引中预置的包数量（用于 list）")
+@click.option("--iterations", default=10, show_default=True, help="每个命令的运行次数")
+@click.option("--server", "server_mode", type=click.Choice(["process", "thread"]), default="process", show_default=True,
+              help="服务端运行方式：独立进程，或在基准测试进程的线程中运行")
+@click.option("--seed", default=0, show_default=True, help="生成合成包的随机种子")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None, help="结果写入文件，默认输出到终端")
+def main(files, file_size_kb, index_packages, iterations, server_mode, seed, output):
+    """ cip 端到端基准测试套件 """
+    import cip
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        home = workdir / "home"
+        (home / ".cip").mkdir(parents=True)
+        src = workdir / "src"
+        out = workdir / "out"
+        python_dir = workdir / "python"
+        site_packages = python_dir / "Lib" / "site-packages"
+        server_dir = workdir / "server"
+        for path in (src, out, site_packages, server_dir / "uploads"):
+            path.mkdir(parents=True)
+
+        package_dir, source_bytes = generate_package(src, "benchpkg", files, file_size_kb * 1024, seed)
+        for i in range(index_packages):
+            (server_dir / "uploads" / f"seed{i % 50}-{i // 50}.0.cpack").write_bytes(b"x")
+
+        port = free_port()
+        if server_mode == "thread":
+            httpd = start_thread_server(server_dir, port)
+        else:
+            proc = start_server(server_dir, port)
+
+        # 独立的 HOME：不读写用户自己的配置，关闭本地缓存，保证每次下载都走网络
+        with open(home / ".cip" / "config.ini", "w") as f:
+            f.write(f"[CONFIG]\nlang = zh-CN\nweb_url = http://127.0.0.1:{port}\n"
+                    f"cache_size_mb = 0\nversion = {cip.CIP_VERSION}\n")
+        env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+
+        results = {}
+        try:
+            source_mb = source_bytes / 1024 / 1024
+            samples = [run_cip(["create", "benchpkg", f"1.{i}", str(package_dir)], env, out) for i in range(iterations)]
+            results["create"] = summarize(samples, source_mb, "mb")
+            cpack_paths = [out / f"benchpkg-1.{i}.cpack" for i in range(iterations)]
+            cpack_mb = cpack_paths[0].stat().st_size / 1024 / 1024
+
+            samples = [run_cip(["install", "-y", "-p", str(python_dir), str(cpack_path)], env, out) for cpack_path in cpack_paths]
+            results["install"] = summarize(samples, source_mb, "mb")
+
+            samples = [run_cip(["upload", str(cpack_path)], env, out) for cpack_path in cpack_paths]
+            results["upload"] = summarize(samples, cpack_mb, "mb")
+
+            samples = []
+            for i in range(iterations):
+                (out / f"benchpkg-1.{i}.cpack").unlink()
+                samples.append(run_cip(["download", f"benchpkg==1.{i}"], env, out, stdin="n\n"))
+            results["download"] = summarize(samples, cpack_mb, "mb")
+
+            samples = [run_cip(["list"], env, out) for _ in range(iterations)]
+            results["list"] = summarize(samples, index_packages + iterations, "items")
+
+            # 不含任何 I/O 的命令，作为启动开销的基线
+            samples = [run_cip(["version"], env, out) for _ in range(iterations)]
+            results["version"] = summarize(samples, 1, "runs")
+        finally:
+            if server_mode == "thread":
+                httpd.shutdown()
+                os.chdir(REPO_ROOT)
+            else:
+                proc.terminate()
+                proc.wait()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "files": files,
+            "file_size_kb": file_size_kb,
+            "index_packages": index_packages,
+            "iterations": iterations,
+            "server": server_mode,
+            "seed": seed,
+            "source_mb": source_mb,
+            "cpack_mb": cpack_mb,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=4)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    click.echo(text)
+
+
+if __name__ == "__main__":
+    main()
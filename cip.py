@@ -1,15 +1,59 @@
 # 客户端代码
-import zipfile
 import json
 import shutil
 import click
 import sys
 from pathlib import Path
 import os                   
-import configparser
-import subprocess
-import requests
-import certifi
+import hashlib
+import time
+import io
+import struct
+import contextlib
+import zlib
+import collections
+import urllib.parse
+import re
+import threading
+import functools
+import importlib
+
+
+class LazyModule:
+    """
+    延迟导入的模块：第一次访问其属性时才真正执行导入
+    导入交给 importlib.import_module，多个线程同时第一次访问时会等待同一次导入完成，
+    不会拿到只初始化了一半的模块（importlib.util.LazyLoader 在 3.12 之前没有这个保证）
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    延迟导入模块
+    cip 经常被脚本频繁调用，requests 等较重的模块只在真正用到时才加载
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+zipfile = lazy_import("zipfile")
+subprocess = lazy_import("subprocess")
+tempfile = lazy_import("tempfile")
+requests = lazy_import("requests")
+certifi = lazy_import("certifi")
+sqlite3 = lazy_import("sqlite3")
+concurrent_futures = lazy_import("concurrent.futures")
 CIP_VERSION = "0.0.4 beta"
 # 颜色设置
 WHITE = '\033[0m'
@@ -20,152 +64,2076 @@ BLUE = '\033[34m'
 BOLD = '\033[1m'
 SKYBLUE = '\033[36m'
 
+# 下载时每次写入磁盘的块大小
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 批量下载的默认并发数
+DOWNLOAD_JOBS = 8
+# 增量包格式：魔数 + 4 字节清单长度 + JSON 清单 + 按顺序拼接的新增数据（与 server.py 一致）
+DELTA_MAGIC = b'CIPDELTA1\n'
+# HTTP 连接池、重试和超时的默认值，可通过同名配置项修改
+HTTP_DEFAULTS = {
+    'http_pool_size': '16',
+    'http_retries': '3',
+    'http_backoff': '0.5',
+    'http_connect_timeout': '10',
+    'http_read_timeout': '60',
+}
+# 这些状态码视为临时错误，GET 请求会按退避时间自动重试
+HTTP_RETRY_STATUS = (429, 500, 502, 503, 504)
+# 创建包时可选的压缩算法
+# （值为 zip 规范中的压缩方法编号，与 zipfile.ZIP_STORED 等常量一致）
+COMPRESSION_METHODS = {
+    "stored": 0,
+    "deflate": 8,
+    "bzip2": 12,
+    "lzma": 14,
+}
+# 直接读写 zip 成员压缩数据（见 raw_zip_supported）验证过的 Python 版本范围，其他版本退回到 zipfile 的公开接口
+RAW_ZIP_VERSIONS = ((3, 8), (3, 14))
+# 并行压缩时每个任务处理的数据量
+COMPRESS_BATCH_SIZE = 4 * 1024 * 1024
+# 解释器查找结果缓存
+PYTHON_CACHE_PATH = Path("~/.cip/pythons.json").expanduser()
+# 获取解释器版本、site-packages 目录以及字节码的 cache_tag 和魔数的探测脚本
+PYTHON_PROBE = ("import sys, json, sysconfig, importlib.util; print(json.dumps({'version': sys.version.split()[0], "
+                "'purelib': sysconfig.get_paths()['purelib'], 'cache_tag': sys.implementation.cache_tag, "
+                "'magic': importlib.util.MAGIC_NUMBER.hex()}))")
+# 在目标解释器中用进程池编译字节码的脚本
+# 标准输入每行为 "源文件\t.pyc 路径\t嵌入的文件名"（后两项可为空），参数为进程数和失效检查模式
+# 只把 py_compile.compile 交给进程池，Windows 上以 spawn 方式启动工作进程时也不需要导入 -c 脚本本身
+BYTECODE_COMPILE_SCRIPT = """\
+import sys, functools, py_compile, concurrent.futures
+jobs, mode = int(sys.argv[1]), py_compile.PycInvalidationMode[sys.argv[2]]
+rows = [line.split('\\t') for line in sys.stdin.read().splitlines()]
+columns = [[value or None for value in column] for column in zip(*rows)]
+compile_one = functools.partial(py_compile.compile, quiet=1, invalidation_mode=mode)
+if jobs == 1 or len(rows) < 16:
+    results = [*map(compile_one, *columns)]
+else:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or None) as executor:
+        results = [*executor.map(compile_one, *columns, chunksize=max(1, len(rows) // 64))]
+sys.exit(1 if None in results else 0)
+"""
+# 解释器可执行文件名：python、python3、python3.12、python.exe 等
+PYTHON_EXE_PATTERN = re.compile(r"^python(\d+(\.\d+)?)?(\.exe)?$" if os.name == 'nt' else r"^python(\d+(\.\d+)?)?$", re.IGNORECASE)
+# 遍历目录查找解释器时跳过的目录
+PYTHON_SKIP_DIRS = {
+    "node_modules", ".git", ".hg", ".svn", "__pycache__", "site-packages", "dist-packages",
+    ".cache", ".npm", ".cargo", ".rustup", "Windows", "$Recycle.Bin", "System Volume Information",
+}
+PYTHON_SKIP_PATHS = {"/proc", "/sys", "/dev", "/run", "/snap", "/var/lib/docker"}
+# 包列表响应及其 ETag 的本地缓存目录
+INDEX_CACHE_DIR = Path("~/.cip/index_cache").expanduser()
+# cip list 每次请求获取的包数量
+LIST_PAGE_SIZE = 100
+# 配置文件路径
+CONFIG_PATH = Path("~/.cip/config.ini").expanduser()
+# 已安装包登记表，每个 Python 环境一个，保存在其 site-packages 目录中
+REGISTRY_NAME = ".cip-registry.db"
+# zipimport 安装布局中的归档和 .pth 文件后缀
+ZIP_LAYOUT_SUFFIX = ".cip.zip"
+ZIP_LAYOUT_PTH_SUFFIX = ".cip.pth"
+# 增量构建缓存目录，位于执行 cip create 的项目目录中
+BUILD_CACHE_DIR = Path(".cip-build")
+# cip lock / cip sync 默认使用的锁文件
+LOCKFILE_NAME = "cip.lock"
+# 已解压包仓库，按 .cpack 的 SHA-256 保存解压后的目录树，供各个解释器链接
+STORE_DIR = Path("~/.cip/store").expanduser()
+# 从仓库安装文件的方式（配置项 store）：hardlink 硬链接、reflink 写时复制、copy 复制，off 不使用仓库
+STORE_MODES = ("hardlink", "reflink", "copy", "off")
+DEFAULT_STORE_MODE = "hardlink"
+STORE_LINK_NAMES = {"hardlink": "硬链接", "reflink": "reflink", "copy": "复制", "unchanged": "未变化"}
+# Linux 上创建 reflink 的 ioctl 请求号（btrfs、XFS 等文件系统支持）
+FICLONE = 0x40049409
+# 本地包缓存目录及默认大小上限（MB）
+CACHE_DIR = Path("~/.cip/cache").expanduser()
+DEFAULT_CACHE_SIZE_MB = 2048
+
+
+class Profiler:
+    """
+    按阶段计时：记录每个阶段（span）的开始时间、耗时、所在线程和父阶段
+    默认关闭，关闭时 span 几乎没有开销；通过 cip --profile 开启
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        stack = self._local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        record = {"name": name, "start": time.perf_counter() - self.origin, "duration": 0.0,
+                  "thread": threading.get_ident(), "parent": parent, "children": 0.0, "args": args}
+        stack.append(record)
+        try:
+            yield
+        finally:
+            stack.pop()
+            record["duration"] = time.perf_counter() - self.origin - record["start"]
+            if parent is not None:
+                parent["children"] += record["duration"]
+            self.spans.append(record)
+
+    def summary(self):
+        """
+        按阶段名汇总
+        :return: [(阶段名, 次数, 总耗时, 自身耗时, 最长耗时)]，按自身耗时降序
+        """
+        totals = {}
+        for record in self.spans:
+            entry = totals.setdefault(record["name"], [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += record["duration"]
+            entry[2] += record["duration"] - record["children"]
+            entry[3] = max(entry[3], record["duration"])
+        return sorted(((name, *entry) for name, entry in totals.items()), key=lambda row: row[3], reverse=True)
+
+    def write_trace(self, path):
+        """
+        以 Chrome Trace Event 格式写出，可以用 chrome://tracing 或 Perfetto 打开
+        """
+        events = [{
+            "name": record["name"], "ph": "X", "pid": os.getpid(), "tid": record["thread"],
+            "ts": record["start"] * 1e6, "dur": record["duration"] * 1e6, "args": record["args"],
+        } for record in self.spans]
+        summary = [{"name": name, "count": count, "total_ms": total * 1000, "self_ms": self_time * 1000, "max_ms": longest * 1000}
+                   for name, count, total, self_time, longest in self.summary()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "summary": summary}, f, ensure_ascii=False)
+
+    def print_summary(self):
+        wall = max((record["start"] + record["duration"] for record in self.spans), default=0.0)
+        click.echo(f"\n{BOLD}阶段耗时（总计 {wall * 1000:.1f} ms）{WHITE}", err=True)
+        click.echo(f"{'阶段':<24}{'次数':>8}{'总耗时 ms':>12}{'自身 ms':>12}{'最长 ms':>12}{'占比':>8}", err=True)
+        for name, count, total, self_time, longest in self.summary():
+            share = self_time / wall * 100 if wall else 0.0
+            click.echo(f"{name:<24}{count:>8}{total * 1000:>12.1f}{self_time * 1000:>12.1f}{longest * 1000:>12.1f}{share:>7.1f}%", err=True)
+
+
+profiler = Profiler()
+
+
+def traced(name):
+    """
+    装饰器：调用函数时记录一个名为 name 的阶段
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def prompt(*args, **kwargs):
+    """
+    click.prompt 的包装，等待用户输入的时间单独记为一个阶段，不算进其他阶段的自身耗时
+    """
+    with profiler.span("prompt"):
+        return click.prompt(*args, **kwargs)
+
+
+class CipConfig:
+    """
+    config.ini 的惰性加载缓存
+    第一次使用时才读取，之后只在文件的 mtime 或大小变化时重新解析
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = Path(path)
+        self._parser = None
+        self._stamp = None
+
+    def exists(self):
+        return self.path.exists()
+
+    def load(self):
+        """
+        :return: ConfigParser，配置文件不存在时返回 None
+        """
+        import configparser
+        try:
+            stat = self.path.stat()
+        except OSError:
+            self._parser = None
+            self._stamp = None
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._parser is None or stamp != self._stamp:
+            parser = configparser.ConfigParser()
+            parser.read(self.path)
+            self._parser = parser
+            self._stamp = stamp
+        return self._parser
+
+    def get(self, key, default=None):
+        parser = self.load()
+        if parser is None or not parser.has_option('CONFIG', key):
+            return default
+        return parser['CONFIG'][key]
+
+    def save(self, parser):
+        self.path.parent.mkdir(exist_ok=True)
+        with open(self.path, 'w') as configfile:
+            parser.write(configfile)
+        stat = self.path.stat()
+        self._parser = parser
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def set(self, key, value):
+        parser = self.load()
+        parser['CONFIG'][key] = value
+        self.save(parser)
+
+
+cip_config = CipConfig()
+
+
+def setup_config():
+    """
+    配置 cip
+    """
+    import configparser
+    if not cip_config.exists():
+        config = configparser.ConfigParser()
+        config['CONFIG'] = {
+            'lang': 'zh-CN',
+            'web_url': 'https://cip.zhiyuhub.top',
+            'cache_size_mb': str(DEFAULT_CACHE_SIZE_MB),
+            'version': CIP_VERSION
+            }
+        cip_config.save(config)
+    try:
+        config = cip_config.load()
+        if config['CONFIG']['version']!= CIP_VERSION:
+            click.echo(f"{RED}{BOLD}警告:{WHITE} 配置文件版本不是{CIP_VERSION}，可能存在兼容性问题。")
+            # 修改配置文件版本
+            cip_config.set('version', CIP_VERSION)
+    except Exception as e:
+        click.echo(f"{RED}{BOLD}错误:{WHITE} 读取配置文件失败。")
+        click.echo(f"{RED}{BOLD}错误信息:{WHITE} {e}")
+        click.echo(f"请使用cip reset命令重新生成配置文件。")
+        #sys.exit(1)
+
+def get_config(key, default=None):
+    """
+    获取配置
+    :param key: 配置项
+    :param default: 配置项不存在时的默认值，为 None 时提示错误
+    """
+    if not cip_config.exists():
+        if default is not None:
+            return default
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
+        return
+    value = cip_config.get(key)
+    if value is None:
+        if default is not None:
+            return default
+        if cip_config.get('lang') == 'zh-CN':
+            click.echo(f"{RED}{BOLD}ERROR:{WHITE} 配置项 {key} 不存在。")
+        else:
+            click.echo(f"{RED}{BOLD}ERROR:{WHITE} Config item {key} does not exist.")
+        return
+    return value
+
+
+def is_python_executable(path):
+    """
+    判断路径是否是 Python 解释器可执行文件
+    """
+    if not PYTHON_EXE_PATTERN.match(os.path.basename(path)):
+        return False
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def fast_python_candidates():
+    """
+    快速查找：PATH、常见安装目录和虚拟环境中的解释器，不做目录遍历
+    :return: 可执行文件路径列表
+    """
+    bin_name = "Scripts" if os.name == 'nt' else "bin"
+    dirs = [Path(p) for p in os.environ.get("PATH", "").split(os.pathsep) if p]
+    home = Path(os.path.expanduser("~"))
+    if os.name == 'nt':
+        dirs += (home / "AppData" / "Local" / "Programs" / "Python").glob("Python*")
+        dirs += Path("C:\\").glob("Python*")
+    else:
+        dirs += [Path("/usr/local/bin"), Path("/usr/bin"), Path("/opt/homebrew/bin")]
+        dirs += (home / ".pyenv" / "versions").glob(f"*/{bin_name}")
+    # conda 环境
+    for conda in ("miniconda3", "anaconda3", "miniforge3", "miniconda", "anaconda"):
+        dirs += [home / conda, home / conda / bin_name]
+        dirs += (home / conda / "envs").glob("*")
+        dirs += (home / conda / "envs").glob(f"*/{bin_name}")
+    # 虚拟环境：当前目录下的常见名称，以及 virtualenvwrapper 的目录
+    venv_roots = [Path.cwd() / name for name in (".venv", "venv", "env")]
+    venv_roots += (home / ".virtualenvs").glob("*")
+    for venv_root in venv_roots:
+        if (venv_root / "pyvenv.cfg").exists():
+            dirs.append(venv_root / bin_name)
+            dirs.append(venv_root)
+
+    executables = []
+    seen = set()
+    for directory in dirs:
+        if directory in seen:
+            continue
+        seen.add(directory)
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if is_python_executable(entry.path):
+                    executables.append(entry.path)
+    return executables
+
+
+@traced("python.walk")
+def walk_for_pythons(roots, jobs=None):
+    """
+    并行遍历目录查找解释器，跳过明显无关的目录，不跟随目录符号链接
+    起始目录下的每个子目录作为一个任务，在线程池中各自用 os.walk 遍历
+    :param roots: 起始目录列表
+    :param jobs: 线程数
+    :return: 可执行文件路径列表
+    """
+    def prune(dirpath, dirnames):
+        dirnames[:] = [name for name in dirnames
+                       if name not in PYTHON_SKIP_DIRS and os.path.join(dirpath, name) not in PYTHON_SKIP_PATHS]
+
+    def walk(top):
+        found = []
+        for dirpath, dirnames, filenames in os.walk(top):
+            prune(dirpath, dirnames)
+            for filename in filenames:
+                if PYTHON_EXE_PATTERN.match(filename) and is_python_executable(os.path.join(dirpath, filename)):
+                    found.append(os.path.join(dirpath, filename))
+        return found
+
+    executables = []
+    subtrees = []
+    for root in roots:
+        try:
+            dirpath, dirnames, filenames = next(os.walk(root))
+        except StopIteration:
+            continue
+        prune(dirpath, dirnames)
+        executables += [os.path.join(dirpath, name) for name in filenames if is_python_executable(os.path.join(dirpath, name))]
+        subtrees += [os.path.join(dirpath, name) for name in dirnames]
+
+    with concurrent_futures.ThreadPoolExecutor(max_workers=jobs or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        for found in executor.map(walk, subtrees):
+            executables.extend(found)
+    return executables
+
+
+@traced("python.probe")
+def probe_pythons(executables):
+    """
+    并发获取解释器的版本和 site-packages 目录
+    结果缓存在 ~/.cip/pythons.json 中，可执行文件的 mtime 不变时直接使用缓存
+    :param executables: 可执行文件路径列表
+    :return: [{"dir", "executable", "version", "purelib", "cache_tag", "magic"}, ...]，同一目录只保留一个
+    """
+    try:
+        with open(PYTHON_CACHE_PATH, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    # 同一目录下的 python、python3、python3.x 视为同一个解释器
+    by_dir = {}
+    for executable in sorted(executables, key=lambda p: (len(os.path.basename(p)), p)):
+        by_dir.setdefault(os.path.dirname(executable), executable)
+    # 之前发现过的解释器也一并检查，这样全盘查找的结果在下次运行时仍然可用
+    for executable in cache:
+        if os.path.dirname(executable) not in by_dir and is_python_executable(executable):
+            by_dir[os.path.dirname(executable)] = executable
+
+    def probe(executable):
+        try:
+            result = subprocess.run([executable, "-c", PYTHON_PROBE], capture_output=True, text=True, timeout=10)
+            return json.loads(result.stdout)
+        except (OSError, ValueError, subprocess.SubprocessError):
+            return {}
+
+    results = {}
+    to_probe = []
+    for executable in by_dir.values():
+        try:
+            mtime = os.stat(executable).st_mtime
+        except OSError:
+            continue
+        cached = cache.get(executable)
+        # 旧版本 cip 写入的缓存没有字节码信息，需要重新探测
+        if cached and cached["mtime"] == mtime and "cache_tag" in cached:
+            results[executable] = cached
+        else:
+            to_probe.append((executable, mtime))
+
+    if to_probe:
+        with concurrent_futures.ThreadPoolExecutor(max_workers=min(16, len(to_probe))) as executor:
+            for (executable, mtime), info in zip(to_probe, executor.map(probe, [e for e, _ in to_probe])):
+                results[executable] = {"mtime": mtime, "version": info.get("version"), "purelib": info.get("purelib"),
+                                       "cache_tag": info.get("cache_tag"), "magic": info.get("magic")}
+
+    cache = {executable: info for executable, info in results.items()}
+    try:
+        PYTHON_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = PYTHON_CACHE_PATH.with_name(f"pythons.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, PYTHON_CACHE_PATH)
+    except OSError:
+        pass
+
+    return [
+        {"dir": os.path.dirname(executable), "executable": executable, "version": info["version"], "purelib": info["purelib"],
+         "cache_tag": info.get("cache_tag"), "magic": info.get("magic")}
+        for executable, info in sorted(results.items())
+    ]
+
+
+def choose_python(pythons, interactive=True):
+    """
+    让用户从找到的解释器中选择一个
+    :param interactive: 为 False 时（例如 --yes）不询问，找到多个解释器时报错
+    :return: Python 安装目录
+    """
+    if len(pythons) == 1:
+        return pythons[0]["dir"]
+    if not interactive:
+        raise FileNotFoundError(f"找到 {len(pythons)} 个 Python 安装路径，不询问时请用 -p 指定目标 Python 目录。")
+    click.echo(f"{BLUE}找到多个Python安装路径，请选择一个:{WHITE}")
+    for idx, python in enumerate(pythons, start=1):
+        version = f"Python {python['version']}" if python["version"] else "未激活的虚拟环境或其他"
+        click.echo(f"{idx}: {python['dir']} 版本：{version}")
+    choice = prompt("请输入选择的数字", type=click.IntRange(1, len(pythons)))
+    return pythons[choice - 1]["dir"]
+
+
+@traced("python.discover")
+def find_python_path(interactive=True):
+    """
+    查找Python安装路径
+    先查找 PATH、常见安装目录、虚拟环境以及之前找到过的解释器；都没有时再按用户输入遍历目录
+    :param interactive: 为 False 时不向用户询问，找到多个解释器时报错，一个都没找到时返回 None
+    """
+    pythons = probe_pythons(fast_python_candidates())
+    for python in pythons:
+        click.echo(f"{BLUE}已找到{python['dir']}中的Python{WHITE}")
+    if pythons:
+        return choose_python(pythons, interactive)
+    if not interactive:
+        return None
+
+    # 如果默认路径未找到，提示用户手动输入路径
+    click.echo("未找到Python安装路径，请手动输入路径:")
+    python_dir = prompt("Python 安装目录 (输入 'All' 查找整个电脑)", type=str)
+
+    if python_dir.lower() == 'all':
+        # 查找整个电脑
+        if os.name == 'nt':
+            # Windows 系统
+            roots = [f"{d}:\\" for d in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" if os.path.exists(f"{d}:\\")]
+        else:
+            # Unix/Linux 系统
+            roots = ["/"]
+    else:
+        roots = [python_dir]
+
+    pythons = [python for python in probe_pythons(walk_for_pythons(roots))
+               if python["executable"].startswith(tuple(roots)) or python_dir.lower() == 'all']
+    for python in pythons:
+        click.echo(f"{BLUE}已找到{python['dir']}中的Python{WHITE}")
+    if pythons:
+        return choose_python(pythons)
+
+    click.echo("未找到有效的Python安装路径。")
+    return None
+
+
+def require_python_path(interactive=True):
+    """
+    查找 Python 路径，找不到时抛出异常
+    :param interactive: 为 False 时不向用户询问，见 find_python_path
+    """
+    python_dir = find_python_path(interactive)
+    if python_dir is None:
+        raise FileNotFoundError("未找到有效的Python安装路径。" + ("" if interactive else "请用 -p 指定目标 Python 目录。"))
+    return python_dir
+
+
+def site_packages_for(python_dir):
+    """
+    获取 Python 目录对应的 site-packages 目录
+    优先使用 Windows 布局的 Lib/site-packages，不存在时运行目录中的解释器查询它的 purelib
+    :raises FileNotFoundError: 两者都找不到时抛出，避免把包装到不会被导入的 Lib/ 目录
+    """
+    site_packages_dir = Path(python_dir) / "Lib" / "site-packages"
+    if site_packages_dir.exists():
+        return site_packages_dir
+    python_info = python_info_for(python_dir)
+    if python_info is not None and python_info["purelib"]:
+        return Path(python_info["purelib"])
+    raise FileNotFoundError(f"{python_dir} 中没有 Lib/site-packages，也没有可运行的 Python 解释器，无法确定 site-packages 目录。")
+
+
+def python_info_for(python_dir):
+    """
+    获取 Python 目录中解释器的信息（可执行文件、版本、字节码的 cache_tag 和魔数）
+    :return: probe_pythons 返回的一项，目录中没有可用的解释器时返回 None
+    """
+    # 统一成绝对路径，-p ./py 这样的相对路径也能和探测结果对上
+    python_dir = os.path.abspath(python_dir)
+    try:
+        names = sorted(os.listdir(python_dir))
+    except OSError:
+        return None
+    executables = [os.path.join(python_dir, name) for name in names if is_python_executable(os.path.join(python_dir, name))]
+    if not executables:
+        return None
+    for python in probe_pythons(executables):
+        if os.path.abspath(python["dir"]) == python_dir and python["cache_tag"] and python["magic"]:
+            return python
+    return None
+
+
+_http_session = None
+
+
+def http_setting(key, type_=float):
+    return type_(get_config(key, default=HTTP_DEFAULTS[key]))
+
+
+def http_session():
+    """
+    获取进程内共享的 HTTP 会话
+    所有请求复用同一个连接池（keep-alive），避免每次请求都重新建立 TCP/TLS 连接；
+    GET 请求遇到连接失败或临时错误时按指数退避自动重试
+    """
+    global _http_session
+    if _http_session is None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retries = Retry(
+            total=http_setting('http_retries', int),
+            backoff_factor=http_setting('http_backoff'),
+            status_forcelist=HTTP_RETRY_STATUS,
+            # 上传的请求体是一次性的流，不能重放，只重试幂等请求
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        pool_size = http_setting('http_pool_size', int)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # 跳过SSL验证
+        session.verify = False
+        _http_session = session
+    return _http_session
+
+
+def http_request(method, url, **kwargs):
+    """
+    通过共享会话发送请求，未指定 timeout 时使用配置的连接/读取超时
+    """
+    kwargs.setdefault("timeout", (http_setting('http_connect_timeout'), http_setting('http_read_timeout')))
+    # stream=True 时只计到收到响应头为止，读取响应体的时间计入调用方的阶段
+    with profiler.span(f"http.{method.lower()}", url=url):
+        return http_session().request(method, url, **kwargs)
+
+
+@traced("network.index")
+def cached_get_json(url, params=None):
+    """
+    带 ETag 重新验证的 JSON GET 请求
+    上次的响应和 ETag 保存在 ~/.cip/index_cache 中，服务端返回 304 时直接使用本地副本
+    :param url: 请求地址
+    :param params: 查询参数
+    :return: 解析后的 JSON
+    """
+    key = url + "?" + urllib.parse.urlencode(sorted((params or {}).items()))
+    cache_path = INDEX_CACHE_DIR / (hashlib.sha1(key.encode()).hexdigest() + ".json")
+    try:
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = None
+
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    response = http_request("GET", url, params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached["data"]
+    response.raise_for_status()
+    data = response.json()
+
+    etag = response.headers.get("ETag")
+    if etag:
+        INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # 同一进程的多个线程可能同时请求同一个地址，临时文件名带上线程 ID
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"url": key, "etag": etag, "data": data}, f)
+        os.replace(tmp_path, cache_path)
+    return data
+
+
+@traced("network.download")
+def stream_download(url, dest_path, chunk_size=DOWNLOAD_CHUNK_SIZE, etag=None):
+    """
+    流式下载文件，支持断点续传
+    数据先分块写入同目录下的 .part 临时文件，下载完成后再原子地替换到目标路径
+    续传时用 If-Range 带上 .part 对应的 ETag（保存在 .part.etag 中），服务端文件已变化时会从头返回完整内容；
+    ETag 是 SHA-256 时还会校验下载完成的文件，不一致则丢弃 .part 重新下载
+    :param url: 下载地址
+    :param dest_path: 目标文件路径
+    :param chunk_size: 每次写入的块大小
+    :param etag: 本地已有版本的 ETag，服务端内容未变化时返回 304 且不写入任何文件
+    :return: HTTP 状态码
+    """
+    dest_path = Path(dest_path)
+    part_path = dest_path.with_name(dest_path.name + ".part")
+    validator_path = dest_path.with_name(dest_path.name + ".part.etag")
+    validator = None
+    if part_path.exists():
+        try:
+            validator = validator_path.read_text(encoding="ascii").strip()
+        except (OSError, ValueError):
+            validator = None
+        if not validator or validator.startswith("W/"):
+            # 不知道 .part 来自服务端的哪个版本（或只有弱 ETag），不能安全地续传
+            discard_partial_download(dest_path)
+            validator = None
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+    if etag:
+        headers["If-None-Match"] = f'"{etag}"'
+
+    with http_request("GET", url, headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # 请求范围越界：如果临时文件恰好完整则直接使用，否则重新下载
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if not total.isdigit() or int(total) != offset:
+                discard_partial_download(dest_path)
+                return stream_download(url, dest_path, chunk_size, etag)
+        elif response.status_code == 304:
+            return 304
+        elif response.status_code in (200, 206):
+            if response.status_code == 206:
+                # Content-Range: bytes <start>-<end>/<total>
+                start = response.headers.get("Content-Range", "").split(" ")[-1].split("-")[0]
+                if not start.isdigit() or int(start) != offset:
+                    discard_partial_download(dest_path)
+                    return stream_download(url, dest_path, chunk_size, etag)
+                mode = "ab"
+            else:
+                # 服务端不支持 Range，或 If-Range 不匹配（文件已变化）时从头下载，并记下新内容的 ETag 供之后续传
+                mode = "wb"
+                offset = 0
+                validator = response.headers.get("ETag")
+                if validator:
+                    validator_path.write_text(validator, encoding="ascii")
+                else:
+                    validator_path.unlink(missing_ok=True)
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        else:
+            return response.status_code
+
+    expected = (validator or "").strip('"')
+    if re.fullmatch(r"[0-9a-f]{64}", expected) and file_sha256(part_path) != expected:
+        discard_partial_download(dest_path)
+        if offset:
+            # 续传拼接出的文件不对（例如服务端忽略了 If-Range），从头再下载一次
+            return stream_download(url, dest_path, chunk_size, etag)
+        raise requests.exceptions.RequestException(f"下载的文件校验失败：SHA-256 应为 {expected}")
+    os.replace(part_path, dest_path)
+    validator_path.unlink(missing_ok=True)
+    return 200
+
+def discard_partial_download(dest_path):
+    """
+    删除未完成下载的 .part 文件及其 ETag 记录
+    """
+    dest_path = Path(dest_path)
+    dest_path.with_name(dest_path.name + ".part").unlink(missing_ok=True)
+    dest_path.with_name(dest_path.name + ".part.etag").unlink(missing_ok=True)
+
+@traced("sha256")
+def file_sha256(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    计算文件的 SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PackageCache:
+    """
+    本地 .cpack 缓存
+    包文件按 SHA-256 存放在 objects 目录下，index.json 记录 包名==版本 到哈希的映射，
+    以及每个对象的大小和最近使用时间，超过大小上限时按 LRU 淘汰。
+    修改索引时持有 index.lock 上的文件锁，多个进程同时使用缓存时不会丢失彼此的修改。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_size_mb=None):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.index_path = self.cache_dir / "index.json"
+        if max_size_mb is None:
+            max_size_mb = get_config("cache_size_mb", default=str(DEFAULT_CACHE_SIZE_MB))
+        self.max_size = int(float(max_size_mb) * 1024 * 1024)
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"objects": {}, "refs": {}}
+
+    def _save_index(self, index):
+        # 先写临时文件再替换，避免并发进程读到写了一半的索引
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_name(f"index.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @contextlib.contextmanager
+    def _update_index(self):
+        """
+        加锁读取索引，正常退出时保存；读改写期间其他进程的修改会等待锁释放
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / "index.lock", "a+b") as lock:
+            lock_file(lock)
+            index = self._load_index()
+            yield index
+            self._save_index(index)
+
+    def object_path(self, sha256):
+        return self.objects_dir / sha256[:2] / f"{sha256}.cpack"
+
+    @traced("cache.lookup")
+    def lookup(self, package_name, version):
+        """
+        查找缓存中的包，命中前校验文件的 SHA-256 与对象名一致
+        :return: 缓存文件路径，未命中时返回 None
+        """
+        if not self.enabled:
+            return None
+        ref = f"{package_name}=={version}"
+        index = self._load_index()
+        sha256 = index["refs"].get(ref)
+        if sha256 is None or sha256 not in index["objects"]:
+            return None
+        path = self.object_path(sha256)
+        # 计算哈希较慢，在锁外进行
+        valid = path.exists() and path.stat().st_size == index["objects"][sha256]["size"] and file_sha256(path) == sha256
+        with self._update_index() as index:
+            if valid:
+                if sha256 in index["objects"]:
+                    index["objects"][sha256]["last_used"] = time.time()
+            else:
+                # 缓存文件丢失或被改动，删除后视为未命中，下次下载时重新放入
+                path.unlink(missing_ok=True)
+                index["objects"].pop(sha256, None)
+                index["refs"] = {name: value for name, value in index["refs"].items() if value != sha256}
+        return path if valid else None
+
+    def versions(self, package_name):
+        """
+        列出缓存中某个包的所有版本（只读，不更新使用时间）
+        :return: {版本: 缓存文件路径}
+        """
+        if not self.enabled:
+            return {}
+        index = self._load_index()
+        prefix = f"{package_name}=="
+        versions = {}
+        for ref, sha256 in index["refs"].items():
+            path = self.object_path(sha256)
+            if ref.startswith(prefix) and sha256 in index["objects"] and path.exists():
+                versions[ref[len(prefix):]] = path
+        return versions
+
+    @traced("cache.add")
+    def add(self, package_name, version, cpack_path, sha256=None, keep=()):
+        """
+        将 .cpack 文件加入缓存
+        :param keep: 调用方还要使用的对象的 SHA-256，淘汰时跳过
+        :return: 缓存文件路径，缓存未启用或该文件超出缓存上限被立即淘汰时返回 None
+        """
+        if not self.enabled:
+            return None
+        if sha256 is None:
+            sha256 = file_sha256(cpack_path)
+        path = self.object_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            shutil.copyfile(cpack_path, tmp_path)
+            os.replace(tmp_path, path)
+        with self._update_index() as index:
+            index["objects"][sha256] = {"size": path.stat().st_size, "last_used": time.time()}
+            index["refs"][f"{package_name}=={version}"] = sha256
+            self._evict(index, self.max_size, keep)
+            if sha256 not in index["objects"]:
+                return None
+        return path
+
+    def _evict(self, index, max_size, keep=()):
+        """
+        按最近使用时间从旧到新淘汰，直到总大小不超过 max_size
+        :param keep: 不淘汰的对象的 SHA-256
+        :return: (淘汰数量, 释放字节数)
+        """
+        total = sum(obj["size"] for obj in index["objects"].values())
+        removed = 0
+        freed = 0
+        for sha256, obj in sorted(index["objects"].items(), key=lambda item: item[1]["last_used"]):
+            if total <= max_size:
+                break
+            if sha256 in keep:
+                continue
+            self.object_path(sha256).unlink(missing_ok=True)
+            del index["objects"][sha256]
+            total -= obj["size"]
+            removed += 1
+            freed += obj["size"]
+        index["refs"] = {ref: sha256 for ref, sha256 in index["refs"].items() if sha256 in index["objects"]}
+        return removed, freed
+
+    def prune(self, max_size=None):
+        """
+        清理缓存到指定大小（字节），默认清理到配置的上限
+        """
+        with self._update_index() as index:
+            return self._evict(index, self.max_size if max_size is None else max_size)
+
+    def stats(self):
+        index = self._load_index()
+        return {
+            "packages": len(index["refs"]),
+            "objects": len(index["objects"]),
+            "size": sum(obj["size"] for obj in index["objects"].values()),
+            "max_size": self.max_size,
+        }
+
+
+def lock_file(f):
+    """
+    对已打开的文件加独占锁，直到文件关闭时释放；其他进程加锁时会一直等待
+    """
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK 重试 10 秒后仍拿不到锁会抛出 OSError，继续等待
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+@traced("cache.place")
+def place_file(src, dest):
+    """
+    将缓存文件放到目标位置，优先使用硬链接，失败时复制
+    """
+    dest = Path(dest)
+    tmp_path = dest.with_name(dest.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def reflink_file(src, dest):
+    """
+    创建写时复制的副本：与原文件共享数据块，修改任何一方都不影响另一方
+    只支持 Linux 上提供 FICLONE 的文件系统，不支持时抛出 OSError
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前系统不支持 reflink")
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def link_file(src, dest, mode):
+    """
+    把仓库中的文件放到目标位置：先放到临时文件名，再原子替换
+    :param mode: hardlink / reflink / copy，失败时依次退回到后面的方式（例如跨设备时硬链接和 reflink 都不可用）
+    :return: 实际使用的方式
+    """
+    dest = Path(dest)
+    tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    modes = STORE_MODES[STORE_MODES.index(mode):-1]
+    for used in modes:
+        try:
+            if used == "hardlink":
+                os.link(src, tmp_path)
+            elif used == "reflink":
+                reflink_file(src, tmp_path)
+            else:
+                shutil.copyfile(src, tmp_path)
+            break
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            if used == "copy":
+                raise
+    os.replace(tmp_path, dest)
+    return used
+
+
+class FileSlice(io.RawIOBase):
+    """
+    文件中一段连续字节的只读、可随机访问视图
+    用于把 .cpack 中未压缩存储的 pack.zip 直接当作文件交给 zipfile，而无需先解压到磁盘
+    """
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, "rb")
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, min(pos, self._length))
+        return self._pos
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._length - self._pos)
+        if size <= 0:
+            return 0
+        self._file.seek(self._offset + self._pos)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def member_data_offset(archive_path, info):
+    """
+    计算 zip 成员的数据在文件中的起始偏移
+    本地文件头固定 30 字节，之后是文件名和扩展字段，再之后才是数据
+    """
+    with open(archive_path, "rb") as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    return info.header_offset + 30 + name_len + extra_len
+
+
+@contextlib.contextmanager
+def open_nested_zip(archive_path, outer, member_name):
+    """
+    打开 .cpack 中嵌套的 zip 文件
+    未压缩存储时直接映射到外层文件的对应区间；否则解压到内存（超过阈值后落到临时文件）
+    :param archive_path: 外层 .cpack 路径
+    :param outer: 已打开的外层 ZipFile
+    :param member_name: 内层 zip 的成员名
+    :return: 内层 ZipFile
+    """
+    info = outer.getinfo(member_name)
+    if info.compress_type == zipfile.ZIP_STORED:
+        fileobj = io.BufferedReader(FileSlice(archive_path, member_data_offset(archive_path, info), info.file_size), DOWNLOAD_CHUNK_SIZE)
+    else:
+        fileobj = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+        with outer.open(info) as src:
+            shutil.copyfileobj(src, fileobj, DOWNLOAD_CHUNK_SIZE)
+        fileobj.seek(0)
+    try:
+        with zipfile.ZipFile(fileobj, "r") as inner:
+            yield inner
+    finally:
+        fileobj.close()
+
+
+@traced("install.scan")
+def group_members(zipf):
+    """
+    一次遍历 zip 的成员列表，按顶层目录分组（跳过目录项）
+    :return: {顶层名: [ZipInfo, ...]}
+    """
+    members = {}
+    for info in zipf.infolist():
+        if info.is_dir():
+            continue
+        members.setdefault(info.filename.split("/", 1)[0], []).append(info)
+    return members
+
+
+@traced("install.extract")
+def extract_members(zipf, members, dest_dir, installed=None):
+    """
+    将 zip 中的成员直接写入目标目录，写入的同时计算 SHA-256
+    :param zipf: 已打开的 ZipFile
+    :param members: 要写出的 ZipInfo 列表
+    :param dest_dir: 目标目录
+    :param installed: 登记表中已安装的文件 {相对路径: {"size", "crc", "sha256"}}，
+                      大小和 CRC 都没有变化且磁盘上的文件还在的成员直接跳过（升级时只写变化的文件）
+    :return: 本次安装的文件清单 {相对路径: {"size", "crc", "sha256"}}
+    """
+    dest_dir = Path(dest_dir).resolve()
+    installed = installed or {}
+    created_dirs = set()
+    manifest = {}
+    for info in members:
+        dest = (dest_dir / info.filename).resolve()
+        # 防止压缩包中的 ../ 路径写出目标目录
+        if dest_dir not in dest.parents:
+            raise ValueError(f"非法的文件路径: {info.filename}")
+        previous = installed.get(info.filename)
+        if (previous is not None and previous["size"] == info.file_size and previous["crc"] == info.CRC
+                and dest.is_file() and dest.stat().st_size == info.file_size):
+            manifest[info.filename] = previous
+            continue
+        if dest.parent not in created_dirs:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(dest.parent)
+        # 先删除再写入：目标可能是指向包仓库的硬链接，直接覆盖会同时改动仓库和其他环境中的同一个文件
+        dest.unlink(missing_ok=True)
+        digest = hashlib.sha256()
+        with zipf.open(info) as src, open(dest, "wb") as dst:
+            for chunk in iter(lambda: src.read(DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        manifest[info.filename] = {"size": info.file_size, "crc": info.CRC, "sha256": digest.hexdigest()}
+    return manifest
+
+
+@traced("install.remove")
+def remove_installed_files(site_packages_dir, paths):
+    """
+    删除已安装的文件及其 __pycache__ 中的字节码，并清理删除后变空的目录
+    :param site_packages_dir: site-packages 目录
+    :param paths: 相对 site-packages 的文件路径
+    """
+    site_packages_dir = Path(site_packages_dir).resolve()
+    dirs = set()
+    for path in paths:
+        file = (site_packages_dir / path).resolve()
+        if site_packages_dir not in file.parents:
+            continue
+        file.unlink(missing_ok=True)
+        if file.suffix == ".py":
+            for pyc in (file.parent / "__pycache__").glob(f"{file.stem}.*.pyc"):
+                pyc.unlink(missing_ok=True)
+            dirs.add(file.parent / "__pycache__")
+        dirs.add(file.parent)
+    # 由深到浅删除空目录，不越过 site-packages
+    candidates = set()
+    for directory in dirs:
+        while directory != site_packages_dir and site_packages_dir in directory.parents:
+            candidates.add(directory)
+            directory = directory.parent
+    for directory in sorted(candidates, key=lambda d: len(d.parts), reverse=True):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+
+
+def is_bytecode_member(name):
+    """
+    判断 pack.zip 中的成员是否是 __pycache__ 中的字节码
+    字节码不作为普通文件安装，也不记入登记表：卸载时随源文件一起删除
+    """
+    return "__pycache__/" in name
+
+
+def split_bytecode(members):
+    """
+    把一个顶层包的成员分成普通文件和字节码
+    :return: (普通文件的 ZipInfo 列表, 字节码的 ZipInfo 列表)
+    """
+    sources, bytecode = [], []
+    for info in members:
+        (bytecode if is_bytecode_member(info.filename) else sources).append(info)
+    return sources, bytecode
+
+
+def pyc_name_for(source, cache_tag):
+    """
+    源文件对应的 .pyc 相对路径，例如 pkg/mod.py -> pkg/__pycache__/mod.cpython-311.pyc
+    """
+    parent, _, name = source.rpartition("/")
+    return f"{parent}/__pycache__/{name[:-3]}.{cache_tag}.pyc" if parent else f"__pycache__/{name[:-3]}.{cache_tag}.pyc"
+
+
+def pyc_is_current(pyc_path, source_stat, magic):
+    """
+    按导入系统的规则检查 .pyc 是否可以直接使用：魔数一致，且基于时间戳的头部记录的 mtime 和大小与源文件相同
+    """
+    try:
+        with open(pyc_path, "rb") as f:
+            header = f.read(16)
+    except OSError:
+        return False
+    if len(header) < 16 or header[:4] != magic:
+        return False
+    flags, mtime, size = struct.unpack("<III", header[4:])
+    return flags == 0 and mtime == int(source_stat.st_mtime) & 0xFFFFFFFF and size == source_stat.st_size & 0xFFFFFFFF
+
+
+@traced("install.bytecode")
+def install_bytecode(zipf, members, site_packages_dir, sources, python_info):
+    """
+    使用 .cpack 中随包发布的字节码（cip create --with-bytecode）
+    只采用 cache_tag 和魔数都与目标解释器一致的、基于哈希的 .pyc；写入时把头部换成基于时间戳的格式，
+    记录刚写入的源文件的 mtime 和大小，导入时只需 stat 源文件即可验证，源文件之后被修改也会照常重新编译
+    :param zipf: 已打开的 pack.zip
+    :param members: 字节码成员的 ZipInfo 列表
+    :param sources: 本次安装的 .py 文件（相对 site-packages 的路径）
+    :param python_info: 目标解释器信息
+    :return: 使用了随包字节码的源文件数
+    """
+    site_packages_dir = Path(site_packages_dir)
+    magic = bytes.fromhex(python_info["magic"])
+    by_name = {info.filename: info for info in members}
+    used = 0
+    for source in sources:
+        pyc_name = pyc_name_for(source, python_info["cache_tag"])
+        info = by_name.get(pyc_name)
+        if info is None:
+            continue
+        source_stat = (site_packages_dir / source).stat()
+        pyc_path = site_packages_dir / pyc_name
+        if pyc_is_current(pyc_path, source_stat, magic):
+            used += 1
+            continue
+        data = zipf.read(info)
+        # 同一 cache_tag 下魔数不同（例如预发布版本）或不是基于哈希的 .pyc 时无法确认与源文件对应，留给编译
+        if len(data) < 16 or data[:4] != magic or not struct.unpack("<I", data[4:8])[0] & 0b1:
+            continue
+        pyc_path.parent.mkdir(exist_ok=True)
+        pyc_path.unlink(missing_ok=True)
+        with open(pyc_path, "wb") as f:
+            f.write(magic + struct.pack("<III", 0, int(source_stat.st_mtime) & 0xFFFFFFFF, source_stat.st_size & 0xFFFFFFFF))
+            f.write(data[16:])
+        used += 1
+    return used
+
+
+def run_bytecode_compiler(executable, rows, invalidation_mode="TIMESTAMP", jobs=None):
+    """
+    在指定的解释器中用进程池编译字节码（.pyc 的格式与 Python 版本有关，只能由对应版本的解释器生成）
+    :param rows: [(源文件, .pyc 路径或 None, 嵌入代码对象的文件名或 None), ...]
+    :param invalidation_mode: py_compile.PycInvalidationMode 的成员名
+    :return: 编译出错时的错误输出，全部成功时为空字符串
+    """
+    if not rows:
+        return ""
+    payload = "\n".join("\t".join("" if value is None else str(value) for value in row) for row in rows)
+    result = subprocess.run([executable, "-c", BYTECODE_COMPILE_SCRIPT, str(jobs or 0), invalidation_mode],
+                            input=payload, capture_output=True, text=True, encoding="utf-8",
+                            env=dict(os.environ, PYTHONIOENCODING="utf-8"))
+    if result.returncode != 0:
+        return result.stderr.strip() or f"编译进程退出码 {result.returncode}"
+    return ""
+
+
+@traced("install.compile")
+def compile_sources(site_packages_dir, sources, python_info, jobs=None):
+    """
+    为目标解释器预编译已安装的源文件，已有可用 .pyc 的文件跳过
+    :param sources: 相对 site-packages 的 .py 文件路径
+    :return: 编译的文件数
+    """
+    site_packages_dir = Path(site_packages_dir)
+    magic = bytes.fromhex(python_info["magic"])
+    stale = []
+    for source in sources:
+        source_path = site_packages_dir / source
+        if not pyc_is_current(site_packages_dir / pyc_name_for(source, python_info["cache_tag"]), source_path.stat(), magic):
+            stale.append((source_path, None, None))
+    errors = run_bytecode_compiler(python_info["executable"], stale, jobs=jobs)
+    if errors:
+        # 语法错误等问题不影响安装，导入时会照常报错
+        click.echo(f"{YELLOW}警告:{WHITE} 部分文件编译字节码失败:\n{errors}", err=True)
+    return len(stale)
+
+
+def find_bytecode_target(python_dir):
+    """
+    查找为其生成字节码的目标解释器，找不到时给出提示并跳过预编译
+    """
+    python_info = python_info_for(python_dir)
+    if python_info is None:
+        click.echo(f"{YELLOW}警告:{WHITE} {python_dir} 中没有可运行的 Python 解释器，跳过字节码预编译。")
+    return python_info
+
+
+def report_bytecode(python_info, compiled, shipped=0):
+    """
+    输出为目标解释器准备字节码的结果
+    """
+    if shipped:
+        click.echo(f"已为 Python {python_info['version']} 准备字节码：预编译 {compiled} 个，使用随包字节码 {shipped} 个")
+    elif compiled:
+        click.echo(f"已为 Python {python_info['version']} 预编译 {compiled} 个文件的字节码")
+
+
+def is_zip_layout_file(path):
+    """
+    判断登记表中的文件是否是 zipimport 布局的归档或 .pth
+    """
+    return path.endswith((ZIP_LAYOUT_SUFFIX, ZIP_LAYOUT_PTH_SUFFIX))
+
+
+def zip_layout_archive(files):
+    """
+    :param files: 登记表中某个包的文件清单
+    :return: 包以 zipimport 布局安装时返回归档的相对路径，解压安装时返回 None
+    """
+    return next((path for path in files if path.endswith(ZIP_LAYOUT_SUFFIX)), None)
+
+
+def file_record(path):
+    """
+    计算文件的大小、CRC 和 SHA-256，格式与登记表的文件条目一致
+    """
+    size, crc, digest = 0, 0, hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            digest.update(chunk)
+    return {"size": size, "crc": crc, "sha256": digest.hexdigest()}
+
+
+class ZipLayout:
+    """
+    zipimport 安装布局：包的文件不解压，整体放在 site-packages/<包名>-<版本>.cip.zip 中，由 <包名>.cip.pth 把归档加入 sys.path
+    zipimport 不会写回字节码，只认源文件旁边的 <模块>.pyc，因此归档中同时放入目标解释器版本的字节码；
+    字节码使用基于哈希、导入时不检查的格式：归档在安装时校验一次，之后内容不会再变化
+    归档名带版本号，升级时写入新文件而不是覆盖正在被其他进程读取的旧归档
+    """
+
+    def __init__(self, site_packages_dir, package_name, version, python_info):
+        self.site_packages_dir = Path(site_packages_dir)
+        self.archive_name = f"{package_name}-{version}{ZIP_LAYOUT_SUFFIX}"
+        self.pth_name = f"{package_name}{ZIP_LAYOUT_PTH_SUFFIX}"
+        self.path = self.site_packages_dir / self.archive_name
+        self.python_info = python_info
+        # 需要编译的源文件 {包内路径: 磁盘上的路径}，以及可以直接使用的随包字节码 {源文件包内路径: .pyc 数据}
+        self.sources = {}
+        self.bytecode = {}
+        self.work_dir = Path(tempfile.mkdtemp(prefix="cip-zip-"))
+        self.site_packages_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = self.path.with_name(f"{self.archive_name}.{os.getpid()}.tmp")
+        self.zipf = zipfile.ZipFile(self.tmp_path, "w")
+
+    def _shipped_bytecode(self, zipf, members):
+        """
+        从字节码成员中挑出与目标解释器匹配的、基于哈希的 .pyc
+        :return: {源文件包内路径: .pyc 数据}
+        """
+        if self.python_info is None:
+            return {}
+        magic = bytes.fromhex(self.python_info["magic"])
+        suffix = f".{self.python_info['cache_tag']}.pyc"
+        shipped = {}
+        for info in members:
+            directory, _, name = info.filename.rpartition("__pycache__/")
+            if not name.endswith(suffix):
+                continue
+            data = zipf.read(info)
+            if len(data) >= 16 and data[:4] == magic and struct.unpack("<I", data[4:8])[0] & 0b1:
+                shipped[f"{directory}{name[:-len(suffix)]}.py"] = data
+        return shipped
+
+    def copy_members(self, zipf, members):
+        """
+        把 pack.zip 中一个顶层包的成员原样复制到归档中（直接复制压缩数据，不解压也不重新压缩）
+        """
+        files, bytecode = split_bytecode(members)
+        shipped = self._shipped_bytecode(zipf, bytecode)
+        for info in files:
+            copy = zipfile.ZipInfo(info.filename, info.date_time)
+            copy.compress_type = info.compress_type
+            copy.external_attr = info.external_attr
+            copy.CRC, copy.file_size, copy.compress_size = info.CRC, info.file_size, info.compress_size
+            write_compressed_member(self.zipf, copy, read_raw_member(zipf, info))
+            if not info.filename.endswith(".py"):
+                continue
+            if info.filename in shipped:
+                self.bytecode[info.filename] = shipped[info.filename]
+            else:
+                # 没有可用的随包字节码，解出源码留给目标解释器编译
+                dest = (self.work_dir / info.filename).resolve()
+                if self.work_dir.resolve() not in dest.parents:
+                    raise ValueError(f"非法的文件路径: {info.filename}")
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                dest.write_bytes(zipf.read(info))
+                self.sources[info.filename] = dest
+
+    def add_file(self, path, arcname):
+        """
+        把磁盘上的文件加入归档（从解压布局转换时使用）
+        """
+        self.zipf.write(path, arcname, compress_type=zipfile.ZIP_DEFLATED)
+        if arcname.endswith(".py"):
+            self.sources[arcname] = Path(path)
+
+    @traced("install.zipimport")
+    def finish(self):
+        """
+        写入字节码并校验归档，然后替换到位、写入 .pth
+        :return: 登记表的文件清单 {相对路径: {"size", "crc", "sha256"}}
+        """
+        try:
+            if self.python_info is not None:
+                compiled_dir = self.work_dir / "__compiled__"
+                rows = [(path, compiled_dir / f"{arcname[:-3]}.pyc", os.path.join(os.path.abspath(self.path), *arcname.split("/")))
+                        for arcname, path in self.sources.items()]
+                errors = run_bytecode_compiler(self.python_info["executable"], rows, "UNCHECKED_HASH")
+                if errors:
+                    click.echo(f"{YELLOW}警告:{WHITE} 部分文件编译字节码失败，导入时将从源码编译:\n{errors}", err=True)
+                for arcname in self.sources:
+                    pyc_path = compiled_dir / f"{arcname[:-3]}.pyc"
+                    if pyc_path.exists():
+                        self.zipf.write(pyc_path, f"{arcname[:-3]}.pyc", compress_type=zipfile.ZIP_DEFLATED)
+                for arcname, data in self.bytecode.items():
+                    self.zipf.writestr(f"{arcname[:-3]}.pyc", data, compress_type=zipfile.ZIP_DEFLATED)
+            self.zipf.close()
+            # 安装时完整校验一次所有成员的 CRC
+            with zipfile.ZipFile(self.tmp_path, "r") as zipf:
+                bad = zipf.testzip()
+            if bad is not None:
+                raise ValueError(f"zipimport 归档校验失败: {bad}")
+            os.replace(self.tmp_path, self.path)
+            pth_path = self.site_packages_dir / self.pth_name
+            tmp_pth = pth_path.with_name(f"{self.pth_name}.{os.getpid()}.tmp")
+            with open(tmp_pth, "w", encoding="utf-8") as f:
+                f.write(f"{self.archive_name}\n")
+            os.replace(tmp_pth, pth_path)
+        except BaseException:
+            self.abort()
+            raise
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        return {self.archive_name: file_record(self.path), self.pth_name: file_record(pth_path)}
+
+    def abort(self):
+        """
+        放弃安装，删除未完成的归档和临时文件
+        """
+        self.zipf.close()
+        self.tmp_path.unlink(missing_ok=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class PackageStore:
+    """
+    全局的已解压包仓库：~/.cip/store/<.cpack 的 SHA-256>/ 中保存解压后的目录树（tree）和文件清单（files.json）
+    安装到各个解释器时从这里硬链接（或 reflink、复制）文件，同一个包无论装到多少个 Python 中都只占一份磁盘空间，
+    仓库中已有的包安装到新环境只需要少量元数据操作；同一 cache_tag 的字节码也只在仓库中编译一次
+    注意硬链接的文件在各个环境之间共享，直接修改已安装的文件会影响所有链接到它的环境
+    """
+
+    def __init__(self, root=STORE_DIR, mode=None):
+        self.root = Path(root)
+        self.mode = mode or get_config("store", default=DEFAULT_STORE_MODE) or DEFAULT_STORE_MODE
+        if self.mode not in STORE_MODES:
+            raise ValueError(f"配置项 store 的值无效: {self.mode}（可选 {', '.join(STORE_MODES)}）")
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def entries(self):
+        if not self.root.exists():
+            return []
+        return sorted(entry for entry in self.root.iterdir() if entry.is_dir() and not entry.name.startswith("."))
+
+    def _load(self, entry_dir):
+        """
+        读取仓库条目的文件清单，并用 stat 确认目录树完整（文件都在、大小没有被改动）
+        :return: 文件清单，条目不存在或已损坏时返回 None
+        """
+        try:
+            with open(entry_dir / "files.json", "r") as f:
+                files = json.load(f)
+            for path, info in files.items():
+                if (entry_dir / "tree" / path).stat().st_size != info["size"]:
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return files
+
+    def _reuse(self, previous_tree, tree, relpath):
+        """
+        把上一个版本的仓库条目中的文件（连同其 __pycache__ 中的字节码）硬链接到新的目录树
+        :return: 是否成功，失败时由调用方重新解压
+        """
+        src = previous_tree / relpath
+        dest = (tree / relpath).resolve()
+        if tree.resolve() not in dest.parents:
+            raise ValueError(f"非法的文件路径: {relpath}")
+        linked = []
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.link(src, dest)
+            linked.append(dest)
+            if dest.suffix == ".py":
+                for pyc in (src.parent / "__pycache__").glob(f"{src.stem}.*.pyc"):
+                    (dest.parent / "__pycache__").mkdir(exist_ok=True)
+                    os.link(pyc, dest.parent / "__pycache__" / pyc.name)
+                    linked.append(dest.parent / "__pycache__" / pyc.name)
+        except OSError:
+            for path in linked:
+                path.unlink(missing_ok=True)
+            return False
+        return True
+
+    def _extract(self, entry_dir, inner, members, previous_dir=None):
+        """
+        解压到临时目录，完成后改名为正式目录，中途失败或多个进程同时安装时都不会留下不完整的目录树
+        已有的正式目录只会被改名移开、不会被直接删除，避免误删其他进程刚放入的完整目录树
+        :param previous_dir: 已安装的旧版本的仓库条目，大小和 CRC 都没变的文件从中硬链接，不再解压
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root / f".{entry_dir.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        previous_files = self._load(previous_dir) if previous_dir is not None and previous_dir != entry_dir else None
+        try:
+            files = {}
+            for package_members in members.values():
+                package_files, _ = split_bytecode(package_members)
+                changed = []
+                for info in package_files:
+                    old = previous_files.get(info.filename) if previous_files else None
+                    if (old is not None and old["size"] == info.file_size and old["crc"] == info.CRC
+                            and self._reuse(previous_dir / "tree", tmp_dir / "tree", info.filename)):
+                        files[info.filename] = old
+                    else:
+                        changed.append(info)
+                files.update(extract_members(inner, changed, tmp_dir / "tree"))
+            with open(tmp_dir / "files.json", "w") as f:
+                json.dump(files, f)
+            for attempt in range(2):
+                try:
+                    os.rename(tmp_dir, entry_dir)
+                    break
+                except OSError:
+                    existing = self._load(entry_dir)
+                    if existing is not None:
+                        # 其他进程已经放入了同一个包
+                        return existing
+                    if attempt:
+                        raise
+                    # 已有的条目已损坏：改名移到临时目录（由 prune 清理）后重试
+                    with contextlib.suppress(FileNotFoundError):
+                        os.rename(entry_dir, self.root / f".{entry_dir.name}.{os.getpid()}.{time.time_ns()}.tmp")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return files
+
+    @traced("store.prepare")
+    def prepare(self, archive_sha256, inner, members, python_info=None, previous_sha256=None):
+        """
+        确保仓库中有该 .cpack 解压后的目录树，并在仓库中为目标解释器准备好字节码
+        :param archive_sha256: .cpack 的 SHA-256
+        :param inner: 已打开的 pack.zip
+        :param members: group_members 的分组结果
+        :param python_info: 目标解释器信息，None 时不准备字节码
+        :param previous_sha256: 升级时已安装版本的 .cpack 的 SHA-256，未变化的文件直接复用它在仓库中的目录树
+        :return: (目录树, 文件清单, 预编译数, 随包字节码数)
+        """
+        entry_dir = self.root / archive_sha256
+        files = self._load(entry_dir)
+        if files is None:
+            previous_dir = self.root / previous_sha256 if previous_sha256 else None
+            files = self._extract(entry_dir, inner, members, previous_dir)
+        tree = entry_dir / "tree"
+        compiled = shipped = 0
+        if python_info is not None:
+            sources = [path for path in files if path.endswith(".py")]
+            bytecode = [info for package_members in members.values() for info in split_bytecode(package_members)[1]]
+            if bytecode:
+                shipped = install_bytecode(inner, bytecode, tree, sources, python_info)
+            compiled = compile_sources(tree, sources, python_info)
+        return tree, files, compiled, shipped
+
+    @traced("store.link")
+    def link(self, tree, files, package_name, site_packages_dir, python_info=None, installed=None):
+        """
+        把仓库中一个顶层包的文件链接到 site-packages，已经指向仓库中同一文件的跳过；目标解释器的字节码一并链接
+        :param installed: 登记表中已安装的文件，大小和 CRC 都没变且磁盘上的文件还在的跳过（升级时只处理变化的文件）
+        :return: (文件清单, {方式: 文件数})
+        """
+        site_packages_dir = Path(site_packages_dir).resolve()
+        installed = installed or {}
+        manifest = {}
+        used = collections.Counter()
+        created_dirs = set()
+        for path, info in files.items():
+            if path.split("/", 1)[0] != package_name:
+                continue
+            previous = installed.get(path)
+            if previous is not None and previous["size"] == info["size"] and previous["crc"] == info["crc"]:
+                dest = site_packages_dir / path
+                if dest.is_file() and dest.stat().st_size == info["size"]:
+                    manifest[path] = previous
+                    used["unchanged"] += 1
+                    continue
+            paths = [path]
+            if python_info is not None and path.endswith(".py"):
+                pyc_name = pyc_name_for(path, python_info["cache_tag"])
+                if (tree / pyc_name).exists():
+                    paths.append(pyc_name)
+            for relpath in paths:
+                src = tree / relpath
+                dest = (site_packages_dir / relpath).resolve()
+                if site_packages_dir not in dest.parents:
+                    raise ValueError(f"非法的文件路径: {relpath}")
+                try:
+                    if os.path.samefile(src, dest):
+                        used["unchanged"] += 1
+                        continue
+                except OSError:
+                    pass
+                if dest.parent not in created_dirs:
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    created_dirs.add(dest.parent)
+                used[link_file(src, dest, self.mode)] += 1
+            manifest[path] = info
+        return manifest, used
+
+    def _scan(self):
+        """
+        升级时未变化的文件在新旧条目之间共用同一个 inode，链接数要扣除仓库内部的链接才能判断是否被环境使用
+        :return: ([(条目目录, [文件 stat])]（按修改时间从旧到新）, {(st_dev, st_ino): 仓库内的链接数})
+        """
+        entries = []
+        counts = collections.Counter()
+        for entry_dir in self.entries():
+            stats = [file.stat() for file in (entry_dir / "tree").rglob("*") if file.is_file()]
+            counts.update((stat.st_dev, stat.st_ino) for stat in stats)
+            entries.append((entry_dir, stats))
+        entries.sort(key=lambda item: item[0].stat().st_mtime)
+        return entries, counts
+
+    def stats(self):
+        """
+        :return: {"entries", "in_use", "files", "size"}，in_use 为至少有一个文件被链接到某个环境中的条目数，
+                 size 只计算一次条目之间共用的文件
+        """
+        result = {"entries": 0, "in_use": 0, "files": 0, "size": 0}
+        entries, counts = self._scan()
+        seen = set()
+        for _, stats in entries:
+            for stat in stats:
+                result["files"] += 1
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    result["size"] += stat.st_size
+            result["entries"] += 1
+            result["in_use"] += any(stat.st_nlink > counts[stat.st_dev, stat.st_ino] for stat in stats)
+        return result
+
+    def prune(self):
+        """
+        删除没有被任何环境链接的条目，以及中断的安装留下的临时目录
+        条目中被环境链接的文件如果还被其他条目共用（升级时复用的未变化文件），该条目同样可以删除，从旧到新依次判断，
+        保证每个仍被使用的文件至少留在一个条目中
+        复制或 reflink 安装的条目不会被链接，也会被删除，下次安装时重新解压
+        :return: (删除的条目数, 释放的字节数)
+        """
+        removed = freed = 0
+        entries, counts = self._scan()
+        totals = collections.Counter(counts)
+        for entry_dir, stats in entries:
+            keys = [(stat.st_dev, stat.st_ino) for stat in stats]
+            if any(stat.st_nlink > counts[key] and counts[key] == 1 for stat, key in zip(stats, keys)):
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            removed += 1
+            for stat, key in zip(stats, keys):
+                counts[key] -= 1
+                if counts[key] == 0 and stat.st_nlink == totals[key]:
+                    freed += stat.st_size
+        if self.root.exists():
+            # 一小时内的临时目录可能属于正在进行的安装
+            for tmp_dir in self.root.glob(".*.tmp"):
+                if time.time() - tmp_dir.stat().st_mtime > 3600:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+        return removed, freed
+
+
+class InstallRegistry:
+    """
+    已安装包登记表（SQLite）
+    记录某个 site-packages 中通过 cip 安装的包：包名、版本、来源 .cpack 的 SHA-256，
+    以及每个文件的大小、CRC 和 SHA-256，查询某个包不需要遍历目录
+    """
+
+    def __init__(self, site_packages_dir, readonly=False):
+        """
+        :param readonly: 只读打开，不创建 site-packages 目录和登记表文件；登记表不存在时视为没有安装任何包
+        """
+        self.site_packages_dir = Path(site_packages_dir)
+        self.path = self.site_packages_dir / REGISTRY_NAME
+        self.readonly = readonly
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None and self.readonly and self.path.exists():
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+        if self._conn is None:
+            if self.readonly:
+                # 还没有安装过任何包：使用内存中的空登记表
+                conn = sqlite3.connect(":memory:")
+            else:
+                self.site_packages_dir.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS packages (
+                        name TEXT PRIMARY KEY,
+                        version TEXT NOT NULL,
+                        archive_sha256 TEXT NOT NULL,
+                        top_levels TEXT NOT NULL,
+                        installed_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS files (
+                        path TEXT PRIMARY KEY,
+                        package TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        crc INTEGER NOT NULL,
+                        sha256 TEXT NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS files_package ON files (package)")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, name):
+        """
+        查询已安装的包
+        :return: {"name", "version", "archive_sha256", "top_levels", "installed_at", "files"}，未安装时返回 None
+        """
+        row = self.conn.execute("SELECT * FROM packages WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        count = self.conn.execute("SELECT COUNT(*) FROM files WHERE package = ?", (name,)).fetchone()[0]
+        return {**dict(row), "top_levels": json.loads(row["top_levels"]), "files": count}
+
+    def packages(self):
+        return [{**dict(row), "top_levels": json.loads(row["top_levels"])}
+                for row in self.conn.execute("SELECT * FROM packages ORDER BY name")]
 
+    def files(self, name):
+        """
+        :return: {相对路径: {"size", "crc", "sha256"}}
+        """
+        return {row["path"]: {"size": row["size"], "crc": row["crc"], "sha256": row["sha256"]}
+                for row in self.conn.execute("SELECT * FROM files WHERE package = ?", (name,))}
 
-def setup_config():
+    def record(self, name, version, archive_sha256, top_levels, files):
+        """
+        登记（或覆盖）一个包及其完整的文件清单
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE package = ?", (name,))
+            self.conn.execute("INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)",
+                              (name, version, archive_sha256, json.dumps(sorted(top_levels)), time.time()))
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                  [(path, name, info["size"], info["crc"], info["sha256"]) for path, info in files.items()])
+
+    def remove(self, name):
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE package = ?", (name,))
+            self.conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+    def commit_install(self, name, version, archive_sha256, manifest, installed_top_levels):
+        """
+        安装、升级或转换布局完成后更新登记表，并删除旧版本中有、新版本中已经没有的文件
+        :param archive_sha256: 来源 .cpack 的 SHA-256
+        :param manifest: 本次写入（或确认未变化）的文件清单
+        :param installed_top_levels: 本次实际安装的顶层包，跳过的顶层包保留旧版本的文件
+        """
+        previous = self.files(name)
+        files = dict(manifest)
+        stale = []
+        for path, info in previous.items():
+            if path in files:
+                continue
+            # 旧的 zipimport 归档总是被本次安装取代（换成新版本的归档或解压后的文件）
+            if path.split("/", 1)[0] in installed_top_levels or is_zip_layout_file(path):
+                stale.append(path)
+            else:
+                files[path] = info
+        remove_installed_files(self.site_packages_dir, stale)
+        top_levels = {path.split("/", 1)[0] for path in files if not is_zip_layout_file(path)}
+        if zip_layout_archive(files) is not None:
+            top_levels |= installed_top_levels
+        self.record(name, version, archive_sha256, top_levels, files)
+        return stale
+
+
+def _compress_batch(batch, compress_type, level):
     """
-    配置 cip
+    在工作进程中压缩一批文件
+    :return: [(ZipInfo, 压缩后的数据, 原始内容的 SHA-256), ...]
     """
-    config = configparser.ConfigParser()
-    config_path = Path("~/.cip/config.ini").expanduser()
-    if not config_path.exists():
-        config_path.parent.mkdir(exist_ok=True)
-        config['CONFIG'] = {
-            'lang': 'zh-CN',
-            'web_url': 'https://cip.zhiyuhub.top',
-            'version': CIP_VERSION
-            }
-        with open(config_path, 'w') as configfile:
-            config.write(configfile)
-    try:
-        config = configparser.ConfigParser()
-        config.read(config_path)
-        if config['CONFIG']['version']!= CIP_VERSION:
-            click.echo(f"{RED}{BOLD}警告:{WHITE} 配置文件版本不是{CIP_VERSION}，可能存在兼容性问题。")
-            # 修改配置文件版本
-            config['CONFIG']['version'] = CIP_VERSION
-            with open(config_path, 'w') as configfile:
-                config.write(configfile)
-    except Exception as e:
-        click.echo(f"{RED}{BOLD}错误:{WHITE} 读取配置文件失败。")
-        click.echo(f"{RED}{BOLD}错误信息:{WHITE} {e}")
-        click.echo(f"请使用cip reset命令重新生成配置文件。")
-        #sys.exit(1)
+    results = []
+    for path, arcname in batch:
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        info.compress_type = compress_type
+        with open(path, "rb") as f:
+            data = f.read()
+        info.file_size = len(data)
+        info.CRC = zlib.crc32(data)
+        sha256 = hashlib.sha256(data).hexdigest()
+        data = compress_member_data(data, compress_type, level)
+        info.compress_size = len(data)
+        results.append((info, data, sha256))
+    return results
+
 
-def get_config(key):
+def compress_members(files, compression="deflate", level=None, jobs=None):
     """
-    获取配置
+    并行压缩 pack.zip 的成员，按输入顺序逐个产出结果
+    小文件按批提交以减少进程间通信开销，同时只保留有限数量的批次在途，避免占用过多内存
+    :param files: [(文件路径, 压缩包内路径), ...]
+    :param compression: 压缩算法名，见 COMPRESSION_METHODS
+    :param level: 压缩级别
+    :param jobs: 进程数
     """
-    config_path = Path("~/.cip/config.ini").expanduser()
-    if not config_path.exists():
-        click.echo("{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
-        return
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    if key not in config['CONFIG']:
-        if config['CONFIG']['lang'] == 'zh-CN':
-            click.echo(f"{RED}{BOLD}ERROR:{WHITE} 配置项 {key} 不存在。")
-        else:
-            click.echo(f"{RED}{BOLD}ERROR:{WHITE} Config item {key} does not exist.")
+    compress_type = COMPRESSION_METHODS[compression]
+    batches = []
+    batch = []
+    batch_size = 0
+    for path, arcname in files:
+        batch.append((path, arcname))
+        batch_size += os.path.getsize(path)
+        if batch_size >= COMPRESS_BATCH_SIZE:
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+    if batch:
+        batches.append(batch)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(batches) <= 1:
+        for batch in batches:
+            yield from _compress_batch(batch, compress_type, level)
         return
-    return config['CONFIG'][key]
+
+    with concurrent_futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        batch_iter = iter(batches)
+        for batch in batch_iter:
+            pending.append(executor.submit(_compress_batch, batch, compress_type, level))
+            if len(pending) >= jobs * 2:
+                break
+        while pending:
+            results = pending.popleft().result()
+            for batch in batch_iter:
+                pending.append(executor.submit(_compress_batch, batch, compress_type, level))
+                break
+            yield from results
 
 
-def find_python_path():
+@functools.lru_cache(maxsize=None)
+def raw_zip_supported():
     """
-    查找Python安装路径
+    当前 Python 的 zipfile 能否直接读写成员的压缩数据
+    zipfile 没有读写预压缩数据的公开接口，read_raw_member 和 write_compressed_member 用到了 ZipFile 的内部实现
+    （fp、_writecheck、_didModify、NameToInfo、start_dir），只在验证过的版本上使用
     """
-    def find_python_in_directory(directory):
-        paths = []
-        if os.name == 'nt':
-            for path in directory.glob("**/python.exe"):
-                click.echo(f"{BLUE}已找到{path.parent}中的Python:{WHITE}")
-                paths.append(str(path.parent))  # 返回Python安装目录
-        else:
-            for path in directory.glob("python*"):
-                click.echo(f"{BLUE}已找到{path.parent}中的Python:{WHITE}")
-                if path.is_file() and os.access(path, os.X_OK):
-                    paths.append(str(path.parent))  # 返回Python安装目录
-        return paths
+    low, high = RAW_ZIP_VERSIONS
+    return low <= sys.version_info[:2] <= high and hasattr(zipfile.ZipFile, "_writecheck") and hasattr(zipfile.ZipInfo, "FileHeader")
 
-    # 首先尝试从默认安装路径中查找
-    if os.name == 'nt':
-        default_path = Path(os.path.expanduser("~")) / "AppData" / "Local" / "Programs" / "Python"
+
+def compress_member_data(data, compress_type, level=None):
+    """
+    按 zip 成员的格式压缩数据，与 zipfile 使用相同的参数，结果可以交给 write_compressed_member 写入
+    """
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(-1 if level is None else level, zlib.DEFLATED, -15)
+    elif compress_type == zipfile.ZIP_BZIP2:
+        import bz2
+        compressor = bz2.BZ2Compressor(9 if level is None else level)
+    elif compress_type == zipfile.ZIP_LZMA:
+        import lzma
+        # zip 中的 LZMA 成员：版本号、属性长度和 LZMA1 属性，之后是带结束标记的原始数据流
+        lc, lp, pb, dict_size = 3, 0, 2, 1 << 23
+        props = struct.pack("<BI", (pb * 5 + lp) * 9 + lc, dict_size)
+        compressor = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[
+            {"id": lzma.FILTER_LZMA1, "lc": lc, "lp": lp, "pb": pb, "dict_size": dict_size},
+        ])
+        return struct.pack("<BBH", 9, 4, len(props)) + props + compressor.compress(data) + compressor.flush()
     else:
-        default_path = Path("/usr/local/bin")
+        return data
+    return compressor.compress(data) + compressor.flush()
 
-    python_paths = find_python_in_directory(default_path)
-    
-    if python_paths:
-        # 如果找到多个路径，提示用户选择
-        if len(python_paths) > 1:
-            click.echo(f"{BLUE}找到多个Python安装路径，请选择一个:{WHITE}")
-            for idx, path in enumerate(python_paths, start=1):
-                click.echo(f"{idx}: {path} 版本：{path.split('\\')[-1]}")
-            choice = click.prompt("请输入选择的数字", type=int)
-            return python_paths[choice - 1]
-        else:
-            return python_paths[0]
 
-    # 如果默认路径未找到，提示用户手动输入路径
-    click.echo("未找到Python安装路径，请手动输入路径:")
-    python_dir = click.prompt("Python 安装目录 (输入 'All' 查找整个电脑)", type=str)
-    
-    if python_dir.lower() == 'all':
-        # 查找整个电脑
-        if os.name == 'nt':
-            # Windows 系统
-            drives = [f"{d}:\\" for d in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" if os.path.exists(f"{d}:\\")]
-            for drive in drives:
-                drive_path = Path(drive)
-                python_paths.extend(find_python_in_directory(drive_path))
-        else:
-            # Unix/Linux 系统
-            root_path = Path("/")
-            python_paths.extend(find_python_in_directory(root_path))
-    else:
-        custom_path = Path(python_dir)
-        python_paths = find_python_in_directory(custom_path)
-    
-    if python_paths:
-        if len(python_paths) > 1:
-            click.echo(f"{BLUE}找到多个Python安装路径，请选择一个:{WHITE}")
-            for idx, path in enumerate(python_paths, start=1):
-                # 计算版本
-                import subprocess
-                version = subprocess.run([str(os.path.join(path, "python")), "--version"], capture_output=True, text=True).stdout.strip()
-                if version.startswith("Python "):
-                    pass
-                else:
-                    version = "未激活的虚拟环境或其他"
-                click.echo(f"{idx}: {path} 版本：{version}")
-            choice = click.prompt("请输入选择的数字", type=int)
-            return python_paths[choice - 1]
-        else:
-            return python_paths[0]
+def decompress_member_data(data, compress_type):
+    """
+    解压 zip 成员的压缩数据（compress_member_data 的逆操作）
+    """
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(data, -15)
+    if compress_type == zipfile.ZIP_BZIP2:
+        import bz2
+        return bz2.decompress(data)
+    if compress_type == zipfile.ZIP_LZMA:
+        import lzma
+        props_size = struct.unpack("<H", data[2:4])[0]
+        props, dict_size = struct.unpack("<BI", data[4:9])
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[
+            {"id": lzma.FILTER_LZMA1, "lc": props % 9, "lp": props // 9 % 5, "pb": props // 45, "dict_size": dict_size},
+        ])
+        return decompressor.decompress(data[4 + props_size:])
+    return data
 
-    click.echo("未找到有效的Python安装路径。")
-    return None
+
+def read_raw_member(zipf, info):
+    """
+    读取 zip 成员压缩后的原始数据（不解压），用于原样复制到另一个 zip 中
+    不支持直接读取时解压后重新压缩
+    """
+    if not raw_zip_supported():
+        return compress_member_data(zipf.read(info), info.compress_type)
+    zipf.fp.seek(info.header_offset)
+    header = zipf.fp.read(30)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    zipf.fp.seek(info.header_offset + 30 + name_len + extra_len)
+    return zipf.fp.read(info.compress_size)
+
+
+def write_compressed_member(zipf, info, data):
+    """
+    将已压缩好的数据作为一个成员写入 ZipFile，按 ZipFile.writestr 的方式直接写本地文件头和数据；
+    不支持直接写入时解压后交给 writestr 重新压缩（此时 info 的压缩后大小由 writestr 更新）
+    :param zipf: 以写模式打开的 ZipFile
+    :param info: 已填好 CRC、大小和压缩方式的 ZipInfo
+    :param data: 压缩后的数据
+    :return: 压缩数据在 zip 中的起始偏移，退回到 writestr 时返回 None
+    """
+    if not raw_zip_supported():
+        zipf.writestr(info, decompress_member_data(data, info.compress_type))
+        return None
+    if info.compress_type == zipfile.ZIP_LZMA:
+        # LZMA 成员需要设置 EOS 标志位，与 zipfile 自身写出的一致
+        info.flag_bits |= 0x02
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    info.header_offset = zipf.fp.tell()
+    zipf._writecheck(info)
+    zipf._didModify = True
+    header = info.FileHeader(zip64)
+    zipf.fp.write(header)
+    zipf.fp.write(data)
+    zipf.filelist.append(info)
+    zipf.NameToInfo[info.filename] = info
+    zipf.start_dir = zipf.fp.tell()
+    return info.header_offset + len(header)
+
+
+class BuildCache:
+    """
+    create_cpack 的增量构建缓存
+    记录上一次构建出的 .cpack 中每个成员压缩数据的位置，以及对应源文件的大小、mtime 和 SHA-256；
+    再次构建时内容未变化的文件直接从上一次的 .cpack 中按字节复制压缩数据，只需读取源文件计算哈希，不再压缩
+    """
+
+    def __init__(self, package_name, cache_dir=BUILD_CACHE_DIR):
+        self.path = Path(cache_dir) / f"{package_name}.json"
+        self.archive = None
+        self.members = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            archive = data["archive"]
+            stat = os.stat(archive["path"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        # 上一次的 .cpack 被删除或改动过时，记录的偏移不再可信
+        if stat.st_size == archive["size"] and stat.st_mtime_ns == archive["mtime_ns"]:
+            self.archive = archive["path"]
+            self.members = data["members"]
+
+    def match(self, arcname, path, stat, compress_type, level):
+        """
+        判断源文件能否复用上一次的压缩数据：大小相同时总是用 SHA-256 确认内容，
+        在 mtime 精度内被改写、或者改写后恢复了原来 mtime 的文件不会复用旧数据
+        :return: 缓存条目，不能复用时返回 None
+        """
+        entry = self.members.get(arcname)
+        if (entry is None or "offset" not in entry or entry["compress_type"] != compress_type or entry["level"] != level
+                or entry["size"] != stat.st_size):
+            return None
+        if file_sha256(path) != entry["sha256"]:
+            return None
+        return entry
+
+    def save(self, archive_path, members):
+        """
+        :param archive_path: 本次构建出的 .cpack
+        :param members: {压缩包内路径: 缓存条目}
+        """
+        stat = os.stat(archive_path)
+        data = {
+            "archive": {"path": str(Path(archive_path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "members": members,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+@traced("create.bytecode")
+def bytecode_interpreter(python_dir=None):
+    """
+    确定 --with-bytecode 使用的解释器
+    指定了 Python 目录时使用其中的解释器；打包成可执行文件后 sys.executable 是 cip 自身，改为查找已安装的 Python
+    :param python_dir: 用户指定的 Python 安装目录
+    :return: 解释器可执行文件路径
+    """
+    if python_dir is None:
+        if not getattr(sys, 'frozen', False):
+            return sys.executable
+        python_dir = require_python_path()
+    python_info = python_info_for(python_dir)
+    if python_info is None:
+        raise FileNotFoundError(f"{python_dir} 中没有可运行的 Python 解释器。")
+    return python_info["executable"]
 
 
+def build_bytecode(package_name, files, executables, jobs=None, force=False, cache_dir=BUILD_CACHE_DIR):
+    """
+    用指定的解释器为源文件编译随包发布的字节码
+    使用 UNCHECKED_HASH 模式，.pyc 不依赖源文件的 mtime，同样的源文件总是得到同样的字节码（安装时再换成基于时间戳的头部）；
+    编译结果保存在 .cip-build/bytecode/<包名>/<cache_tag>/ 中，源文件没有更新时不再重新编译，增量构建缓存也能直接复用
+    :param files: [(源文件路径, 包内路径), ...]
+    :param executables: 解释器可执行文件路径或命令名
+    :param force: 为 True 时忽略已有的编译结果
+    :return: ({cache_tag: 魔数}, [(.pyc 路径, 包内路径), ...])
+    """
+    resolved = []
+    for executable in executables:
+        path = shutil.which(executable) or executable
+        if not is_python_executable(path):
+            raise FileNotFoundError(f"{path} 不是可用的 Python 解释器。")
+        resolved.append(os.path.abspath(path))
+    pythons = {python["dir"]: python for python in probe_pythons(resolved)}
+
+    tags = {}
+    outputs = []
+    for executable in resolved:
+        python = pythons.get(os.path.dirname(executable))
+        if python is None or not python["cache_tag"]:
+            raise FileNotFoundError(f"无法运行解释器 {executable}。")
+        if python["cache_tag"] in tags:
+            continue
+        tags[python["cache_tag"]] = python["magic"]
+        output_dir = Path(cache_dir) / "bytecode" / package_name / python["cache_tag"]
+        rows = []
+        for path, arcname in files:
+            if not arcname.endswith(".py"):
+                continue
+            pyc_arcname = pyc_name_for(arcname, python["cache_tag"])
+            pyc_path = output_dir / pyc_arcname
+            if force or not pyc_path.exists() or pyc_path.stat().st_mtime_ns < os.stat(path).st_mtime_ns:
+                rows.append((path, pyc_path, arcname))
+            outputs.append((str(pyc_path), pyc_arcname))
+        errors = run_bytecode_compiler(python["executable"], rows, "UNCHECKED_HASH", jobs)
+        if errors:
+            raise ValueError(f"Python {python['version']} 编译字节码失败:\n{errors}")
+    return tags, outputs
+
 
 class CPackTool:
     @staticmethod
-    def create_cpack(package_name, version, package_dirs):
+    @traced("create")
+    def create_cpack(package_name, version, package_dirs, compression="deflate", level=None, jobs=None, use_build_cache=True,
+                     bytecode_pythons=None):
         """
         创建 .cpack 包
         :param package_name: 包名
         :param version: 版本号
         :param package_dirs: 包含 __init__.py 的多个 Python 包目录
+        :param compression: pack.zip 成员的压缩算法，可选 stored/deflate/bzip2/lzma
+        :param level: 压缩级别，None 表示使用算法默认值
+        :param jobs: 并行压缩的进程数，None 表示使用全部 CPU
+        :param use_build_cache: 是否使用 .cip-build 中的增量构建缓存
+        :param bytecode_pythons: 为这些解释器生成随包字节码，None 表示不附带字节码
         """
         # 检查所有包目录是否有效
         package_dirs = [Path(d) for d in package_dirs]
         for package_dir in package_dirs:
             if not (package_dir / "__init__.py").exists():
-                config = configparser.ConfigParser()
-                config_path = Path("~/.cip/config.ini").expanduser()
-                config.read(config_path)
-                if config['CONFIG']['lang'] == 'zh-CN':
+                if cip_config.get('lang') == 'zh-CN':
                     raise FileNotFoundError(f"{RED}{BOLD}目录 {package_dir} 不是有效的 Python 包（缺少 __init__.py）。{WHITE}")
                 else:
                     raise FileNotFoundError(f"{RED}{BOLD}Directory {package_dir} is not a valid Python package (missing __init__.py).{WHITE}")
@@ -177,97 +2145,358 @@ class CPackTool:
             "packages": [str(dir.name) for dir in package_dirs],
             "cip_version": CIP_VERSION
         }
-        pack_json_path = Path(f"{package_name}-{version}.json")
-        with open(pack_json_path, "w") as f:
-            json.dump(pack_data, f, indent=4)
 
-        # 将每个包目录打包为 pack.zip
-        pack_zip_path = Path("pack.zip")
-        with zipfile.ZipFile(pack_zip_path, "w") as zipf:
+        # 收集文件并排序，保证同样的输入得到同样的成员顺序
+        files = []
+        with profiler.span("create.scan"):
             for package_dir in package_dirs:
-                for file in package_dir.rglob("*"):
+                for file in sorted(package_dir.rglob("*")):
                     if file.is_file():
-                        arcname = file.relative_to(package_dir.parent)
-                        zipf.write(file, arcname=arcname)
+                        files.append((str(file), file.relative_to(package_dir.parent).as_posix()))
 
-        # 创建 .cpack 文件
+        # 随包字节码放在 pack.zip 中与源文件对应的 __pycache__ 位置，源码目录里原有的 .pyc 不再打包
+        if bytecode_pythons:
+            files = [(path, arcname) for path, arcname in files if not is_bytecode_member(arcname)]
+            pack_data["bytecode"], bytecode_files = build_bytecode(package_name, files, bytecode_pythons, jobs, force=not use_build_cache)
+            files.extend(bytecode_files)
+
+        # 对比增量构建缓存，找出可以直接复用上一次压缩数据的文件
+        compress_type = COMPRESSION_METHODS[compression]
+        build_cache = BuildCache(package_name) if use_build_cache else None
+        plan = []
+        with profiler.span("create.check"):
+            for path, arcname in files:
+                stat = os.stat(path)
+                entry = build_cache.match(arcname, path, stat, compress_type, level) if build_cache else None
+                plan.append((path, arcname, stat, entry))
+        reused = sum(1 for *_, entry in plan if entry is not None)
+
+        # 创建 .cpack 文件，内层 pack.zip 直接流式写入外层（不压缩存储，安装时可以原地读取）
+        # 先写临时文件：版本号不变时上一次的 .cpack 就是要覆盖的文件，构建过程中还要从中读取
         cpack_path = Path(f"{package_name}-{version}.cpack")
-        with zipfile.ZipFile(cpack_path, "w") as zipf:
-            zipf.write(pack_zip_path, arcname="pack.zip")
-            zipf.write(pack_json_path, arcname="pack.json")
+        tmp_path = cpack_path.with_name(f"{cpack_path.name}.{os.getpid()}.tmp")
+        compressed = compress_members([(path, arcname) for path, arcname, _, entry in plan if entry is None], compression, level, jobs)
+        members = {}
+        positions = {}
+        previous = open(build_cache.archive, "rb") if reused else None
+        try:
+            with zipfile.ZipFile(tmp_path, "w") as outer:
+                with outer.open("pack.zip", "w", force_zip64=True) as pack_stream:
+                    with zipfile.ZipFile(pack_stream, "w") as inner, profiler.span("create.compress", files=len(files), reused=reused):
+                        for path, arcname, stat, entry in plan:
+                            if entry is None:
+                                info, data, sha256 = next(compressed)
+                            else:
+                                info = zipfile.ZipInfo.from_file(path, arcname)
+                                info.compress_type = compress_type
+                                info.file_size = entry["size"]
+                                info.CRC = entry["crc"]
+                                info.compress_size = entry["compress_size"]
+                                previous.seek(entry["offset"])
+                                data = previous.read(entry["compress_size"])
+                                sha256 = entry["sha256"]
+                            position = write_compressed_member(inner, info, data)
+                            if position is not None:
+                                positions[arcname] = position
+                            members[arcname] = {
+                                "size": info.file_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "crc": info.CRC,
+                                "compress_type": compress_type, "level": level, "compress_size": info.compress_size,
+                            }
+                outer.writestr("pack.json", json.dumps(pack_data, indent=4))
+            os.replace(tmp_path, cpack_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            compressed.close()
+            if previous is not None:
+                previous.close()
 
-        # 清理临时文件
-        pack_json_path.unlink()
-        pack_zip_path.unlink()
+        if build_cache is not None:
+            # 记录每个成员的压缩数据在新 .cpack 中的绝对偏移，供下一次构建复用
+            with zipfile.ZipFile(cpack_path, "r") as outer:
+                pack_offset = member_data_offset(cpack_path, outer.getinfo("pack.zip"))
+            for arcname, position in positions.items():
+                members[arcname]["offset"] = pack_offset + position
+            build_cache.save(cpack_path, members)
+
+        if reused:
+            click.echo(f"复用了 {reused}/{len(files)} 个未变化文件的压缩数据")
         click.echo(f"Created {cpack_path}")
 
     @staticmethod
-    def install_cpack(cpack_path):
+    @traced("install.read_manifest")
+    def read_pack_data(cpack_path):
+        """
+        读取 .cpack 中的 pack.json
+        """
+        with zipfile.ZipFile(cpack_path, "r") as outer:
+            return json.loads(outer.read("pack.json"))
+
+    @staticmethod
+    @traced("install.package")
+    def extract_packages(cpack_path, package_names, site_packages_dir, installed=None, python_info=None, zipimport=False, store=None,
+                         previous_sha256=None):
+        """
+        将 .cpack 中指定的顶层包直接写入 site-packages
+        :param cpack_path: .cpack 文件路径
+        :param package_names: 要安装的顶层包名
+        :param site_packages_dir: 目标 site-packages 目录
+        :param installed: 登记表中该包已安装的文件，未变化的文件不再写入
+        :param python_info: 目标解释器信息，不为 None 时使用包中与之匹配的随包字节码
+        :param zipimport: 为 True 时不解压，以 zipimport 布局安装
+        :param store: 包仓库，不为 None 时从仓库链接文件
+        :param previous_sha256: 已安装版本的 .cpack 的 SHA-256，使用仓库时未变化的文件从它的仓库条目复用
+        :return: 安装的文件清单
+        """
+        manifest = {}
+        with zipfile.ZipFile(cpack_path, "r") as outer:
+            with open_nested_zip(cpack_path, outer, "pack.zip") as inner:
+                members = group_members(inner)
+                if zipimport:
+                    pack_data = json.loads(outer.read("pack.json"))
+                    return CPackTool.install_zip_layout(inner, members, package_names, pack_data, site_packages_dir, python_info)
+                if store is not None:
+                    tree, files, _, _ = store.prepare(file_sha256(cpack_path), inner, members, python_info, previous_sha256)
+                    for package_name in package_names:
+                        manifest.update(store.link(tree, files, package_name, site_packages_dir, python_info, installed)[0])
+                    return manifest
+                bytecode = []
+                for package_name in package_names:
+                    package_files, package_bytecode = split_bytecode(members.get(package_name, []))
+                    manifest.update(extract_members(inner, package_files, site_packages_dir, installed))
+                    bytecode.extend(package_bytecode)
+                if python_info is not None and bytecode:
+                    install_bytecode(inner, bytecode, site_packages_dir, [path for path in manifest if path.endswith(".py")], python_info)
+        return manifest
+
+    @staticmethod
+    def install_zip_layout(inner, members, package_names, pack_data, site_packages_dir, python_info):
+        """
+        把指定的顶层包以 zipimport 布局安装
+        :param inner: 已打开的 pack.zip
+        :param members: group_members 的分组结果
+        :return: 安装的文件清单（归档和 .pth）
+        """
+        layout = ZipLayout(site_packages_dir, pack_data["name"], pack_data["version"], python_info)
+        try:
+            for package_name in package_names:
+                layout.copy_members(inner, members.get(package_name, []))
+        except BaseException:
+            layout.abort()
+            raise
+        return layout.finish()
+
+    @staticmethod
+    @traced("install")
+    def install_cpack(cpack_path, python_dir=None, assume_yes=False, bytecode=True, zipimport=None, use_store=True):
         """
         安装 .cpack 包
+        直接从 .cpack 中读取内层 pack.zip，一次遍历按顶层包分组，并把文件直接写到 site-packages
         :param cpack_path: .cpack 文件路径
+        :param python_dir: 目标 Python 目录，None 时交互式查找
+        :param assume_yes: 为 True 时不再逐个确认
+        :param bytecode: 是否为目标解释器准备字节码（优先使用随包字节码，其余用进程池预编译）
+        :param zipimport: True 以 zipimport 布局安装，False 解压安装，None 保持已安装版本的布局（新安装时解压）
+        :param use_store: 解压安装时是否通过包仓库（~/.cip/store）链接文件
         """
-        extract_dir = Path("extracted")
-        extract_dir.mkdir(exist_ok=True)
+        lang = get_config("lang", default="zh-CN")
+        archive_sha256 = file_sha256(cpack_path)
+        # 用户取消或解压出错时也要关闭登记表的连接
+        registry = None
+        try:
+            with zipfile.ZipFile(cpack_path, "r") as outer:
+                pack_data = json.loads(outer.read("pack.json"))
+                with open_nested_zip(cpack_path, outer, "pack.zip") as inner:
+                    # 一次遍历 pack.zip，按顶层包名分组
+                    members = group_members(inner)
 
-        with zipfile.ZipFile(cpack_path, "r") as zipf:
-            zipf.extractall(extract_dir)
+                    # 查找Python路径
+                    if python_dir is None:
+                        python_dir = require_python_path(interactive=not assume_yes)
+                    site_packages_dir = site_packages_for(python_dir)
+                    python_info = find_bytecode_target(python_dir) if bytecode else None
+                    registry = InstallRegistry(site_packages_dir)
+                    current = registry.get(pack_data["name"])
+                    installed = registry.files(pack_data["name"]) if current is not None else {}
+                    if zipimport is None:
+                        zipimport = zip_layout_archive(installed) is not None
+                    if current is not None:
+                        click.echo(f"已安装 {pack_data['name']} {current['version']}，将升级为 {pack_data['version']}"
+                                   + ("" if zipimport else "（只写入变化的文件）"))
+                    manifest = {}
+                    installed_top_levels = set()
+                    shipped_bytecode = []
+                    store = PackageStore() if use_store and not zipimport else None
+                    if store is not None and not store.enabled:
+                        store = None
+                    store_entry = None
+                    linked = collections.Counter()
+                    compiled = shipped = 0
 
-        pack_json_path = extract_dir / "pack.json"
-        with open(pack_json_path, "r") as f:
-            pack_data = json.load(f)
+                    # zipimport 布局的全部顶层包在同一个归档中，只确认一次
+                    if zipimport:
+                        if pack_data.get("cip_version") != CIP_VERSION:
+                            click.echo(f"{RED}{BOLD}警告:{WHITE} cip 版本不匹配，可能存在兼容性问题。")
+                        click.echo(f"准备以 zipimport 方式安装: {', '.join(pack_data['packages'])}")
+                        confirm = "y" if assume_yes else prompt("确认安装该包吗？(Y/n)", type=str, default="", show_default=False)
+                        if confirm.lower() in ('y', ''):
+                            manifest = CPackTool.install_zip_layout(inner, members, pack_data["packages"], pack_data, site_packages_dir, python_info)
+                            installed_top_levels = set(pack_data["packages"])
+                            click.echo(f"已安装 {', '.join(pack_data['packages'])} 到 {site_packages_dir / zip_layout_archive(manifest)}")
+                        else:
+                            click.echo(f"跳过安装包: {pack_data['name']}")
 
-        # 查找Python路径
-        python_dir = find_python_path()
-        
+                    for package_name in ([] if zipimport else pack_data["packages"]):
+                        click.echo(f"加载中...")
+                        try:
+                            if pack_data["cip_version"] == CIP_VERSION:
+                                pass
+                            else:
+                                click.echo(f"{RED}{BOLD}警告:{WHITE} cip 版本不匹配，可能存在兼容性问题。")
+                        except:
+                            click.echo(f"{RED}{BOLD}警告:{WHITE} 未知的 cip 版本，可能存在兼容性问题。")
+                        if lang == 'zh-CN':
+                            click.echo(f"准备安装包: {package_name}")
+                        else:
+                            click.echo(f"Preparing to install package: {package_name}")
 
-        site_packages_dir = Path(python_dir) / "Lib" / "site-packages"
-        packages_dir = Path(python_dir) / "Lib"
-        
-        for package_name in pack_data["packages"]:
-            config = configparser.ConfigParser()
-            config_path = Path("~/.cip/config.ini").expanduser()
-            config.read(config_path)
-            click.echo(f"加载中...")
-            try:
-                if pack_data["cip_version"] == CIP_VERSION:
-                    pass
-                else:
-                    click.echo(f"{RED}{BOLD}警告:{WHITE} cip 版本不匹配，可能存在兼容性问题。")
-            except:
-                click.echo(f"{RED}{BOLD}警告:{WHITE} 未知的 cip 版本，可能存在兼容性问题。")
-            if config['CONFIG']['lang'] == 'zh-CN':
-                click.echo(f"准备安装包: {package_name}")
-            else:
-                click.echo(f"Preparing to install package: {package_name}")
-
-            # 确认安装
-            confirm = click.prompt("确认安装该包吗？(Y/n)", type=str)
-            if confirm.lower() == 'y' or confirm.lower() == '':
-                pack_zip_path = extract_dir / "pack.zip"
-                with zipfile.ZipFile(pack_zip_path, "r") as zipf:
-                    for file in zipf.namelist():
-                        if file.startswith(f"{package_name}/"):
-                            
-                            zipf.extract(file, extract_dir)
-
-                shutil.move(extract_dir / package_name, site_packages_dir / package_name)
-                shutil.move(extract_dir / package_name, packages_dir / package_name)
-                if config['CONFIG']['lang'] == 'zh-CN':
-                    click.echo(f"已安装 {package_name} 到 {site_packages_dir / package_name} 和 {packages_dir / package_name}")
-                else:
-                    click.echo(f"Installed {package_name} to {site_packages_dir / package_name} and {packages_dir / package_name}")
-            else:
-                if config['CONFIG']['lang'] == 'zh-CN':
-                    click.echo(f"跳过安装包: {package_name}")
-                else:
-                    click.echo(f"Skipping package: {package_name}")
+                        # 确认安装
+                        confirm = "y" if assume_yes else prompt("确认安装该包吗？(Y/n)", type=str, default="", show_default=False)
+                        if (confirm.lower() == 'y' or confirm.lower() == '') and store is not None:
+                            # 第一次确认时才把包放入仓库（已在仓库中时只检查目录树是否完整）
+                            if store_entry is None:
+                                store_entry = store.prepare(archive_sha256, inner, members, python_info,
+                                                            current["archive_sha256"] if current is not None else None)
+                                compiled, shipped = store_entry[2], store_entry[3]
+                            package_manifest, used = store.link(store_entry[0], store_entry[1], package_name, site_packages_dir,
+                                                                python_info, installed)
+                            manifest.update(package_manifest)
+                            linked.update(used)
+                            installed_top_levels.add(package_name)
+                            click.echo(f"已安装 {package_name} 到 {site_packages_dir / package_name}")
+                        elif confirm.lower() == 'y' or confirm.lower() == '':
+                            package_files, package_bytecode = split_bytecode(members.get(package_name, []))
+                            manifest.update(extract_members(inner, package_files, site_packages_dir, installed))
+                            shipped_bytecode.extend(package_bytecode)
+                            installed_top_levels.add(package_name)
+                            if lang == 'zh-CN':
+                                click.echo(f"已安装 {package_name} 到 {site_packages_dir / package_name}")
+                            else:
+                                click.echo(f"Installed {package_name} to {site_packages_dir / package_name}")
+                        else:
+                            if lang == 'zh-CN':
+                                click.echo(f"跳过安装包: {package_name}")
+                            else:
+                                click.echo(f"Skipping package: {package_name}")
+
+                    sources = [path for path in manifest if path.endswith(".py")]
+                    if python_info is not None and shipped_bytecode:
+                        shipped = install_bytecode(inner, shipped_bytecode, site_packages_dir, sources, python_info)
 
-        shutil.rmtree(extract_dir)
+            if installed_top_levels:
+                stale = registry.commit_install(pack_data["name"], pack_data["version"], archive_sha256, manifest, installed_top_levels)
+                if stale:
+                    click.echo(f"已删除旧版本中的 {len(stale)} 个文件")
+                if linked:
+                    click.echo("从包仓库安装: " + "，".join(f"{STORE_LINK_NAMES[mode]} {count} 个" for mode, count in sorted(linked.items())))
+                if python_info is not None:
+                    # 从仓库链接的文件已经带有字节码，这里只会编译解压安装的文件
+                    compiled += compile_sources(site_packages_dir, sources, python_info)
+                    report_bytecode(python_info, compiled, shipped)
+        finally:
+            if registry is not None:
+                registry.close()
         click.echo(f"安装完成!")
 
+    @staticmethod
+    @traced("install.batch")
+    def install_cpacks(cpack_paths, python_dir=None, assume_yes=False, jobs=None, bytecode=True, zipimport=None, use_store=True):
+        """
+        批量安装多个 .cpack 包
+        只选择一次 Python、只确认一次，然后在线程池中并行解压安装，最后一次性预编译全部源文件
+        :param cpack_paths: .cpack 文件路径列表
+        :param python_dir: 目标 Python 目录，None 时交互式查找
+        :param assume_yes: 为 True 时跳过确认
+        :param jobs: 并行安装的线程数（也是编译字节码的进程数）
+        :param bytecode: 是否为目标解释器准备字节码
+        :param zipimport: True 以 zipimport 布局安装，False 解压安装，None 每个包保持已安装版本的布局
+        :param use_store: 解压安装时是否通过包仓库（~/.cip/store）链接文件
+        :return: 安装失败的 {路径: 异常}
+        """
+        plans = [(cpack_path, CPackTool.read_pack_data(cpack_path)) for cpack_path in cpack_paths]
+
+        # 检查冲突：同一个顶层包出现在多个 .cpack 中时，安装结果取决于写入顺序，直接拒绝
+        owners = {}
+        for cpack_path, pack_data in plans:
+            for package_name in pack_data["packages"]:
+                owners.setdefault(package_name, []).append(str(cpack_path))
+        conflicts = {name: paths for name, paths in owners.items() if len(paths) > 1}
+        if conflicts:
+            details = "; ".join(f"{name}: {', '.join(paths)}" for name, paths in sorted(conflicts.items()))
+            raise ValueError(f"以下包在多个 .cpack 中重复出现: {details}")
+
+        for cpack_path, pack_data in plans:
+            if pack_data.get("cip_version") != CIP_VERSION:
+                click.echo(f"{RED}{BOLD}警告:{WHITE} {cpack_path} 的 cip 版本不匹配，可能存在兼容性问题。")
+
+        if python_dir is None:
+            python_dir = require_python_path(interactive=not assume_yes)
+        site_packages_dir = site_packages_for(python_dir)
+
+        click.echo(f"将安装以下 {len(plans)} 个 .cpack 到 {site_packages_dir}:")
+        for cpack_path, pack_data in plans:
+            click.echo(f"  {pack_data['name']} {pack_data['version']}: {', '.join(pack_data['packages'])}")
+        if not assume_yes:
+            confirm = prompt("确认安装吗？(Y/n)", type=str, default="", show_default=False)
+            if confirm.lower() not in ('y', ''):
+                click.echo("已取消安装。")
+                return {}
+        python_info = find_bytecode_target(python_dir) if bytecode else None
+        store = PackageStore() if use_store else None
+        if store is not None and not store.enabled:
+            store = None
+
+        # 登记表只在主线程中读写，工作线程只负责解压
+        registry = InstallRegistry(site_packages_dir)
+        failures = {}
+        sources = []
+        try:
+            installed = {pack_data["name"]: registry.files(pack_data["name"]) for _, pack_data in plans}
+            previous = {pack_data["name"]: (registry.get(pack_data["name"]) or {}).get("archive_sha256") for _, pack_data in plans}
+            zipped = {name: zip_layout_archive(files) is not None if zipimport is None else zipimport for name, files in installed.items()}
+            with concurrent_futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+                futures = {
+                    executor.submit(CPackTool.extract_packages, cpack_path, pack_data["packages"], site_packages_dir,
+                                    installed[pack_data["name"]], python_info, zipped[pack_data["name"]],
+                                    None if zipped[pack_data["name"]] else store, previous[pack_data["name"]]): (cpack_path, pack_data)
+                    for cpack_path, pack_data in plans
+                }
+                for future in concurrent_futures.as_completed(futures):
+                    cpack_path, pack_data = futures[future]
+                    try:
+                        manifest = future.result()
+                        registry.commit_install(pack_data["name"], pack_data["version"], file_sha256(cpack_path), manifest,
+                                                set(pack_data["packages"]))
+                        sources.extend(path for path in manifest if path.endswith(".py"))
+                    except Exception as e:
+                        failures[cpack_path] = e
+                        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 安装 {cpack_path} 失败: {e}", err=True)
+                    else:
+                        click.echo(f"{GREEN}已安装 {pack_data['name']} {pack_data['version']}{WHITE}")
+        finally:
+            registry.close()
+
+        if python_info is not None:
+            report_bytecode(python_info, compile_sources(site_packages_dir, sources, python_info, jobs))
+        click.echo(f"安装完成! 成功 {len(plans) - len(failures)} 个，失败 {len(failures)} 个。")
+        return failures
+
 @click.group()
-def cli():
+@click.option("--profile", is_flag=True, help="记录各阶段耗时，结束时输出汇总表")
+@click.option("--profile-output", type=click.Path(dir_okay=False), default=None, help="把阶段耗时写入 JSON 追踪文件（Chrome Trace 格式），隐含 --profile")
+@click.pass_context
+def cli(ctx, profile, profile_output):
     """ cip - An advanced package manager.
         cip - 更高级的包管理器。
 
@@ -276,25 +2505,100 @@ def cli():
     警告：cip 主要运用在企业环境的统一版本管理，并不适合初学者使用，并且涉及对Python目录的直接操作，可能会被杀软误报。 
     
     Only speak to groups where Chinese is not the primary language. This program does not provide complete support for other languages, only Chinese has full language support."""
-    pass
+    if profile or profile_output:
+        profiler.enable()
+
+        def report():
+            if profile_output:
+                profiler.write_trace(profile_output)
+                click.echo(f"阶段耗时已写入 {profile_output}", err=True)
+            if profile:
+                profiler.print_summary()
+        # 子命令结束（包括出错退出）时按后进先出执行：先结束最外层阶段，再输出结果
+        ctx.call_on_close(report)
+        ctx.with_resource(profiler.span(f"cip {ctx.invoked_subcommand}"))
 
 @cli.command()
 @click.argument("package_name")
 @click.argument("version")
 @click.argument("package_dirs", type=click.Path(exists=True), nargs=-1)
-def create(package_name, version, package_dirs):
+@click.option("--compression", type=click.Choice(sorted(COMPRESSION_METHODS)), default="deflate", show_default=True, help="压缩算法")
+@click.option("--level", type=int, default=None, help="压缩级别（deflate/lzma 为 0-9，bzip2 为 1-9）")
+@click.option("-j", "--jobs", type=int, default=None, help="并行压缩的进程数，默认使用全部 CPU")
+@click.option("--no-build-cache", is_flag=True, help="不使用增量构建缓存，重新压缩全部文件")
+@click.option("--with-bytecode", is_flag=True, help="附带当前 Python 版本的字节码，安装时只需校验，不必编译")
+@click.option("--bytecode-python", "bytecode_pythons", multiple=True, help="同时为指定的解释器生成字节码（可多次指定），隐含 --with-bytecode")
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None,
+              help="--with-bytecode 使用该 Python 安装目录中的解释器，不指定时使用运行 cip 的解释器（打包的 cip 自动查找）")
+def create(package_name, version, package_dirs, compression, level, jobs, no_build_cache, with_bytecode, bytecode_pythons, python_dir):
     """ 创建 .cpack 包 """
     try:
-        CPackTool.create_cpack(package_name, version, package_dirs)
+        bytecode_pythons = [bytecode_interpreter(python_dir), *bytecode_pythons] if with_bytecode or bytecode_pythons else None
+        CPackTool.create_cpack(package_name, version, package_dirs, compression, level, jobs,
+                               use_build_cache=not no_build_cache, bytecode_pythons=bytecode_pythons)
     except Exception as e:
         click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
 
+def resolve_cpack(cpack_spec):
+    """
+    解析要安装的包：已存在的文件路径直接使用，"包名==版本" 形式则从本地缓存中查找
+    :return: .cpack 文件路径
+    """
+    cpack_path = Path(cpack_spec)
+    if cpack_path.exists() or "==" not in cpack_spec:
+        if not cpack_path.exists():
+            raise FileNotFoundError(f"文件 {cpack_spec} 不存在。")
+        return cpack_path
+    package_name, _, version = cpack_spec.partition("==")
+    cached = PackageCache().lookup(package_name, version)
+    if cached is None:
+        raise FileNotFoundError(f"本地缓存中没有 {package_name} {version}，请先使用 cip download 下载。")
+    return cached
+
+def read_manifest(manifest_path):
+    """
+    读取安装清单：每行一个 .cpack 路径或 包名==版本，忽略空行和 # 注释
+    """
+    specs = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                specs.append(line)
+    return specs
+
 @cli.command()
-@click.argument("cpack_path", type=click.Path(exists=True))
-def install(cpack_path):
-    """ 安装 .cpack 包 """
+@click.argument("cpack_paths", nargs=-1)
+@click.option("-r", "--requirement", "manifests", multiple=True, type=click.Path(exists=True), help="从清单文件读取要安装的包（可多次指定）")
+@click.option("-y", "--yes", "assume_yes", is_flag=True, help="不询问，直接安装")
+@click.option("-j", "--jobs", type=int, default=None, help="批量安装时的并行线程数，默认使用全部 CPU")
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+@click.option("--no-compile", is_flag=True, help="不预编译字节码（首次导入时由 Python 自行编译）")
+@click.option("--zipimport/--no-zipimport", default=None, help="以单个 zip 归档安装（通过 zipimport 加载）或解压安装，默认保持已安装版本的布局")
+@click.option("--no-store", is_flag=True, help="不使用包仓库，直接解压到 site-packages")
+def install(cpack_paths, manifests, assume_yes, jobs, python_dir, no_compile, zipimport, no_store):
+    """ 安装 .cpack 包（文件路径，或 包名==版本 从本地缓存安装） """
+    specs = [*cpack_paths]
+    for manifest in manifests:
+        specs.extend(read_manifest(manifest))
+    if not specs:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 请指定要安装的 .cpack 包。", err=True)
+        return
     try:
-        CPackTool.install_cpack(Path(cpack_path))
+        # 去掉重复指定的同一个文件
+        cpack_paths = []
+        seen = set()
+        for spec in specs:
+            cpack_path = resolve_cpack(spec)
+            if cpack_path.resolve() not in seen:
+                seen.add(cpack_path.resolve())
+                cpack_paths.append(cpack_path)
+        if len(cpack_paths) == 1:
+            CPackTool.install_cpack(cpack_paths[0], python_dir=python_dir, assume_yes=assume_yes, bytecode=not no_compile,
+                                    zipimport=zipimport, use_store=not no_store)
+        elif CPackTool.install_cpacks(cpack_paths, python_dir=python_dir, assume_yes=assume_yes, jobs=jobs, bytecode=not no_compile,
+                                      zipimport=zipimport, use_store=not no_store):
+            sys.exit(1)
     except Exception as e:
         click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
 
@@ -303,21 +2607,17 @@ def install(cpack_path):
 @click.argument("config_value", required=False)
 def config(config_key, config_value=None):
     """ 配置 cip """
-    config = configparser.ConfigParser()
-    config_path = Path("~/.cip/config.ini").expanduser()
-    if not config_path.exists():
-        click.echo("{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
+    config = cip_config.load()
+    if config is None:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
         return
-    config.read(config_path)
     if config_value is None:
         if config['CONFIG']['lang'] == 'zh-CN':
             click.echo(f"{config_key} 的值: {config['CONFIG'][config_key]}")
         else:
             click.echo(f"The value of {config_key}: {config['CONFIG'][config_key]}")
     else:
-        config['CONFIG'][config_key] = config_value
-        with open(config_path, 'w') as configfile:
-            config.write(configfile)
+        cip_config.set(config_key, config_value)
         if config['CONFIG']['lang'] == 'zh-CN':
             click.echo(f"{config_key} 的值已设置为 {config_value}")
         else:
@@ -327,13 +2627,10 @@ def config(config_key, config_value=None):
 def version():
     """ 显示 cip 版本 """
     click.echo("cip "+ CIP_VERSION)
-    config = configparser.ConfigParser()
-    config_path = Path("~/.cip/config.ini").expanduser()
-    if not config_path.exists():
-        click.echo("{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
+    if not cip_config.exists():
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 配置文件不存在，请先配置。")
         return
-    config.read(config_path)
-    if config['CONFIG']['lang'] == 'zh-CN':
+    if cip_config.get('lang') == 'zh-CN':
         click.echo("语言: 中文")
         click.echo(f"Python 版本: {sys.version}")
         click.echo("开源许可证: MIT License")
@@ -354,7 +2651,7 @@ def tools(tool_name):
     elif tool_name == "检测父母性别":
         click.echo(f"{BLUE}这个工具用于检测父母性别。{WHITE}")
         click.echo(f"{BLUE}请输入检测对象（填写父亲或母亲）：{WHITE}")
-        name = click.prompt("检测对象", type=str)
+        name = prompt("检测对象", type=str)
         if name.lower() == "父亲":
             click.echo(f"{BLUE}你的父亲是男的。{WHITE}")
         elif name.lower() == "母亲":
@@ -387,8 +2684,8 @@ def setup_flask_project():
     import subprocess
 
     # 选择项目路径
-    project_path = click.prompt("请输入项目路径（默认为当前目录）", type=str, default=os.getcwd())
-    project_name = click.prompt("请输入项目名称", type=str)
+    project_path = prompt("请输入项目路径（默认为当前目录）", type=str, default=os.getcwd())
+    project_name = prompt("请输入项目名称", type=str)
 
     # 创建项目目录
     full_project_path = os.path.join(project_path, project_name)
@@ -428,88 +2725,797 @@ if __name__ == '__main__':
     click.echo(f"{YELLOW}cd {full_project_path}{WHITE}")
     click.echo(f"{YELLOW}python app.py{WHITE}")
 
+class MultipartFileStream:
+    """
+    流式的 multipart/form-data 请求体
+    requests 的 files= 会先在内存中拼出完整请求体，这里按需从文件中读取，并提前算好 Content-Length
+    """
+
+    def __init__(self, fields, file_field, file_path):
+        boundary = os.urandom(16).hex()
+        head = b""
+        for name, value in fields.items():
+            head += (f"--{boundary}\r\n"
+                     f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f"{value}\r\n").encode("utf-8")
+        head += (f"--{boundary}\r\n"
+                 f'Content-Disposition: form-data; name="{file_field}"; filename="{os.path.basename(file_path)}"\r\n'
+                 f"Content-Type: application/octet-stream\r\n\r\n").encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._length = len(head) + os.path.getsize(file_path) + len(tail)
+        self._parts = [io.BytesIO(head), open(file_path, "rb"), io.BytesIO(tail)]
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        data = b""
+        while self._parts and len(data) < size:
+            chunk = self._parts[0].read(size - len(data))
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            data += chunk
+        return data
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 @cli.command()
 @click.argument("package_path")
 #@click.argument("version")
 def upload(package_path):
     """ 上传 .cpack 包 """
-    package_name = package_path
-    filename = f"{package_name}"
-    version = filename.split("-")[-1]
-    file_path = os.path.join(filename)  # 根据需求设置文件路径
+    file_path = package_path
+    filename = os.path.basename(file_path)
+    package_name, _, version = filename[:-len(".cpack")].rpartition("-") if filename.endswith(".cpack") else (filename, "", "")
     
     # 检查文件是否存在
     if not os.path.exists(file_path):
         click.echo(f"ERROR: 文件 {file_path} 不存在。")
         return
     
+    # 先计算 SHA-256，服务端边接收边校验
+    sha256 = file_sha256(file_path)
     # 上传文件
-    with open(file_path, 'rb') as f:
-        # 跳过SSL验证
-        response = requests.post(f"{BASE_URL}/cip/upload", files={'file': f}, data={'package_name': package_name, 'package_version': version},verify=False)
+    with MultipartFileStream({'package_name': package_name, 'package_version': version}, 'file', file_path) as body:
+        headers = {"Content-Type": body.content_type, "X-Content-SHA256": sha256}
+        response = http_request("POST", f"{BASE_URL}/cip/upload", data=body, headers=headers)
         
     if response.status_code == 200:
         click.echo(f"成功上传 {filename}！")
     else:
-        click.echo(f"ERROR: 上传失败：{response.json().get('error', '未知错误')}。")
+        try:
+            error = response.json().get('error', '未知错误')
+        except ValueError:
+            error = f"HTTP {response.status_code}"
+        click.echo(f"ERROR: 上传失败：{error}。")
+
+def parse_package_spec(spec):
+    """
+    解析 "包名==版本" 形式的包说明
+    :return: (包名, 版本)
+    """
+    package_name, sep, version = spec.partition("==")
+    if not sep or not package_name or not version:
+        raise click.BadParameter(f"{spec} 的格式应为 包名==版本")
+    return package_name.strip(), version.strip()
+
+@traced("delta.apply")
+def apply_delta(delta_path, base_path, dest_path, expected_sha256):
+    """
+    用本地的旧版本和增量包重建新版本的 .cpack
+    重建结果先写入 .part 临时文件，SHA-256 与服务端记录一致后才替换到目标路径
+    :param delta_path: 增量包路径
+    :param base_path: 旧版本 .cpack 路径
+    :param dest_path: 新版本 .cpack 的目标路径
+    :param expected_sha256: 新版本的 SHA-256
+    """
+    dest_path = Path(dest_path)
+    part_path = dest_path.with_name(dest_path.name + ".part")
+    digest = hashlib.sha256()
+    with open(delta_path, "rb") as delta, open(base_path, "rb") as base, open(part_path, "wb") as out:
+        if delta.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError("增量包格式不正确")
+        (length,) = struct.unpack("<I", delta.read(4))
+        manifest = json.loads(delta.read(length))
+        if manifest["target_sha256"] != expected_sha256:
+            raise ValueError("增量包与目标版本不匹配")
+        for op in manifest["ops"]:
+            if op[0] == "copy":
+                base.seek(op[1])
+                source, size = base, op[2]
+            else:
+                source, size = delta, op[1]
+            while size > 0:
+                chunk = source.read(min(size, DOWNLOAD_CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError("增量包或旧版本文件不完整")
+                digest.update(chunk)
+                out.write(chunk)
+                size -= len(chunk)
+    if digest.hexdigest() != expected_sha256:
+        part_path.unlink()
+        raise ValueError("重建的包校验失败")
+    os.replace(part_path, dest_path)
+
+@traced("delta.fetch")
+def fetch_delta(base_url, package_name, version, bases, dest_dir="."):
+    """
+    通过增量包升级：从服务端的版本列表中找到目标版本之前、本地缓存中已有的最近版本，
+    下载两者之间的增量包并重建新版本
+    :param bases: 本地缓存中该包的版本 {版本: 缓存文件路径}
+    :param dest_dir: 保存目录
+    :return: 是否成功，服务端不支持或没有可用的旧版本时返回 False
+    """
+    info = cached_get_json(f"{base_url}/cip/packages/{package_name}")
+    versions = [item["version"] for item in info["versions"]]
+    if version not in versions:
+        return False
+    index = versions.index(version)
+    base_version = next((v for v in reversed(versions[:index]) if v in bases), None)
+    if base_version is None:
+        return False
+
+    cpack_path = Path(dest_dir) / f"{package_name}-{version}.cpack"
+    delta_path = cpack_path.with_name(cpack_path.name + ".cdelta")
+    status_code = stream_download(f"{base_url}/cip/delta/{package_name}/{base_version}/{version}", delta_path)
+    if status_code != 200:
+        return False
+    try:
+        apply_delta(delta_path, bases[base_version], cpack_path, info["versions"][index]["sha256"])
+        click.echo(f"{GREEN}已通过增量更新从 {base_version} 获取 {cpack_path}"
+                   f"（传输 {delta_path.stat().st_size / 1024:.1f} KB，完整包 {cpack_path.stat().st_size / 1024:.1f} KB）{WHITE}")
+    finally:
+        delta_path.unlink(missing_ok=True)
+    return True
+
+@traced("download.package")
+def fetch_package(base_url, package_name, version, etag=None, bases=None, dest_dir="."):
+    """
+    下载单个 .cpack 到 dest_dir（默认当前目录）
+    连接阶段的失败由会话自动重试；传输中途断开时从 .part 文件断点续传，重试次数与 http_retries 相同
+    :param etag: 本地缓存文件的 SHA-256，服务端未变化时返回 304
+    :param bases: 本地缓存中该包的其他版本 {版本: 路径}，有旧版本时优先下载增量包
+    :param dest_dir: 保存目录
+    :return: HTTP 状态码
+    """
+    url = f"{base_url}/download/{package_name}/{version}/{package_name}-{version}.cpack"
+    cpack_path = Path(dest_dir) / f"{package_name}-{version}.cpack"
+    if etag is None and bases:
+        try:
+            if fetch_delta(base_url, package_name, version, bases, dest_dir):
+                return 200
+        except (requests.exceptions.RequestException, OSError, ValueError, KeyError):
+            # 增量更新失败（旧版服务端、文件损坏等）时回退到完整下载
+            pass
+    attempts = http_setting('http_retries', int)
+    for attempt in range(attempts + 1):
+        try:
+            return stream_download(url, cpack_path, etag=etag)
+        except requests.exceptions.ChunkedEncodingError:
+            if attempt == attempts:
+                raise
+            time.sleep(http_setting('http_backoff') * (2 ** attempt))
 
 @cli.command()
-@click.argument("package_name")
-@click.argument("version")
-def download(package_name, version):
-    """ 下载 .cpack 包 """
-    url = f"{BASE_URL}/download/{package_name}/{version}/{package_name}-{version}.cpack"
-    response = requests.get(url, verify=False)
-    
-    if response.status_code == 200:
-        with open(f"{package_name}-{version}.cpack", "wb") as f:
-            f.write(response.content)
-        click.echo(f"下载 {package_name}-{version}.cpack")
-        
-        # 可选：运行安装命令
-        yes = click.prompt("是否立即安装？(Y/n)", type=str)
-        if yes.lower() == 'y' or yes.lower() == '':
-            CPackTool.install_cpack(Path(f"{package_name}-{version}.cpack"))
+@click.argument("specs", nargs=-1)
+@click.option("-r", "--requirement", "manifests", multiple=True, type=click.Path(exists=True), help="从清单文件读取要下载的 包名==版本（可多次指定）")
+@click.option("-j", "--jobs", type=int, default=DOWNLOAD_JOBS, show_default=True, help="并发下载数")
+@click.option("-y", "--yes", "assume_yes", is_flag=True, help="下载后直接安装，不询问")
+@click.option("--no-delta", is_flag=True, help="不使用增量更新，总是下载完整的包")
+def download(specs, manifests, jobs, assume_yes, no_delta):
+    """ 下载 .cpack 包（包名 版本，或多个 包名==版本） """
+    specs = [*specs]
+    for manifest in manifests:
+        specs.extend(read_manifest(manifest))
+    try:
+        if len(specs) == 2 and not any("==" in spec for spec in specs):
+            # 兼容旧用法：cip download <包名> <版本>
+            packages = [(specs[0], specs[1])]
         else:
-            pass
-    elif response.status_code == 404:
-        click.echo(f"ERROR: 未找到 {package_name} {version} 版本的包。")
-    else:
-        click.echo(f"ERROR: 下载失败")
+            packages = [*dict.fromkeys(parse_package_spec(spec) for spec in specs)]
+    except click.BadParameter as e:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e.message}", err=True)
+        return
+    if not packages:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 请指定要下载的包。", err=True)
+        return
+
+    # 缓存索引只在主线程中读写，工作线程只负责下载
+    package_cache = PackageCache()
+    cached = {package: package_cache.lookup(*package) for package in packages}
+    # 本地缓存中有同一个包的旧版本时可以只下载增量包
+    bases = {} if no_delta else {package: package_cache.versions(package[0]) for package in packages if cached[package] is None}
+    downloaded = []
+    failed = []
+    with concurrent_futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(packages)))) as executor:
+        futures = {
+            # 命中本地缓存时带上缓存文件的 SHA-256 作为 ETag，服务端未变化则只需一次 304 往返
+            executor.submit(fetch_package, BASE_URL, package_name, version,
+                            cached[(package_name, version)].stem if cached[(package_name, version)] is not None else None,
+                            bases.get((package_name, version))): (package_name, version)
+            for package_name, version in packages
+        }
+        for future in concurrent_futures.as_completed(futures):
+            package_name, version = futures[future]
+            cpack_path = Path(f"{package_name}-{version}.cpack")
+            cached_path = cached[(package_name, version)]
+            try:
+                status_code = future.result()
+            except (requests.exceptions.RequestException, OSError) as e:
+                if cached_path is None:
+                    click.echo(f"ERROR: 下载 {package_name} {version} 中断：{e}")
+                    click.echo("已下载的部分已保留，重新运行该命令即可继续下载。")
+                    failed.append((package_name, version))
+                    continue
+                # 无法连接服务端时直接使用本地缓存
+                status_code = 304
+            if status_code == 304 and cached_path is not None:
+                place_file(cached_path, cpack_path)
+                click.echo(f"{GREEN}已从本地缓存获取 {cpack_path}{WHITE}")
+                status_code = 200
+            elif status_code == 200:
+                package_cache.add(package_name, version, cpack_path)
+
+            if status_code == 200:
+                click.echo(f"下载 {package_name}-{version}.cpack")
+                downloaded.append(cpack_path)
+            else:
+                if status_code == 404:
+                    click.echo(f"ERROR: 未找到 {package_name} {version} 版本的包。")
+                else:
+                    click.echo(f"ERROR: 下载 {package_name} {version} 失败")
+                failed.append((package_name, version))
+
+    if len(packages) > 1:
+        click.echo(f"下载完成! 成功 {len(downloaded)} 个，失败 {len(failed)} 个。")
+    if downloaded:
+        # 可选：运行安装命令
+        if not assume_yes:
+            yes = prompt("是否立即安装？(Y/n)", type=str, default="", show_default=False)
+            if yes.lower() not in ('y', ''):
+                downloaded = []
+        try:
+            # 未指定 --yes 时用户已经确认过安装，仍可以交互式选择目标 Python
+            python_dir = require_python_path(interactive=not assume_yes) if downloaded else None
+            if len(downloaded) == 1:
+                CPackTool.install_cpack(downloaded[0], python_dir=python_dir, assume_yes=assume_yes)
+            elif downloaded and CPackTool.install_cpacks(downloaded, python_dir=python_dir, assume_yes=True):
+                sys.exit(1)
+        except Exception as e:
+            click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+            sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+def iter_packages(base_url, search=None, prefix=None, latest=False, page_size=LIST_PAGE_SIZE):
+    """
+    逐页获取服务端的包列表，按需发起请求
+    :param base_url: 服务端地址
+    :param search: 包名子串
+    :param prefix: 包名前缀
+    :param latest: 每个包只返回最新版本
+    :param page_size: 每页数量
+    :return: 依次产出 {"name", "version", "filename", ...} 的生成器
+    """
+    params = {"limit": page_size}
+    if search:
+        params["search"] = search
+    if prefix:
+        params["prefix"] = prefix
+    if latest:
+        params["latest"] = "1"
+    while True:
+        data = cached_get_json(f"{base_url}/cip/packages", params=dict(params))
+        if "next_cursor" not in data:
+            # 旧版服务端不支持分页，返回的是完整的 {包名: [文件名, ...]}，在本地过滤
+            for package_name, filenames in data.items():
+                if (search and search not in package_name) or (prefix and not package_name.startswith(prefix)):
+                    continue
+                if latest:
+                    filenames = filenames[-1:]
+                for filename in filenames:
+                    version = filename[:-len(".cpack")].rsplit("-", 1)[-1] if filename.endswith(".cpack") else filename
+                    yield {"name": package_name, "version": version, "filename": filename}
+            return
+        yield from data["packages"]
+        if not data["next_cursor"]:
+            return
+        params["cursor"] = data["next_cursor"]
 
 @cli.command()
 @click.argument("url", required=False)
-def list(url=None):
+@click.option("-s", "--search", default=None, help="只显示包名包含该字符串的包")
+@click.option("--prefix", default=None, help="只显示包名以该字符串开头的包")
+@click.option("--latest", is_flag=True, help="每个包只显示最新版本")
+@click.option("--page-size", type=int, default=LIST_PAGE_SIZE, show_default=True, help="每次请求获取的数量")
+def list(url=None, search=None, prefix=None, latest=False, page_size=LIST_PAGE_SIZE):
     """ 列出可用的 .cpack 包 """
     if url is None:
         print(BASE_URL)
-        response = requests.get(f"{BASE_URL}/cip/packages")
-    else:
-        response = requests.get(f"{url}/cip/packages")
-    if response.status_code == 200:
-        packages = response.json()
+        url = BASE_URL
+    try:
         click.echo("可下载的包及版本：")
-        for package_name, versions in packages.items():
-            click.echo(f"{package_name}: {', '.join(versions)}")
-    else:
+        # 服务端按包名排序返回，同一个包的版本连续出现，边取边输出
+        current_name = None
+        versions = []
+        for package in iter_packages(url, search=search, prefix=prefix, latest=latest, page_size=page_size):
+            if package["name"] != current_name:
+                if current_name is not None:
+                    click.echo(f"{current_name}: {', '.join(versions)}")
+                current_name = package["name"]
+                versions = []
+            versions.append(package["version"])
+        if current_name is not None:
+            click.echo(f"{current_name}: {', '.join(versions)}")
+    except (requests.exceptions.RequestException, ValueError):
         click.echo("ERROR: 获取包列表失败。")
 
+def open_registry(python_dir, readonly=False, interactive=True):
+    """
+    打开目标 Python 环境的已安装包登记表，python_dir 为 None 时交互式查找
+    :param readonly: 只读打开，只查询时使用，不会创建 site-packages 目录和登记表文件
+    :param interactive: 为 False 时查找解释器不向用户询问，见 find_python_path
+    """
+    if python_dir is None:
+        python_dir = require_python_path(interactive)
+    return InstallRegistry(site_packages_for(python_dir), readonly=readonly)
+
+@cli.command()
+@click.argument("package_name", required=False)
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+def show(package_name, python_dir):
+    """ 显示通过 cip 安装的包（不指定包名时列出全部） """
+    try:
+        registry = open_registry(python_dir, readonly=True)
+    except FileNotFoundError as e:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+        return
+    try:
+        if package_name is None:
+            for package in registry.packages():
+                click.echo(f"{package['name']}=={package['version']}")
+            return
+        package = registry.get(package_name)
+        if package is None:
+            click.echo(f"ERROR: {package_name} 未通过 cip 安装。")
+            sys.exit(1)
+        click.echo(f"包名: {package['name']}")
+        click.echo(f"版本: {package['version']}")
+        click.echo(f"顶层包: {', '.join(package['top_levels'])}")
+        click.echo(f"文件数: {package['files']}")
+        archive = zip_layout_archive(registry.files(package_name))
+        click.echo(f"布局: {'zipimport（' + archive + '）' if archive else '解压'}")
+        click.echo(f"来源 SHA-256: {package['archive_sha256']}")
+        click.echo(f"安装时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(package['installed_at']))}")
+        click.echo(f"位置: {registry.site_packages_dir}")
+    finally:
+        registry.close()
+
+@cli.command()
+@click.argument("package_names", nargs=-1, required=True)
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+@click.option("-y", "--yes", "assume_yes", is_flag=True, help="不询问，直接卸载")
+def uninstall(package_names, python_dir, assume_yes):
+    """ 卸载通过 cip 安装的包 """
+    try:
+        registry = open_registry(python_dir, interactive=not assume_yes)
+    except FileNotFoundError as e:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+        return
+    missing = False
+    try:
+        for package_name in package_names:
+            package = registry.get(package_name)
+            if package is None:
+                click.echo(f"ERROR: {package_name} 未通过 cip 安装。")
+                missing = True
+                continue
+            click.echo(f"将卸载 {package['name']} {package['version']}（{package['files']} 个文件）")
+            if not assume_yes:
+                confirm = prompt("确认卸载吗？(Y/n)", type=str, default="", show_default=False)
+                if confirm.lower() not in ('y', ''):
+                    click.echo(f"跳过卸载: {package_name}")
+                    continue
+            remove_installed_files(registry.site_packages_dir, registry.files(package_name))
+            registry.remove(package_name)
+            click.echo(f"{GREEN}已卸载 {package_name}{WHITE}")
+    finally:
+        registry.close()
+    if missing:
+        sys.exit(1)
+
+def convert_layout(site_packages_dir, package, files, python_info):
+    """
+    转换已安装包的布局，不需要原来的 .cpack：解压的文件打包成 zipimport 归档，或把 zipimport 归档解压回普通文件
+    :param package: 登记表中的包
+    :param files: 登记表中该包的文件清单
+    :param python_info: 目标解释器信息，用于生成字节码，None 时不生成
+    :return: 新布局的文件清单
+    """
+    site_packages_dir = Path(site_packages_dir)
+    archive = zip_layout_archive(files)
+    if archive is None:
+        layout = ZipLayout(site_packages_dir, package["name"], package["version"], python_info)
+        try:
+            for path in sorted(files):
+                if not is_bytecode_member(path):
+                    layout.add_file(site_packages_dir / path, path)
+        except BaseException:
+            layout.abort()
+            raise
+        return layout.finish()
+
+    with zipfile.ZipFile(site_packages_dir / archive, "r") as zipf:
+        names = set(zipf.namelist())
+        # 源文件旁边的 .pyc 是给 zipimport 用的，解压布局的字节码在 __pycache__ 中重新生成
+        members = [info for info in zipf.infolist()
+                   if not info.is_dir() and not (info.filename.endswith(".pyc") and info.filename[:-1] in names)]
+        manifest = extract_members(zipf, members, site_packages_dir)
+    if python_info is not None:
+        compile_sources(site_packages_dir, [path for path in manifest if path.endswith(".py")], python_info)
+    return manifest
+
+@cli.command()
+@click.argument("package_names", nargs=-1, required=True)
+@click.option("--to", "layout", type=click.Choice(["zip", "files"]), required=True, help="目标布局：zip 为 zipimport 归档，files 为解压到 site-packages")
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+def convert(package_names, layout, python_dir):
+    """ 在解压和 zipimport 两种布局之间转换已安装的包 """
+    if python_dir is None:
+        try:
+            python_dir = require_python_path()
+        except FileNotFoundError as e:
+            click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+            return
+    registry = open_registry(python_dir)
+    python_info = find_bytecode_target(python_dir)
+    failed = False
+    try:
+        for package_name in package_names:
+            package = registry.get(package_name)
+            if package is None:
+                click.echo(f"ERROR: {package_name} 未通过 cip 安装。")
+                failed = True
+                continue
+            files = registry.files(package_name)
+            if (zip_layout_archive(files) is not None) == (layout == "zip"):
+                click.echo(f"{package_name} 已经是{' zipimport ' if layout == 'zip' else '解压'}布局")
+                continue
+            try:
+                manifest = convert_layout(registry.site_packages_dir, package, files, python_info)
+                registry.commit_install(package["name"], package["version"], package["archive_sha256"], manifest, set(package["top_levels"]))
+            except Exception as e:
+                click.echo(f"{RED}{BOLD}ERROR:{WHITE} 转换 {package_name} 失败: {e}", err=True)
+                failed = True
+            else:
+                click.echo(f"{GREEN}已将 {package_name} 转换为{' zipimport ' if layout == 'zip' else '解压'}布局{WHITE}")
+    finally:
+        registry.close()
+    if failed:
+        sys.exit(1)
+
+@cli.command()
+@click.argument("package_names", nargs=-1)
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+@click.option("-y", "--yes", "assume_yes", is_flag=True, help="不询问，直接升级")
+def upgrade(package_names, python_dir, assume_yes):
+    """ 把通过 cip 安装的包升级到服务端的最新版本（不指定包名时检查全部） """
+    if python_dir is None:
+        try:
+            python_dir = require_python_path(interactive=not assume_yes)
+        except FileNotFoundError as e:
+            click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+            return
+    registry = open_registry(python_dir, readonly=True)
+    try:
+        installed = {package["name"]: package["version"] for package in registry.packages()}
+    finally:
+        registry.close()
+    failed = False
+    package_cache = PackageCache()
+    for package_name in package_names or sorted(installed):
+        if package_name not in installed:
+            click.echo(f"ERROR: {package_name} 未通过 cip 安装。")
+            failed = True
+            continue
+        try:
+            latest = cached_get_json(f"{BASE_URL}/cip/packages/{package_name}")["latest"]
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            click.echo(f"ERROR: 获取 {package_name} 的版本信息失败。")
+            failed = True
+            continue
+        if latest == installed[package_name]:
+            click.echo(f"{package_name} 已是最新版本 {latest}")
+            continue
+        click.echo(f"升级 {package_name}: {installed[package_name]} -> {latest}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cpack_path = package_cache.lookup(package_name, latest)
+            if cpack_path is None:
+                try:
+                    # 本地缓存中有当前版本时只需下载增量包
+                    status_code = fetch_package(BASE_URL, package_name, latest, bases=package_cache.versions(package_name), dest_dir=tmp_dir)
+                except (requests.exceptions.RequestException, OSError) as e:
+                    click.echo(f"ERROR: 下载 {package_name} {latest} 失败：{e}")
+                    failed = True
+                    continue
+                if status_code != 200:
+                    click.echo(f"ERROR: 下载 {package_name} {latest} 失败")
+                    failed = True
+                    continue
+                cpack_path = Path(tmp_dir) / f"{package_name}-{latest}.cpack"
+                package_cache.add(package_name, latest, cpack_path)
+            try:
+                CPackTool.install_cpack(cpack_path, python_dir=python_dir, assume_yes=assume_yes)
+            except Exception as e:
+                click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+                failed = True
+    if failed:
+        sys.exit(1)
+
+def read_lockfile(lockfile_path):
+    """
+    读取锁文件：{"lockfile_version": 1, "packages": [{"name", "version", "sha256"}, ...]}
+    :return: {包名: {"name", "version", "sha256"}}
+    """
+    with open(lockfile_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    packages = {}
+    for entry in data.get("packages", []):
+        if not all(isinstance(entry.get(key), str) and entry[key] for key in ("name", "version", "sha256")):
+            raise ValueError(f"锁文件中的条目不完整: {entry}")
+        if entry["name"] in packages:
+            raise ValueError(f"锁文件中 {entry['name']} 重复出现")
+        packages[entry["name"]] = {"name": entry["name"], "version": entry["version"], "sha256": entry["sha256"].lower()}
+    return packages
+
+def write_lockfile(lockfile_path, packages):
+    """
+    写出锁文件，条目按包名排序，便于纳入版本控制和比较差异
+    """
+    data = {"lockfile_version": 1, "packages": [packages[name] for name in sorted(packages)]}
+    tmp_path = f"{lockfile_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, lockfile_path)
+
+def resolve_locked_version(base_url, spec):
+    """
+    向服务端查询 包名 或 包名==版本 对应的版本和 SHA-256，只写包名时使用最新版本
+    :return: {"name", "version", "sha256"}
+    """
+    package_name, _, version = spec.partition("==")
+    info = cached_get_json(f"{base_url}/cip/packages/{package_name.strip()}")
+    version = version.strip() or info["latest"]
+    for item in info["versions"]:
+        if item["version"] == version:
+            return {"name": info["name"], "version": version, "sha256": item["sha256"]}
+    raise ValueError(f"服务端没有 {package_name} {version}")
+
+@cli.command()
+@click.argument("specs", nargs=-1)
+@click.option("-r", "--requirement", "manifests", multiple=True, type=click.Path(exists=True), help="从清单文件读取 包名 或 包名==版本（可多次指定）")
+@click.option("--from-installed", is_flag=True, help="根据目标 Python 环境中通过 cip 安装的包生成")
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录（配合 --from-installed）")
+@click.option("-o", "--output", default=LOCKFILE_NAME, show_default=True, type=click.Path(dir_okay=False), help="锁文件路径")
+def lock(specs, manifests, from_installed, python_dir, output):
+    """ 生成锁文件（包名、版本和 SHA-256） """
+    specs = [*specs]
+    for manifest in manifests:
+        specs.extend(read_manifest(manifest))
+    packages = {}
+    try:
+        if from_installed:
+            registry = open_registry(python_dir, readonly=True)
+            try:
+                for package in registry.packages():
+                    packages[package["name"]] = {"name": package["name"], "version": package["version"], "sha256": package["archive_sha256"]}
+            finally:
+                registry.close()
+        if specs:
+            with concurrent_futures.ThreadPoolExecutor(max_workers=min(DOWNLOAD_JOBS, len(specs))) as executor:
+                for entry in executor.map(lambda spec: resolve_locked_version(BASE_URL, spec), specs):
+                    packages[entry["name"]] = entry
+    except (requests.exceptions.RequestException, OSError, ValueError, KeyError) as e:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 生成锁文件失败：{e}", err=True)
+        sys.exit(1)
+    if not packages:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} 请指定要锁定的包。", err=True)
+        sys.exit(1)
+    write_lockfile(output, packages)
+    click.echo(f"已写入 {output}（{len(packages)} 个包）")
+
+def fetch_locked(packages, dest_dir, jobs):
+    """
+    获取锁文件中的一组包：先查本地缓存，缺少的并发下载（可用时走增量包），并校验 SHA-256
+    :param packages: [{"name", "version", "sha256"}]
+    :param dest_dir: 下载的临时目录
+    :return: ({包名: .cpack 路径}, {包名: 错误信息})
+    """
+    package_cache = PackageCache()
+    paths = {}
+    errors = {}
+    pending = []
+    for entry in packages:
+        cached = package_cache.lookup(entry["name"], entry["version"])
+        if cached is not None and cached.stem == entry["sha256"]:
+            paths[entry["name"]] = cached
+        else:
+            pending.append((entry, package_cache.versions(entry["name"])))
+    if not pending:
+        return paths, errors
+
+    with concurrent_futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(pending)))) as executor:
+        futures = {
+            executor.submit(fetch_package, BASE_URL, entry["name"], entry["version"], bases=bases, dest_dir=dest_dir): entry
+            for entry, bases in pending
+        }
+        for future in concurrent_futures.as_completed(futures):
+            entry = futures[future]
+            try:
+                status_code = future.result()
+            except (requests.exceptions.RequestException, OSError) as e:
+                errors[entry["name"]] = f"下载失败：{e}"
+                continue
+            if status_code != 200:
+                errors[entry["name"]] = f"下载失败（HTTP {status_code}）"
+                continue
+            cpack_path = Path(dest_dir) / f"{entry['name']}-{entry['version']}.cpack"
+            sha256 = file_sha256(cpack_path)
+            if sha256 != entry["sha256"]:
+                errors[entry["name"]] = f"SHA-256 不匹配：锁文件为 {entry['sha256']}，下载的文件为 {sha256}"
+                continue
+            # 已经选定的缓存文件在安装前不能被淘汰；新下载的包超出缓存上限时直接使用临时目录中的文件
+            keep = {path.stem for path in paths.values() if path.parent.parent == package_cache.objects_dir}
+            paths[entry["name"]] = package_cache.add(entry["name"], entry["version"], cpack_path, sha256, keep) or cpack_path
+    return paths, errors
+
+@cli.command()
+@click.argument("lockfile", default=LOCKFILE_NAME, type=click.Path(exists=True, dir_okay=False))
+@click.option("-p", "--python", "python_dir", type=click.Path(exists=True, file_okay=False), default=None, help="目标 Python 安装目录，不指定时自动查找")
+@click.option("-j", "--jobs", type=int, default=DOWNLOAD_JOBS, show_default=True, help="并发下载和安装数")
+@click.option("--keep-extra", is_flag=True, help="保留锁文件中没有的、通过 cip 安装的包")
+@click.option("--verify", is_flag=True, help="同时检查已安装文件是否缺失或大小被改动，有问题的包重新安装")
+@click.option("--dry-run", is_flag=True, help="只显示需要做的改动，不实际执行")
+def sync(lockfile, python_dir, jobs, keep_extra, verify, dry_run):
+    """ 按锁文件同步目标 Python 环境：只安装缺少或变化的包，删除多余的包 """
+    try:
+        locked = read_lockfile(lockfile)
+        if python_dir is None:
+            python_dir = require_python_path()
+    except (OSError, ValueError) as e:
+        click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+        sys.exit(1)
+
+    registry = open_registry(python_dir, readonly=True)
+    try:
+        installed = {package["name"]: package for package in registry.packages()}
+        to_install = []
+        for name, entry in sorted(locked.items()):
+            current = installed.get(name)
+            if current is None or current["version"] != entry["version"] or current["archive_sha256"] != entry["sha256"]:
+                to_install.append(entry)
+            elif verify:
+                files = registry.files(name)
+                for path, info in files.items():
+                    file = registry.site_packages_dir / path
+                    if not file.is_file() or file.stat().st_size != info["size"]:
+                        to_install.append(entry)
+                        break
+        to_remove = [] if keep_extra else sorted(name for name in installed if name not in locked)
+
+        unchanged = len(locked) - len(to_install)
+        click.echo(f"安装/更新 {len(to_install)} 个，删除 {len(to_remove)} 个，未变化 {unchanged} 个")
+        for entry in to_install:
+            current = installed.get(entry["name"])
+            click.echo(f"  + {entry['name']} {entry['version']}" + (f"（当前 {current['version']}）" if current else ""))
+        for name in to_remove:
+            click.echo(f"  - {name} {installed[name]['version']}")
+        if dry_run or (not to_install and not to_remove):
+            return
+    finally:
+        registry.close()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 先下载并校验全部需要安装的包，有任何失败时不改动环境，避免删掉多余的包后却装不上新包
+        paths, errors = fetch_locked(to_install, tmp_dir, jobs)
+        if errors:
+            for name, error in sorted(errors.items()):
+                click.echo(f"{RED}{BOLD}ERROR:{WHITE} {name}: {error}", err=True)
+            click.echo("部分包下载失败，未对环境做任何改动。", err=True)
+            sys.exit(1)
+
+        registry = open_registry(python_dir)
+        try:
+            for name in to_remove:
+                remove_installed_files(registry.site_packages_dir, registry.files(name))
+                registry.remove(name)
+        finally:
+            registry.close()
+
+        if paths:
+            try:
+                failures = CPackTool.install_cpacks([paths[name] for name in sorted(paths)], python_dir=python_dir, assume_yes=True, jobs=jobs)
+            except Exception as e:
+                click.echo(f"{RED}{BOLD}ERROR:{WHITE} {e}", err=True)
+                sys.exit(1)
+            if failures:
+                sys.exit(1)
+
+@cli.group()
+def cache():
+    """ 管理本地包缓存 """
+    pass
+
+@cache.command()
+def stats():
+    """ 显示缓存使用情况 """
+    info = PackageCache().stats()
+    click.echo(f"缓存目录: {CACHE_DIR}")
+    click.echo(f"缓存的包: {info['packages']} 个（{info['objects']} 个文件）")
+    click.echo(f"已用空间: {info['size'] / 1024 / 1024:.1f} MB / {info['max_size'] / 1024 / 1024:.1f} MB")
+
+@cache.command()
+@click.option("--max-size", type=float, default=None, help="清理到指定大小（MB），默认使用配置项 cache_size_mb")
+@click.option("--all", "clear_all", is_flag=True, help="清空全部缓存")
+def prune(max_size, clear_all):
+    """ 按最近使用时间清理缓存 """
+    package_cache = PackageCache()
+    if clear_all:
+        max_size = 0
+    removed, freed = package_cache.prune(None if max_size is None else int(max_size * 1024 * 1024))
+    click.echo(f"已清理 {removed} 个缓存文件，释放 {freed / 1024 / 1024:.1f} MB。")
+
+@cli.group()
+def store():
+    """ 管理已解压包仓库（~/.cip/store） """
+    pass
+
+@store.command("stats")
+def store_stats():
+    """ 显示仓库使用情况 """
+    package_store = PackageStore()
+    info = package_store.stats()
+    click.echo(f"仓库目录: {package_store.root}（安装方式: {package_store.mode}）")
+    click.echo(f"保存的包: {info['entries']} 个，其中 {info['in_use']} 个正被链接使用")
+    click.echo(f"文件: {info['files']} 个，共 {info['size'] / 1024 / 1024:.1f} MB")
+
+@store.command("prune")
+def store_prune():
+    """ 删除没有被任何 Python 环境链接的包 """
+    removed, freed = PackageStore().prune()
+    click.echo(f"已删除 {removed} 个包，释放 {freed / 1024 / 1024:.1f} MB。")
+
 @cli.command()
 def reset():
     """ 重置 cip 配置 """
-    config_path = Path("~/.cip/config.ini").expanduser()
-    if config_path.exists():
-        os.remove(config_path)
+    if cip_config.exists():
+        os.remove(CONFIG_PATH)
         setup_config()
         click.echo("已重置 cip 配置。")
     else:
         click.echo("ERROR: 配置文件不存在。")
 
 if __name__ == "__main__":
+    # 打包成可执行文件后，多进程压缩需要此调用
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
 
     setup_config()
-    config = configparser.ConfigParser()
-    config_path = Path("~/.cip/config.ini").expanduser()
     BASE_URL = get_config("web_url")
     print(BASE_URL)
     #print(BASE_URL)
@@ -1,73 +1,1267 @@
 # 服务端代码，依赖flask库，用于接收上传的文件，并提供下载接口，你可以用它进行私有化部署，防止内部代码泄露。
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, request, jsonify, send_file, g
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+import io
 import os
+import tempfile
+import json
+import time
+import base64
+import sqlite3
+import hashlib
+import hmac
+import struct
+import zipfile
+import bisect
+import shutil
+import threading
+import urllib.request
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+
+
+class HashingFile:
+    """
+    上传文件的落盘容器：写入上传目录中的临时文件，同时增量计算 SHA-256
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """
+    上传的文件直接流式写入上传目录下的临时文件，不在内存中缓冲，也不需要再复制一次
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        container = HashingFile(UPLOAD_FOLDER)
+        self.__dict__.setdefault('upload_files', []).append(container)
+        return container
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # 定义上传目录
 UPLOAD_FOLDER = './uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# 加载已有包列表
-packages = {}
-for file in os.listdir(UPLOAD_FOLDER):
-    if os.path.isfile(os.path.join(UPLOAD_FOLDER, file)):
-        # 假设文件名格式为 "package_name-version.cpack"
+# 包索引数据库（SQLite，WAL 模式，可被多个工作进程共享）
+INDEX_DB = './cip_index.db'
+
+# 包列表分页大小
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# /cip/metrics 中延迟直方图各个桶的上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 版本间的增量包目录，文件名为 <旧版本 SHA-256>-<新版本 SHA-256>.cdelta
+DELTA_FOLDER = './deltas'
+os.makedirs(DELTA_FOLDER, exist_ok=True)
+# 增量包格式：魔数 + 4 字节清单长度 + JSON 清单 + 按顺序拼接的新增数据
+DELTA_MAGIC = b'CIPDELTA1\n'
+# 小于这个大小的成员直接放进增量包，不值得单独记录一次复制
+DELTA_MIN_COPY = 256
+
+# 镜像模式：轮询上游变更日志的默认间隔（秒）和请求超时（秒）
+MIRROR_INTERVAL = 2.0
+MIRROR_TIMEOUT = 60
+
+# 块存储目录：上传的包按内容切分成块，以 SHA-256 命名保存在 chunks/<前两位>/<SHA-256>，
+# 每个版本在索引中只记录自己的块清单，内容相同的块在所有版本之间只存一份
+CHUNK_FOLDER = './chunks'
+os.makedirs(CHUNK_FOLDER, exist_ok=True)
+# 块的最小和最大大小；块只在 pack.zip 成员的边界处切分，成员文件名哈希的低 3 位全为 0 时开始新块
+CHUNK_MIN_SIZE = 4 * 1024
+CHUNK_MAX_SIZE = 64 * 1024
+CHUNK_NAME_MASK = 0x7
+# 不再被引用的块先登记到 chunk_releases，超过这个时间（秒）后才真正删除，
+# 让已经开始的下载（按需打开块文件）和增量包生成能够读完
+CHUNK_GRACE_PERIOD = 3600
+
+# 删除接口的令牌，从环境变量 CIP_DELETE_TOKEN 读取；未设置时禁用 DELETE /cip/packages/<包名>/<版本>，
+# 设置后请求需要带上 Authorization: Bearer <令牌>
+DELETE_TOKEN = os.environ.get('CIP_DELETE_TOKEN', '')
+
+
+class Metrics:
+    """
+    进程内的请求统计：按路由记录请求数、状态码、发送的字节数和延迟直方图
+    使用多个工作进程部署时，每个进程分别统计，/cip/metrics 返回处理该请求的进程的数据
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.routes = {}
+
+    def record(self, method, route, status, bytes_sent, seconds):
+        with self._lock:
+            entry = self.routes.get((method, route))
+            if entry is None:
+                entry = self.routes[(method, route)] = {
+                    'requests': 0,
+                    'status': {},
+                    'bytes_sent': 0,
+                    'latency_sum': 0.0,
+                    'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            entry['requests'] += 1
+            entry['status'][str(status)] = entry['status'].get(str(status), 0) + 1
+            entry['bytes_sent'] += bytes_sent
+            entry['latency_sum'] += seconds
+            entry['latency_buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: json.loads(json.dumps(entry)) for key, entry in self.routes.items()}
+
+
+metrics = Metrics()
+
+
+def is_safe_filename(filename):
+    """
+    检查文件名能否安全地用于拼接本地路径：不能包含路径分隔符、".." 和控制字符（包括 NUL）
+    与 werkzeug 的 secure_filename 不同，中文等非 ASCII 字符原样保留
+    :return: 文件名安全时返回 True
+    """
+    if not filename or '..' in filename:
+        return False
+    return not any(char in '/\\' or ord(char) < 32 for char in filename)
+
+
+def parse_package_filename(filename):
+    """
+    从 "package_name-version.cpack" 格式的文件名中解析包名和版本
+    :return: (包名, 版本)，格式不符合时返回 None
+    """
+    if not filename.endswith('.cpack'):
+        return None
+    stem = filename[:-len('.cpack')]
+    if '-' not in stem:
+        return None
+    package_name, version = stem.rsplit('-', 1)
+    if not package_name or not version:
+        return None
+    return package_name, version
+
+
+def file_sha256(path):
+    """
+    计算文件的 SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def zip_data_offset(f, header_offset):
+    """
+    读取 zip 本地文件头，返回成员数据在文件中的起始偏移
+    """
+    f.seek(header_offset)
+    header = f.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile('本地文件头损坏')
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return header_offset + 30 + name_length + extra_length
+
+
+def pack_members(raw):
+    """
+    读取 .cpack 内层 pack.zip 的成员列表
+    :param raw: 以二进制模式打开、可 seek 的 .cpack 文件
+    :return: (pack.zip 在 .cpack 中的起始偏移, 内层中央目录的起始偏移, 成员列表)；pack.zip 本身被压缩时返回 None
+    """
+    with zipfile.ZipFile(raw) as outer:
+        info = outer.getinfo('pack.zip')
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+        start = zip_data_offset(raw, info.header_offset)
+        with outer.open(info) as packed, zipfile.ZipFile(packed) as inner:
+            return start, inner.start_dir, inner.infolist()
+
+
+def member_layout(raw):
+    """
+    定位 .cpack 内层 pack.zip 中每个成员的压缩数据在 .cpack 文件中的位置
+    :param raw: 以二进制模式打开、可 seek 的 .cpack 文件
+    :return: {(文件名, CRC, 压缩大小, 压缩方法): (偏移, 大小)}；pack.zip 本身被压缩时无法定位，返回 None
+    """
+    members = pack_members(raw)
+    if members is None:
+        return None
+    start, _, infos = members
+    layout = {}
+    for member in infos:
+        if member.compress_size < DELTA_MIN_COPY:
+            continue
+        offset = zip_data_offset(raw, start + member.header_offset)
+        key = (member.filename, member.CRC, member.compress_size, member.compress_type)
+        layout[key] = (offset, member.compress_size)
+    return layout
+
+
+def same_bytes(f1, offset1, f2, offset2, size):
+    f1.seek(offset1)
+    f2.seek(offset2)
+    while size > 0:
+        chunk = min(size, 1024 * 1024)
+        if f1.read(chunk) != f2.read(chunk):
+            return False
+        size -= chunk
+    return True
+
+
+def build_delta(base_row, target_row, delta_path):
+    """
+    生成从旧版本到新版本的增量包
+    内容没有变化的 pack.zip 成员记录为从旧版本复制，其余字节（变化的成员、文件头、目录）原样放进增量包
+    :return: 是否生成成功
+    """
+    db = get_db()
+    base = open_archive(db, base_row['filename'])
+    target = open_archive(db, target_row['filename'])
+    if base is None or target is None:
+        return False
+
+    ops = []
+    literals = []
+    position = 0
+    with base, target:
+        base_layout = member_layout(base)
+        target_layout = member_layout(target)
+        if base_layout is None or target_layout is None:
+            return False
+        for key, (offset, size) in sorted(target_layout.items(), key=lambda item: item[1][0]):
+            # CRC 和大小相同还不能保证压缩后的字节相同（压缩级别可能不同），逐字节确认
+            if key not in base_layout or not same_bytes(base, base_layout[key][0], target, offset, size):
+                continue
+            if offset > position:
+                ops.append(['data', offset - position])
+                literals.append((position, offset - position))
+            ops.append(['copy', base_layout[key][0], size])
+            position = offset + size
+        end = target_row['size']
+        if end > position:
+            ops.append(['data', end - position])
+            literals.append((position, end - position))
+
+        manifest = json.dumps({
+            'name': target_row['name'],
+            'from_version': base_row['version'],
+            'to_version': target_row['version'],
+            'base_sha256': base_row['sha256'],
+            'target_sha256': target_row['sha256'],
+            'target_size': target_row['size'],
+            'ops': ops,
+        }).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(prefix='.delta-', suffix='.tmp', dir=DELTA_FOLDER)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(DELTA_MAGIC + struct.pack('<I', len(manifest)) + manifest)
+                for offset, size in literals:
+                    target.seek(offset)
+                    while size > 0:
+                        chunk = target.read(min(size, 1024 * 1024))
+                        out.write(chunk)
+                        size -= len(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, delta_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return True
+
+
+def delta_hashes(delta_path):
+    """
+    读取增量包清单中记录的旧版本和新版本的 SHA-256
+    :return: (旧版本 SHA-256, 新版本 SHA-256)，文件不存在或格式不对时返回 None
+    """
+    try:
+        with open(delta_path, 'rb') as f:
+            if f.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+                return None
+            size, = struct.unpack('<I', f.read(4))
+            manifest = json.loads(f.read(size))
+        return manifest['base_sha256'], manifest['target_sha256']
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+
+def get_delta(base_row, target_row):
+    """
+    获取（必要时生成并缓存）增量包；缓存的增量包按清单中记录的两个 SHA-256 校验，不一致时重新生成
+    :return: 增量包路径，无法生成时返回 None
+    """
+    delta_path = os.path.join(DELTA_FOLDER, f"{base_row['sha256']}-{target_row['sha256']}.cdelta")
+    if delta_hashes(delta_path) == (base_row['sha256'], target_row['sha256']):
+        return delta_path
+    if build_delta(base_row, target_row, delta_path):
+        return delta_path
+    return None
+
+
+def remove_stale_deltas(db):
+    """
+    删除涉及已经不存在的内容（版本被删除或被覆盖上传）的增量包
+    :return: 删除的文件数
+    """
+    live = {row['sha256'] for row in db.execute('SELECT sha256 FROM packages')}
+    removed = 0
+    for entry in os.scandir(DELTA_FOLDER):
+        if not entry.name.endswith('.cdelta'):
+            continue
+        base_sha256, _, target_sha256 = entry.name[:-len('.cdelta')].partition('-')
+        if base_sha256 in live and target_sha256 in live:
+            continue
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def chunk_spans(f, size):
+    """
+    把 .cpack 切分成由内容决定边界的块
+    块只在 pack.zip 成员的边界处切分，是否在某个成员之前切分由它的文件名决定（另有最小、最大块大小的限制），
+    所以修改、增删一个文件只影响它所在的块，文件头中的修改时间变化也不会波及其他成员；
+    超过最大块大小的成员单独成块，内层中央目录和外层的文件尾另外成块。
+    无法解析结构时整个文件按固定大小切分：这种文件整体是一段压缩数据，按内容切分也找不到重复。
+    :return: [(偏移, 大小)]
+    """
+    try:
+        members = pack_members(f)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        members = None
+    cuts = [0]
+
+    def cut(offset):
+        while offset - cuts[-1] > CHUNK_MAX_SIZE:
+            cuts.append(cuts[-1] + CHUNK_MAX_SIZE)
+        if offset > cuts[-1]:
+            cuts.append(offset)
+
+    if members is not None:
+        start, start_dir, infos = members
+        # 外层 pack.zip 的文件头记录了整个 pack.zip 的 CRC，每个版本都不同，单独成块
+        cut(start)
+        offsets = sorted((start + member.header_offset, member.filename) for member in infos)
+        ends = [offset for offset, _ in offsets[1:]] + [start + start_dir]
+        large = False
+        for (offset, name), end in zip(offsets, ends):
+            name_hash = int.from_bytes(hashlib.sha256(name.encode('utf-8')).digest()[:4], 'little')
+            if large or end - offset > CHUNK_MAX_SIZE or (
+                    offset - cuts[-1] >= CHUNK_MIN_SIZE and not name_hash & CHUNK_NAME_MASK):
+                cut(offset)
+            large = end - offset > CHUNK_MAX_SIZE
+        cut(start + start_dir)
+    cut(size)
+    return [(offset, end - offset) for offset, end in zip(cuts, cuts[1:])]
+
+
+def chunk_path(sha256):
+    return os.path.join(CHUNK_FOLDER, sha256[:2], sha256)
+
+
+def write_chunk(sha256, data):
+    """
+    原子地写入一个块，已存在时跳过
+    """
+    path = chunk_path(sha256)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.chunk-', suffix='.tmp', dir=CHUNK_FOLDER)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def store_chunks(path, size):
+    """
+    切分归档并写入块目录，只写入尚不存在的块；在索引事务之外调用，不阻塞其他写入
+    :return: 块清单 [(偏移, 大小, SHA-256)]
+    """
+    chunks = []
+    with open(path, 'rb') as f:
+        for offset, length in chunk_spans(f, size):
+            f.seek(offset)
+            data = f.read(length)
+            sha256 = hashlib.sha256(data).hexdigest()
+            write_chunk(sha256, data)
+            chunks.append((offset, length, sha256))
+    return chunks
+
+
+def save_manifest(db, filename, path, chunks):
+    """
+    在写事务中登记归档的块清单，替换同名归档的旧清单
+    store_chunks 之后、事务开始之前，并发的回收可能刚删掉了被复用的块，这里补写缺失的块
+    :return: 旧清单引用过的块 {SHA-256: 大小}，提交前交给 release_chunks 回收
+    """
+    with open(path, 'rb') as f:
+        for offset, length, sha256 in chunks:
+            if not os.path.exists(chunk_path(sha256)):
+                f.seek(offset)
+                write_chunk(sha256, f.read(length))
+    old = drop_manifest(db, filename)
+    db.executemany('INSERT INTO manifests VALUES (?, ?, ?, ?)',
+                   [(filename, offset, length, sha256) for offset, length, sha256 in chunks])
+    return old
+
+
+def drop_manifest(db, filename):
+    """
+    删除归档的块清单
+    :return: 清单引用过的块 {SHA-256: 大小}
+    """
+    old = {row['chunk']: row['size'] for row in db.execute('SELECT chunk, size FROM manifests WHERE filename = ?', (filename,))}
+    db.execute('DELETE FROM manifests WHERE filename = ?', (filename,))
+    return old
+
+
+def release_chunks(db, chunks):
+    """
+    登记已经没有任何清单引用的块，等待 sweep_chunks 在宽限期之后删除
+    正在进行的下载可能还会打开这些块，所以不立即删除；需要在写事务的最后、提交之前调用
+    :return: (登记的块数, 这些块的字节数)
+    """
+    count = freed = 0
+    now = time.time()
+    for sha256, size in chunks.items():
+        if db.execute('SELECT 1 FROM manifests WHERE chunk = ? LIMIT 1', (sha256,)).fetchone() is None:
+            db.execute('INSERT OR REPLACE INTO chunk_releases VALUES (?, ?, ?)', (sha256, size, now))
+            count += 1
+            freed += size
+    return count, freed
+
+
+def sweep_chunks(conn, grace=CHUNK_GRACE_PERIOD):
+    """
+    删除登记超过宽限期、且仍然没有被任何清单引用的块；期间又被新上传引用的块只去掉登记
+    在写事务中检查引用并删除文件，持有写锁期间不会有新的清单引用这些块
+    :return: (删除的块数, 释放的字节数)
+    """
+    deadline = time.time() - grace
+    if conn.execute('SELECT 1 FROM chunk_releases WHERE released_at <= ? LIMIT 1', (deadline,)).fetchone() is None:
+        return 0, 0
+    count = freed = 0
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('SELECT chunk, size FROM chunk_releases WHERE released_at <= ?', (deadline,)).fetchall()
+        for row in rows:
+            conn.execute('DELETE FROM chunk_releases WHERE chunk = ?', (row['chunk'],))
+            if conn.execute('SELECT 1 FROM manifests WHERE chunk = ? LIMIT 1', (row['chunk'],)).fetchone() is not None:
+                continue
+            try:
+                os.remove(chunk_path(row['chunk']))
+            except FileNotFoundError:
+                continue
+            count += 1
+            freed += row['size']
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count, freed
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    把块清单按顺序拼接成一个只读、可 seek 的文件，按需打开块文件；
+    下载时据此流式发送并支持 Range 请求，生成增量包时 zipfile 也可以直接随机读取
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._offsets = [offset for offset, _, _ in chunks]
+        self.size = chunks[-1][0] + chunks[-1][1] if chunks else 0
+        self._position = 0
+        self._index = None
+        self._file = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        index = bisect.bisect_right(self._offsets, self._position) - 1
+        offset, size, sha256 = self._chunks[index]
+        if index != self._index:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(chunk_path(sha256), 'rb')
+            self._index = index
+        self._file.seek(self._position - offset)
+        count = self._file.readinto(memoryview(buffer)[:offset + size - self._position])
+        if not count:
+            raise OSError(f'块 {sha256} 已损坏')
+        self._position += count
+        return count
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def open_archive(db, filename):
+    """
+    打开一个已上传的归档
+    :return: 可 seek 的二进制文件；尚未切分成块的旧文件直接打开，文件不存在时返回 None
+    """
+    chunks = [tuple(row) for row in db.execute(
+        'SELECT offset, size, chunk FROM manifests WHERE filename = ? ORDER BY offset', (filename,)
+    )]
+    if chunks:
+        return io.BufferedReader(ChunkReader(chunks), CHUNK_MAX_SIZE)
+    path = os.path.join(UPLOAD_FOLDER, filename)
+    if os.path.exists(path):
+        return open(path, 'rb')
+    return None
+
+
+def connect_db():
+    conn = sqlite3.connect(INDEX_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_db():
+    """
+    获取当前请求使用的数据库连接
+    """
+    if 'db' not in g:
+        g.db = connect_db()
+    return g.db
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_metrics(response):
+    # 对 send_file 返回的文件流，这里统计的是到开始发送为止的延迟，字节数为响应的 Content-Length
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    started = g.get('request_started', time.perf_counter())
+    bytes_sent = 0 if response.status_code == 304 or request.method == 'HEAD' else response.content_length or 0
+    metrics.record(request.method, route, response.status_code, bytes_sent, time.perf_counter() - started)
+    return response
+
+
+@app.teardown_request
+def discard_uploads(exception):
+    # 未被提交（os.replace）的临时文件在请求结束时删除，包括客户端中途断开的情况
+    for container in request.__dict__.get('upload_files', []):
+        container.discard()
+
+
+@app.teardown_appcontext
+def close_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+
+def bump_generation(conn):
+    """
+    索引每次变化时递增代数，用作包列表的 ETag，需要在修改索引的同一事务中调用
+    """
+    conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+
+
+def record_change(conn, action, name, version, filename=None, size=None, sha256=None, uploaded_at=None):
+    """
+    追加一条变更日志，需要在修改索引的同一事务中调用
+    序号单调递增且不会复用，镜像记住处理到的序号，之后只拉取新的变更；
+    SQLite 同一时间只有一个写事务，序号按提交顺序可见，镜像不会漏掉还没提交的较小序号
+    :param action: upload 或 delete
+    """
+    conn.execute(
+        'INSERT INTO changes (action, name, version, filename, size, sha256, uploaded_at, changed_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (action, name, version, filename, size, sha256, uploaded_at, time.time()),
+    )
+
+
+def put_package(conn, name, version, filename, path, size, sha256, uploaded_at, chunks):
+    """
+    在写事务中登记一个版本的块清单、索引和变更日志，上传和镜像同步共用
+    :param path: 归档文件，块存储中缺失的块从这里补写
+    :param chunks: store_chunks 返回的块清单
+    :return: 旧内容引用过的块，提交前交给 release_chunks 回收
+    """
+    old_chunks = save_manifest(conn, filename, path, chunks)
+    conn.execute('INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?)', (name, version, filename, size, sha256, uploaded_at))
+    record_change(conn, 'upload', name, version, filename, size, sha256, uploaded_at)
+    bump_generation(conn)
+    return old_chunks
+
+
+def remove_package(conn, name, version):
+    """
+    在写事务中删除一个版本，删除操作和镜像同步共用
+    :return: (文件名, 该版本引用过的块)，提交前把块交给 release_chunks 回收；版本不存在时返回 None
+    """
+    row = conn.execute('SELECT filename FROM packages WHERE name = ? AND version = ?', (name, version)).fetchone()
+    if row is None:
+        return None
+    conn.execute('DELETE FROM packages WHERE name = ? AND version = ?', (name, version))
+    old_chunks = drop_manifest(conn, row['filename'])
+    record_change(conn, 'delete', name, version, row['filename'])
+    bump_generation(conn)
+    return row['filename'], old_chunks
+
+
+def remove_legacy_file(filename):
+    # 尚未转存到块存储的旧文件
+    path = os.path.join(UPLOAD_FOLDER, filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def index_etag(db):
+    generation = db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()['value']
+    return f'index-{generation}'
+
+
+def conditional_json(data, etag):
+    """
+    返回带强 ETag 的 JSON 响应；请求的 If-None-Match 匹配时返回 304 Not Modified
+    """
+    response = jsonify(data)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def init_db():
+    """
+    创建索引表；首次启动时把上传目录中已有的包导入索引，之后启动不再扫描目录；
+    上传目录中还没有切分成块的包在启动时转存到块存储，全部转存后不再检查；
+    多个工作进程同时启动时，每个宽限期内只有一个进程回收块
+    """
+    conn = connect_db()
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS packages (
+                    name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    filename TEXT NOT NULL UNIQUE,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    PRIMARY KEY (name, version)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS packages_latest ON packages (name, uploaded_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', '0')")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS manifests (
+                    filename TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    chunk TEXT NOT NULL,
+                    PRIMARY KEY (filename, offset)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS manifests_chunk ON manifests (chunk)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_releases (
+                    chunk TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    released_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    action TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    filename TEXT,
+                    size INTEGER,
+                    sha256 TEXT,
+                    uploaded_at REAL,
+                    changed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('swept_at', '0')")
+            imported = conn.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+        if imported is None:
+            # 兼容旧版本：导入上传目录中已有的文件
+            rows = []
+            for entry in os.scandir(UPLOAD_FOLDER):
+                parsed = parse_package_filename(entry.name)
+                if parsed is None or not entry.is_file():
+                    # 如果文件名格式不符合预期，跳过该文件
+                    continue
+                stat = entry.stat()
+                rows.append((parsed[0], parsed[1], entry.name, stat.st_size, file_sha256(entry.path), stat.st_mtime))
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO packages VALUES (?, ?, ?, ?, ?, ?)', rows)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('imported', '1')")
+                bump_generation(conn)
+        seed_changes(conn)
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is None:
+            migrate_uploads(conn)
+        now = time.time()
+        with conn:
+            claimed = conn.execute(
+                "UPDATE meta SET value = ? WHERE key = 'swept_at' AND CAST(value AS REAL) <= ?", (str(now), now - CHUNK_GRACE_PERIOD)
+            ).rowcount
+        if claimed:
+            sweep_chunks(conn)
+    finally:
+        conn.close()
+
+
+def seed_changes(conn):
+    """
+    变更日志启用之前已有的包在第一次启动时各补一条上传记录，镜像从序号 0 开始同步就能得到全部的包
+    """
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'changes_seeded'").fetchone() is None:
+            conn.execute(
+                "INSERT INTO changes (action, name, version, filename, size, sha256, uploaded_at, changed_at) "
+                "SELECT 'upload', name, version, filename, size, sha256, uploaded_at, ? FROM packages "
+                "ORDER BY uploaded_at, rowid",
+                (time.time(),),
+            )
+            conn.execute("INSERT INTO meta VALUES ('changes_seeded', '1')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def migrate_uploads(conn):
+    """
+    把上传目录中整个保存的旧包转存到块存储，转存成功后删除原文件；
+    每个包单独提交，中途退出时下次启动继续，多个工作进程同时启动也不会重复登记；
+    全部处理完后在 meta 中记录 migrated，新上传的包都直接保存为块，之后启动不再检查
+    """
+    rows = conn.execute(
+        'SELECT filename, size FROM packages WHERE filename NOT IN (SELECT filename FROM manifests)'
+    ).fetchall()
+    for row in rows:
+        path = os.path.join(UPLOAD_FOLDER, row['filename'])
+        try:
+            chunks = store_chunks(path, row['size'])
+        except FileNotFoundError:
+            continue
         try:
-            # 分割文件名
-            parts = file.split('-')
-            package_name = parts[0]
-            
-            # 存储完整的文件名
-            if package_name not in packages:
-                packages[package_name] = []
-            if file not in packages[package_name]:
-                packages[package_name].append(file)
-        except (ValueError, IndexError):
-            # 如果文件名格式不符合预期，跳过该文件
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM manifests WHERE filename = ? LIMIT 1', (row['filename'],)).fetchone() is None:
+                save_manifest(conn, row['filename'], path, chunks)
+            conn.commit()
+        except FileNotFoundError:
+            # 另一个工作进程已经转存并删除了这个文件
+            conn.rollback()
             continue
+        except Exception:
+            conn.rollback()
+            raise
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', '1')")
+
+
+init_db()
+
 
 @app.route('/cip/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
         return jsonify({'error': '没有文件上传'}), 400
-    
+
     file = request.files['file']
-    package_name = request.form.get('package_name')
-    package_version = request.form.get('package_version')
 
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
 
-    # 保存文件
-    file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(file_path)
+    # 以表单中的包名和版本为准，保存为客户端下载时使用的 包名-版本.cpack；
+    # 没有提供表单字段的旧客户端从文件名中解析
+    package_name = request.form.get('package_name')
+    package_version = request.form.get('package_version')
+    if not package_name or not package_version:
+        parsed = parse_package_filename(file.filename)
+        if parsed is None:
+            return jsonify({'error': '缺少 package_name 和 package_version，文件名格式也不是 包名-版本.cpack'}), 400
+        package_name, package_version = parsed
+    filename = f'{package_name}-{package_version}.cpack'
+    if not is_safe_filename(filename):
+        return jsonify({'error': '包名和版本不能包含路径分隔符、".." 或控制字符'}), 400
+
+    # 文件已在解析请求时写入临时文件并算好哈希，客户端提供了哈希时进行校验
+    container = file.stream
+    container.flush()
+    sha256 = container.hexdigest()
+    expected = request.headers.get('X-Content-SHA256')
+    if expected and expected.lower() != sha256:
+        return jsonify({'error': f'文件校验失败：SHA-256 应为 {expected}，实际为 {sha256}'}), 400
+    container.close()
 
-    # 更新包列表
-    if package_name not in packages:
-        packages[package_name] = []
-    if file.filename not in packages[package_name]:
-        packages[package_name].append(file.filename)
+    # 先在事务之外切分并写入新的块，再在索引的写事务中登记块清单，保证并发上传时块、清单与索引一致；
+    # 临时文件在请求结束时删除
+    chunks = store_chunks(container.path, container.size)
+    db = get_db()
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        old_chunks = put_package(db, package_name, package_version, filename, container.path, container.size, sha256,
+                                 time.time(), chunks)
+        # 覆盖上传同一版本时，回收旧内容中不再使用的块
+        release_chunks(db, old_chunks)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if old_chunks:
+        # 覆盖上传时旧内容的增量包不再有用
+        remove_stale_deltas(db)
+    sweep_chunks(db)
+
+    # 预先生成相对上一个版本的增量包，失败不影响上传结果，下载时还会按需重试
+    rows = db.execute(
+        'SELECT * FROM packages WHERE name = ? ORDER BY uploaded_at DESC, rowid DESC LIMIT 2', (package_name,)
+    ).fetchall()
+    if len(rows) == 2 and rows[0]['version'] == package_version:
+        try:
+            get_delta(rows[1], rows[0])
+        except Exception:
+            app.logger.exception('生成增量包失败')
 
     return jsonify({'message': '文件上传成功'}), 200
 
 @app.route('/download/<package_name>/<version>/<filename>', methods=['GET'])
 def download_file(package_name, version, filename):
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    if os.path.exists(file_path):
-        if version == filename.split('-')[1].split('.cpack')[0]:
-            if package_name == filename.split('-')[0]:
-                return send_file(file_path, as_attachment=True)
-            else:
-                return jsonify({'error': '文件不存在'}), 400
-        else:
-            return jsonify({'error': '文件不存在'}), 400
-    else:
+    db = get_db()
+    row = db.execute(
+        'SELECT filename, size, sha256, uploaded_at FROM packages WHERE name = ? AND version = ?', (package_name, version)
+    ).fetchone()
+    if row is None:
+        return jsonify({'error': '文件不存在'}), 404
+    if row['filename'] != filename:
+        return jsonify({'error': '文件不存在'}), 400
+    archive = open_archive(db, row['filename'])
+    if archive is None:
         return jsonify({'error': '文件不存在'}), 404
+    # 按块清单流式拼接出完整的包；支持 Range 请求，按需返回 206 Partial Content，便于客户端断点续传，
+    # 只会打开请求范围内的块；ETag 使用包的 SHA-256，客户端带 If-None-Match 重新验证时返回 304
+    response = send_file(archive, as_attachment=True, download_name=row['filename'], conditional=False, etag=False)
+    response.content_length = row['size']
+    response.last_modified = row['uploaded_at']
+    response.set_etag(row['sha256'])
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=row['size'])
+    except RequestedRangeNotSatisfiable:
+        archive.close()
+        raise
+
+
+@app.route('/cip/packages/<package_name>/<version>', methods=['DELETE'])
+def delete_package(package_name, version):
+    """
+    删除一个版本，同时回收只被这个版本使用的块；需要配置 CIP_DELETE_TOKEN 并在请求中带上令牌
+    """
+    if not DELETE_TOKEN:
+        return jsonify({'error': '服务端未启用删除接口'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {DELETE_TOKEN}'.encode()):
+        return jsonify({'error': '删除令牌无效'}), 401
+    db = get_db()
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        removed = remove_package(db, package_name, version)
+        if removed is None:
+            db.rollback()
+            return jsonify({'error': '文件不存在'}), 404
+        filename, old_chunks = removed
+        freed_chunks, freed_bytes = release_chunks(db, old_chunks)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    remove_legacy_file(filename)
+    remove_stale_deltas(db)
+    sweep_chunks(db)
+    # 释放的块在宽限期之后才会真正删除
+    return jsonify({'message': '删除成功', 'freed_chunks': freed_chunks, 'freed_bytes': freed_bytes}), 200
+
+@app.route('/cip/delta/<package_name>/<from_version>/<to_version>', methods=['GET'])
+def download_delta(package_name, from_version, to_version):
+    """
+    下载从 from_version 升级到 to_version 的增量包，客户端用本地的旧版本重建新版本
+    """
+    if from_version == to_version:
+        return jsonify({'error': '版本相同'}), 400
+    rows = {
+        row['version']: row for row in get_db().execute(
+            'SELECT * FROM packages WHERE name = ? AND version IN (?, ?)', (package_name, from_version, to_version)
+        )
+    }
+    if len(rows) != 2:
+        return jsonify({'error': '文件不存在'}), 404
+    delta_path = get_delta(rows[from_version], rows[to_version])
+    if delta_path is None or os.path.getsize(delta_path) >= rows[to_version]['size']:
+        return jsonify({'error': '该版本没有可用的增量包'}), 404
+    return send_file(
+        os.path.abspath(delta_path), as_attachment=True, conditional=True,
+        etag=os.path.basename(delta_path)[:-len('.cdelta')],
+        download_name=f'{package_name}-{from_version}-{to_version}.cdelta',
+    )
+
+def encode_cursor(name, version):
+    return base64.urlsafe_b64encode(json.dumps([name, version]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    name, version = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return str(name), str(version)
+
+
+def package_row(row):
+    return {
+        'name': row['name'],
+        'version': row['version'],
+        'filename': row['filename'],
+        'size': row['size'],
+        'sha256': row['sha256'],
+        'uploaded_at': row['uploaded_at'],
+    }
+
 
 @app.route('/cip/packages', methods=['GET'])
 def list_packages():
-    return jsonify(packages), 200
+    """
+    不带参数时返回 {包名: [文件名, ...]}（兼容旧客户端）
+    带参数时分页返回 {"packages": [...], "next_cursor": ...}，支持以下参数：
+    prefix: 包名前缀；search: 包名子串；latest=1: 每个包只返回最新上传的版本；
+    limit: 每页数量；cursor: 上一页返回的 next_cursor
+    """
+    db = get_db()
+    etag = index_etag(db)
+    if request.if_none_match.contains(etag):
+        return conditional_json({}, etag)
+    if not request.args:
+        packages = {}
+        for row in db.execute('SELECT name, filename FROM packages ORDER BY name, uploaded_at, rowid'):
+            packages.setdefault(row['name'], []).append(row['filename'])
+        return conditional_json(packages, etag)
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError):
+        return jsonify({'error': '无效的分页参数'}), 400
+
+    conditions = []
+    params = []
+    prefix = request.args.get('prefix')
+    if prefix:
+        # 用范围查询代替 LIKE，可以走主键索引
+        conditions.append('name >= ? AND name < ?')
+        params += [prefix, prefix + '\U0010ffff']
+    search = request.args.get('search')
+    if search:
+        conditions.append('instr(name, ?) > 0')
+        params.append(search)
+    if request.args.get('latest') in ('1', 'true', 'yes'):
+        conditions.append('rowid = (SELECT rowid FROM packages AS newer WHERE newer.name = packages.name '
+                          'ORDER BY uploaded_at DESC, rowid DESC LIMIT 1)')
+    if cursor is not None:
+        conditions.append('(name, version) > (?, ?)')
+        params += [cursor[0], cursor[1]]
+
+    sql = 'SELECT * FROM packages'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY name, version LIMIT ?'
+    rows = db.execute(sql, params + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['name'], rows[-1]['version'])
+    return conditional_json({'packages': [package_row(row) for row in rows], 'next_cursor': next_cursor}, etag)
+
+@app.route('/cip/packages/<package_name>', methods=['GET'])
+def get_package(package_name):
+    db = get_db()
+    etag = index_etag(db)
+    if request.if_none_match.contains(etag):
+        return conditional_json({}, etag)
+    rows = db.execute(
+        'SELECT * FROM packages WHERE name = ? ORDER BY uploaded_at, rowid', (package_name,)
+    ).fetchall()
+    if not rows:
+        return jsonify({'error': '包不存在'}), 404
+    versions = [package_row(row) for row in rows]
+    return conditional_json({'name': package_name, 'latest': versions[-1]['version'], 'versions': versions}, etag)
+
+@app.route('/cip/changes', methods=['GET'])
+def list_changes():
+    """
+    变更日志：按序号升序返回 since 之后的上传和删除记录，供镜像增量同步
+    参数 since: 上次处理到的序号，默认 0；limit: 每页数量
+    返回 {"changes": [...], "latest_seq": 当前最大序号}，本页最后一条的序号小于 latest_seq 时还有下一页
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': '无效的分页参数'}), 400
+    db = get_db()
+    rows = db.execute('SELECT * FROM changes WHERE seq > ? ORDER BY seq LIMIT ?', (since, limit)).fetchall()
+    latest_seq = db.execute('SELECT COALESCE(MAX(seq), 0) AS seq FROM changes').fetchone()['seq']
+    return jsonify({'changes': [dict(row) for row in rows], 'latest_seq': latest_seq})
+
+@app.route('/cip/metrics', methods=['GET'])
+def get_metrics():
+    """
+    请求统计。默认返回 JSON；format=prometheus 时返回 Prometheus 文本格式
+    """
+    routes = metrics.snapshot()
+    if request.args.get('format') == 'prometheus':
+        lines = [
+            '# TYPE cip_requests_total counter',
+            '# TYPE cip_response_bytes_total counter',
+            '# TYPE cip_request_duration_seconds histogram',
+        ]
+        for (method, route), entry in sorted(routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for status, count in sorted(entry['status'].items()):
+                lines.append(f'cip_requests_total{{{labels},status="{status}"}} {count}')
+            lines.append(f'cip_response_bytes_total{{{labels}}} {entry["bytes_sent"]}')
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, '+Inf'], entry['latency_buckets']):
+                cumulative += count
+                lines.append(f'cip_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'cip_request_duration_seconds_sum{{{labels}}} {entry["latency_sum"]}')
+            lines.append(f'cip_request_duration_seconds_count{{{labels}}} {entry["requests"]}')
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+    return jsonify({
+        'pid': os.getpid(),
+        'uptime_seconds': time.time() - metrics.started_at,
+        'latency_buckets': [*LATENCY_BUCKETS, None],
+        'routes': [{'method': method, 'route': route, **entry} for (method, route), entry in sorted(routes.items())],
+    })
+
+def fetch_json(url):
+    with urllib.request.urlopen(url, timeout=MIRROR_TIMEOUT) as response:
+        return json.load(response)
+
+
+def fetch_archive(upstream, change):
+    """
+    从上游下载一个归档到上传目录的临时文件，边下载边计算 SHA-256，与变更日志中的大小和哈希核对后切分成块
+    :return: (临时文件路径, 块清单)
+    """
+    url = f"{upstream}/download/{quote(change['name'])}/{quote(change['version'])}/{quote(change['filename'])}"
+    container = HashingFile(UPLOAD_FOLDER)
+    try:
+        with urllib.request.urlopen(url, timeout=MIRROR_TIMEOUT) as response:
+            shutil.copyfileobj(response, container, 1024 * 1024)
+        container.close()
+        if container.size != change['size'] or container.hexdigest() != change['sha256']:
+            raise ValueError(f"{change['filename']} 校验失败：SHA-256 应为 {change['sha256']}，实际为 {container.hexdigest()}")
+        return container.path, store_chunks(container.path, container.size)
+    except BaseException:
+        container.discard()
+        raise
+
+
+class Mirror:
+    """
+    从上游服务端的变更日志增量同步：只拉取上次处理到的序号之后的变更，并发下载新的归档并校验，
+    每一页变更在一个事务中生效，同步中途失败时本地索引保持原样，下次从同一个序号重试
+    """
+
+    def __init__(self, upstream, jobs=4):
+        self.upstream = upstream.rstrip('/')
+        self.jobs = jobs
+        self.key = f'mirror:{self.upstream}'
+
+    def position(self, conn):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (self.key,)).fetchone()
+        return int(row['value']) if row else 0
+
+    def sync(self):
+        """
+        同步到上游的最新状态
+        :return: 生效的变更数
+        """
+        conn = connect_db()
+        try:
+            applied = 0
+            while True:
+                since = self.position(conn)
+                page = fetch_json(f'{self.upstream}/cip/changes?since={since}&limit={MAX_PAGE_SIZE}')
+                if page['latest_seq'] < since:
+                    # 上游的索引被重建过，序号从头开始，重新核对全部变更（内容未变的版本不会重复下载）
+                    click.echo(f'上游的变更序号 {page["latest_seq"]} 小于本地记录的 {since}，从头同步', err=True)
+                    with conn:
+                        conn.execute('DELETE FROM meta WHERE key = ?', (self.key,))
+                    continue
+                if not page['changes']:
+                    return applied
+                applied += self.apply(conn, page['changes'])
+                if page['changes'][-1]['seq'] >= page['latest_seq']:
+                    return applied
+        finally:
+            conn.close()
+
+    def apply(self, conn, changes):
+        """
+        应用一页变更：同一个版本只取最后一条，本地内容相同的版本跳过下载
+        """
+        latest = {}
+        for change in changes:
+            # 文件名会用来拼接本地路径，与包名、版本不对应的记录不予处理
+            filename = change['filename'] or ''
+            if not is_safe_filename(filename) or parse_package_filename(filename) != (change['name'], change['version']):
+                click.echo(f"跳过无效的变更记录 {change['seq']}: {filename!r}", err=True)
+                continue
+            latest[(change['name'], change['version'])] = change
+        local = {}
+        for name, version in latest:
+            row = conn.execute('SELECT sha256 FROM packages WHERE name = ? AND version = ?', (name, version)).fetchone()
+            local[(name, version)] = row['sha256'] if row else None
+        pending = [change for key, change in latest.items()
+                   if change['action'] == 'delete' and local[key] is not None
+                   or change['action'] == 'upload' and local[key] != change['sha256']]
+
+        # 退出 with 时全部下载都已结束，失败的下载已经删除了自己的临时文件
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {change['seq']: executor.submit(fetch_archive, self.upstream, change)
+                       for change in pending if change['action'] == 'upload'}
+        removed = []
+        old_chunks = {}
+        try:
+            fetched = {seq: future.result() for seq, future in futures.items()}
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for change in sorted(pending, key=lambda change: change['seq']):
+                    if change['action'] == 'upload':
+                        path, chunks = fetched[change['seq']]
+                        old_chunks.update(put_package(conn, change['name'], change['version'], change['filename'], path,
+                                                      change['size'], change['sha256'], change['uploaded_at'], chunks))
+                    else:
+                        result = remove_package(conn, change['name'], change['version'])
+                        if result is not None:
+                            removed.append(result[0])
+                            old_chunks.update(result[1])
+                conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (self.key, str(changes[-1]['seq'])))
+                release_chunks(conn, old_chunks)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            for future in futures.values():
+                if future.exception() is None:
+                    os.remove(future.result()[0])
+        for filename in removed:
+            remove_legacy_file(filename)
+        if removed or old_chunks:
+            remove_stale_deltas(conn)
+        sweep_chunks(conn)
+        return len(pending)
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def main(ctx):
+    """ cip 服务端，不带子命令时启动服务 """
+    if ctx.invoked_subcommand is None:
+        app.run(host='0.0.0.0', port=5000, debug=True)
+
+
+@main.command()
+@click.argument('upstream')
+@click.option('--interval', default=MIRROR_INTERVAL, show_default=True, help='两次同步之间的间隔（秒）')
+@click.option('-j', '--jobs', default=4, show_default=True, help='并发下载的归档数')
+@click.option('--once', is_flag=True, help='同步到上游的最新状态后退出')
+def mirror(upstream, interval, jobs, once):
+    """
+    作为镜像运行，持续从上游服务端增量同步包；可以和服务端进程在同一个运行目录中同时运行
+    """
+    mirror = Mirror(upstream, jobs)
+    while True:
+        try:
+            applied = mirror.sync()
+            if applied:
+                click.echo(f'{time.strftime("%Y-%m-%d %H:%M:%S")} 同步了 {applied} 个变更')
+        except Exception as e:
+            if once:
+                raise
+            click.echo(f'{time.strftime("%Y-%m-%d %H:%M:%S")} 同步失败: {e}', err=True)
+        if once:
+            return
+        time.sleep(interval)
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    main()